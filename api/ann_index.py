@@ -0,0 +1,350 @@
+import os
+import json
+import numpy as np
+from typing import List, Tuple, Optional, Dict, Any
+
+
+# 索引文件名
+INDEX_META_FILE = "index_meta.json"
+IVF_CENTROIDS_FILE = "ivf_centroids.npy"
+IVF_IDS_FILE = "ivf_ids.npy"
+IVF_OFFSETS_FILE = "ivf_offsets.npy"
+HNSW_INDEX_FILE = "hnsw.bin"
+
+# 默认检索参数：召回率/延迟的调节旋钮
+DEFAULT_NPROBE = int(os.getenv("EMBEDDING_NPROBE", "8"))
+DEFAULT_EF = int(os.getenv("EMBEDDING_HNSW_EF", "64"))
+
+# 打分时每次处理的行数，限制临时矩阵的内存
+_SCORE_BLOCK = 65536
+
+
+def _top_k_ids(scores: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    从候选集中选出分数最高的k个，按分数降序返回(ids, scores)
+    """
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    if k < scores.shape[0]:
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(scores.shape[0])
+    order = part[np.argsort(-scores[part], kind='stable')]
+    return ids[order], scores[order]
+
+
+def exact_search(vectors: np.ndarray, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    暴力检索，作为召回率评估的基准
+
+    Args:
+        vectors: 语料向量矩阵 (N, D)
+        queries: 查询向量矩阵 (Q, D)
+        k: 每条查询返回的数量
+
+    Returns:
+        与queries一一对应的(ids, scores)列表
+    """
+    scores = np.asarray(queries, dtype=vectors.dtype) @ vectors.T
+    all_ids = np.arange(vectors.shape[0])
+    return [_top_k_ids(row, all_ids, k) for row in scores]
+
+
+def _kmeans(vectors: np.ndarray, nlist: int, n_iter: int = 20,
+            seed: int = 0, max_train: Optional[int] = None) -> np.ndarray:
+    """
+    球面k-means（内积相似度），返回归一化的聚类中心
+
+    Args:
+        vectors: 训练向量 (N, D)
+        nlist: 聚类中心数量
+        n_iter: 迭代次数
+        seed: 随机种子
+        max_train: 训练样本上限，超出时随机采样
+    """
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    max_train = max_train or nlist * 256
+    if n > max_train:
+        train = np.asarray(vectors[np.sort(rng.choice(n, max_train, replace=False))], dtype=np.float32)
+    else:
+        train = np.asarray(vectors, dtype=np.float32)
+
+    centroids = train[rng.choice(train.shape[0], nlist, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _assign(train, centroids)
+        new_centroids = np.zeros_like(centroids)
+        np.add.at(new_centroids, assign, train)
+        counts = np.bincount(assign, minlength=nlist)
+
+        # 空聚类用随机样本重新初始化
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            new_centroids[empty] = train[rng.choice(train.shape[0], empty.size, replace=False)]
+
+        norms = np.linalg.norm(new_centroids, axis=1, keepdims=True)
+        centroids = new_centroids / np.maximum(norms, 1e-12)
+    return centroids
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    将每个向量分配到内积最大的聚类中心，分块计算以限制内存
+    """
+    assign = np.empty(vectors.shape[0], dtype=np.int64)
+    for start in range(0, vectors.shape[0], _SCORE_BLOCK):
+        block = np.asarray(vectors[start:start + _SCORE_BLOCK], dtype=np.float32)
+        assign[start:start + _SCORE_BLOCK] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+class IVFFlatIndex:
+    """
+    倒排文件索引（IVF-flat）：用k-means粗量化器把语料分成nlist个桶，
+    检索时只对与查询最接近的nprobe个桶内的向量精确打分
+    """
+
+    kind = "ivf"
+
+    def __init__(self, centroids: np.ndarray, list_ids: np.ndarray, list_offsets: np.ndarray):
+        """
+        Args:
+            centroids: 聚类中心 (nlist, D)
+            list_ids: 按桶排列的向量行号
+            list_offsets: 第i个桶对应 list_ids[list_offsets[i]:list_offsets[i+1]]
+        """
+        self.centroids = centroids
+        self.list_ids = list_ids
+        self.list_offsets = list_offsets
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    @property
+    def count(self) -> int:
+        return int(self.list_ids.shape[0])
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, nlist: Optional[int] = None,
+              n_iter: int = 20, seed: int = 0) -> 'IVFFlatIndex':
+        """
+        在语料向量上训练粗量化器并建立倒排表
+
+        Args:
+            vectors: 语料向量矩阵 (N, D)
+            nlist: 桶数量，默认约为sqrt(N)
+            n_iter: k-means迭代次数
+            seed: 随机种子
+        """
+        n = vectors.shape[0]
+        if n == 0:
+            raise ValueError("无法为空语料建立索引")
+        nlist = nlist or int(np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+
+        centroids = _kmeans(vectors, nlist, n_iter=n_iter, seed=seed)
+        assign = _assign(vectors, centroids)
+
+        list_ids = np.argsort(assign, kind='stable').astype(np.int64)
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=nlist), out=list_offsets[1:])
+        return cls(centroids.astype(np.float32), list_ids, list_offsets)
+
+    def search(self, vectors: np.ndarray, queries: np.ndarray, k: int,
+               nprobe: Optional[int] = None, ef: Optional[int] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        近似检索
+
+        Args:
+            vectors: 建索引时使用的语料向量矩阵
+            queries: 查询向量矩阵 (Q, D)
+            k: 每条查询返回的数量
+            nprobe: 探查的桶数量，越大召回率越高、越慢
+            ef: HNSW参数，此处忽略
+
+        Returns:
+            与queries一一对应的(ids, scores)列表
+        """
+        nprobe = max(1, min(nprobe or DEFAULT_NPROBE, self.nlist))
+        queries = np.asarray(queries, dtype=np.float32)
+        centroid_scores = queries @ self.centroids.T
+
+        results = []
+        for query, row in zip(queries, centroid_scores):
+            if nprobe < self.nlist:
+                probe = np.argpartition(-row, nprobe - 1)[:nprobe]
+            else:
+                probe = np.arange(self.nlist)
+            candidates = np.concatenate([
+                self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probe
+            ])
+            candidates.sort()
+            scores = np.asarray(vectors[candidates] @ query.astype(vectors.dtype), dtype=np.float32)
+            results.append(_top_k_ids(scores, candidates, k))
+        return results
+
+    def save(self, output_dir: str) -> None:
+        np.save(os.path.join(output_dir, IVF_CENTROIDS_FILE), self.centroids)
+        np.save(os.path.join(output_dir, IVF_IDS_FILE), self.list_ids)
+        np.save(os.path.join(output_dir, IVF_OFFSETS_FILE), self.list_offsets)
+        _write_meta(output_dir, {"kind": self.kind, "count": self.count, "nlist": self.nlist})
+
+    @classmethod
+    def load(cls, input_dir: str, meta: Dict[str, Any]) -> 'IVFFlatIndex':
+        return cls(
+            np.load(os.path.join(input_dir, IVF_CENTROIDS_FILE)),
+            np.load(os.path.join(input_dir, IVF_IDS_FILE), mmap_mode='r'),
+            np.load(os.path.join(input_dir, IVF_OFFSETS_FILE)),
+        )
+
+
+class HNSWIndex:
+    """
+    基于hnswlib的HNSW图索引，需要安装可选依赖: pip install hnswlib
+    """
+
+    kind = "hnsw"
+
+    def __init__(self, index: Any, count: int):
+        self.index = index
+        self.count = count
+
+    @staticmethod
+    def _import_hnswlib():
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError("HNSW索引需要安装hnswlib: pip install hnswlib")
+        return hnswlib
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, m: int = 16, ef_construction: int = 200,
+              seed: int = 0) -> 'HNSWIndex':
+        """
+        Args:
+            vectors: 语料向量矩阵 (N, D)
+            m: 每个节点的最大连接数
+            ef_construction: 建图时的候选队列长度
+            seed: 随机种子
+        """
+        hnswlib = cls._import_hnswlib()
+        n, dim = vectors.shape
+        index = hnswlib.Index(space='ip', dim=dim)
+        index.init_index(max_elements=n, ef_construction=ef_construction, M=m, random_seed=seed)
+        index.add_items(np.asarray(vectors, dtype=np.float32), np.arange(n))
+        return cls(index, n)
+
+    def search(self, vectors: np.ndarray, queries: np.ndarray, k: int,
+               nprobe: Optional[int] = None, ef: Optional[int] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        近似检索，ef越大召回率越高、越慢；nprobe为IVF参数，此处忽略
+        """
+        k = min(k, self.count)
+        if k <= 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+        self.index.set_ef(max(ef or DEFAULT_EF, k))
+        labels, distances = self.index.knn_query(np.asarray(queries, dtype=np.float32), k=k)
+        # hnswlib的ip距离为 1 - 内积
+        return [(labels[i].astype(np.int64), (1.0 - distances[i]).astype(np.float32))
+                for i in range(labels.shape[0])]
+
+    def save(self, output_dir: str) -> None:
+        self.index.save_index(os.path.join(output_dir, HNSW_INDEX_FILE))
+        _write_meta(output_dir, {"kind": self.kind, "count": self.count, "dim": self.index.dim})
+
+    @classmethod
+    def load(cls, input_dir: str, meta: Dict[str, Any]) -> 'HNSWIndex':
+        hnswlib = cls._import_hnswlib()
+        index = hnswlib.Index(space='ip', dim=meta["dim"])
+        index.load_index(os.path.join(input_dir, HNSW_INDEX_FILE), max_elements=meta["count"])
+        return cls(index, meta["count"])
+
+
+INDEX_TYPES = {
+    IVFFlatIndex.kind: IVFFlatIndex,
+    HNSWIndex.kind: HNSWIndex,
+}
+
+
+def _write_meta(output_dir: str, meta: Dict[str, Any]) -> None:
+    with open(os.path.join(output_dir, INDEX_META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+
+def build_index(kind: str, vectors: np.ndarray, **params):
+    """
+    按类型建立索引
+
+    Args:
+        kind: 索引类型，'ivf' 或 'hnsw'
+        vectors: 语料向量矩阵
+        **params: 传给对应索引build方法的参数
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"未知的索引类型 '{kind}'，可选: {list(INDEX_TYPES.keys())}")
+    return INDEX_TYPES[kind].build(vectors, **params)
+
+
+def remove_index(directory: str) -> None:
+    """
+    删除目录中已保存的索引文件
+    """
+    for name in [INDEX_META_FILE, IVF_CENTROIDS_FILE, IVF_IDS_FILE, IVF_OFFSETS_FILE, HNSW_INDEX_FILE]:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_index(input_dir: str, count: int):
+    """
+    加载目录中保存的索引，不存在或与语料数量不一致（已过期）时返回None
+
+    Args:
+        input_dir: 索引所在目录
+        count: 当前语料中的向量数量
+    """
+    meta_path = os.path.join(input_dir, INDEX_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get("count") != count:
+        print(f"索引包含 {meta.get('count')} 个向量，与语料数量 {count} 不一致，忽略该索引")
+        return None
+    index_cls = INDEX_TYPES.get(meta.get("kind"))
+    if index_cls is None:
+        print(f"未知的索引类型: {meta.get('kind')}")
+        return None
+    try:
+        return index_cls.load(input_dir, meta)
+    except ImportError as e:
+        print(f"加载索引失败: {str(e)}")
+        return None
+
+
+def recall_at_k(index, vectors: np.ndarray, queries: np.ndarray, k: int = 10,
+                nprobe: Optional[int] = None, ef: Optional[int] = None) -> float:
+    """
+    计算近似检索相对暴力检索的recall@k
+
+    Args:
+        index: 近似索引
+        vectors: 语料向量矩阵
+        queries: 查询向量矩阵
+        k: 每条查询比较的结果数量
+        nprobe: IVF探查桶数量
+        ef: HNSW候选队列长度
+
+    Returns:
+        所有查询的平均召回率
+    """
+    exact = exact_search(vectors, queries, k)
+    approx = index.search(vectors, queries, k, nprobe=nprobe, ef=ef)
+    hits = 0
+    total = 0
+    for (exact_ids, _), (approx_ids, _) in zip(exact, approx):
+        hits += len(np.intersect1d(exact_ids, approx_ids))
+        total += len(exact_ids)
+    return hits / total if total else 1.0
@@ -0,0 +1,192 @@
+import os
+import re
+import json
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# 上下文窗口配置，可通过环境变量调整
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "32000"))  # 每次请求发送给模型的最大token数（含工具定义）
+CONTEXT_RESERVE_TOKENS = int(os.getenv("CONTEXT_RESERVE_TOKENS", "4096"))  # 为模型输出预留的token数
+TOOL_RESULT_MAX_TOKENS = int(os.getenv("TOOL_RESULT_MAX_TOKENS", "2000"))  # 单个工具结果的最大token数
+TOOL_RESULT_MAX_ITEMS = int(os.getenv("TOOL_RESULT_MAX_ITEMS", "20"))  # 工具结果JSON中每个列表/字典最多保留的条目数
+CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "500"))  # 被省略的早期对话的摘要长度上限
+
+# 每条消息的格式开销（角色、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    估算文本的token数，不依赖分词器
+
+    按DeepSeek官方的换算：1个中文字符约0.6个token，1个英文字符约0.3个token
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return math.ceil(cjk * 0.6 + (len(text) - cjk) * 0.3)
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """估算一条OpenAI格式消息的token数，包括工具调用参数"""
+    tokens = MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message.get("content"))
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function", {})
+        tokens += estimate_tokens(function.get("name")) + estimate_tokens(function.get("arguments"))
+    return tokens
+
+
+def tools_tokens(tools: Optional[List[Dict[str, Any]]]) -> int:
+    """估算工具定义占用的token数"""
+    return estimate_tokens(json.dumps(tools, ensure_ascii=False)) if tools else 0
+
+
+def _shrink(value: Any, max_items: int) -> Any:
+    """递归截短JSON中过长的列表和字典，并注明省略的条目数"""
+    if isinstance(value, list):
+        items = [_shrink(item, max_items) for item in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f"...省略 {len(value) - max_items} 项")
+        return items
+    if isinstance(value, dict):
+        entries = list(value.items())
+        shrunk = {key: _shrink(item, max_items) for key, item in entries[:max_items]}
+        if len(entries) > max_items:
+            shrunk["..."] = f"省略 {len(entries) - max_items} 项"
+        return shrunk
+    return value
+
+
+def compact_tool_result(content: str, max_tokens: int = TOOL_RESULT_MAX_TOKENS,
+                        max_items: int = TOOL_RESULT_MAX_ITEMS) -> str:
+    """
+    压缩过长的工具结果：JSON结果先截短其中的长列表/长表格（如批量仿真的results_table），
+    仍超出预算时保留首尾、省略中间部分
+
+    Args:
+        content: 工具返回的文本
+        max_tokens: 压缩后的token上限
+        max_items: JSON中每个列表/字典最多保留的条目数
+
+    Returns:
+        压缩后的文本，未超出预算时原样返回
+    """
+    if estimate_tokens(content) <= max_tokens:
+        return content
+
+    try:
+        parsed = json.loads(content)
+    except (ValueError, TypeError):
+        parsed = None
+    if isinstance(parsed, (dict, list)):
+        content = json.dumps(_shrink(parsed, max_items), ensure_ascii=False)
+        if estimate_tokens(content) <= max_tokens:
+            return content
+
+    # 按字符比例截取首尾，保证结果不超过预算
+    keep = max(int(len(content) * max_tokens / estimate_tokens(content)) - 40, 0)
+    head = content[:keep * 2 // 3]
+    tail = content[len(content) - keep // 3:] if keep // 3 else ""
+    return f"{head}\n...[结果过长，已省略 {len(content) - len(head) - len(tail)} 个字符]...\n{tail}"
+
+
+def _split_turns(messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[List[Dict[str, Any]]]]:
+    """
+    把消息分为开头的系统消息和若干轮对话，每轮从一条用户消息开始，
+    助手的工具调用和对应的工具结果总在同一轮内，整轮省略不会破坏配对关系
+    """
+    head = []
+    index = 0
+    while index < len(messages) and messages[index]["role"] == "system":
+        head.append(messages[index])
+        index += 1
+    turns: List[List[Dict[str, Any]]] = []
+    for message in messages[index:]:
+        if message["role"] == "user" or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return head, turns
+
+
+def _summarize_turns(turns: List[List[Dict[str, Any]]], max_tokens: int) -> Dict[str, Any]:
+    """
+    为被省略的早期对话生成摘要：逐条列出用户的提问（截短），不额外调用模型
+    """
+    lines = []
+    used = 0
+    for turn in turns:
+        question = next((m.get("content") for m in turn if m["role"] == "user"), None)
+        if not question:
+            continue
+        line = "- " + " ".join(question.split())[:80]
+        cost = estimate_tokens(line)
+        if used + cost > max_tokens:
+            lines.append("- ...")
+            break
+        lines.append(line)
+        used += cost
+    count = sum(len(turn) for turn in turns)
+    text = f"（为控制上下文长度，已省略较早的 {count} 条消息。"
+    if lines:
+        text += "用户此前的提问依次为：\n" + "\n".join(lines)
+    text += "）"
+    return {"role": "system", "content": text}
+
+
+def build_context(messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None,
+                  max_tokens: int = CONTEXT_MAX_TOKENS, reserve_tokens: int = CONTEXT_RESERVE_TOKENS,
+                  summary_tokens: int = CONTEXT_SUMMARY_TOKENS) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    在token预算内构建发送给模型的消息列表
+
+    保留开头的系统消息和最近的对话轮次；超出预算时从最早的轮次开始整轮省略，
+    并以一条简短的系统消息列出被省略轮次中用户的提问。最后一轮（当前提问及其工具调用）总是保留。
+
+    Args:
+        messages: OpenAI格式的完整消息列表
+        tools: 随请求发送的工具定义，计入预算
+        max_tokens: 上下文总预算
+        reserve_tokens: 为模型输出预留的token数
+        summary_tokens: 省略摘要的token上限
+
+    Returns:
+        Tuple[List[Dict], Dict[str, int]]: 实际发送的消息列表，以及统计信息
+            {"prompt_tokens": 估算发送的token数, "original_tokens": 完整历史的token数,
+             "dropped_messages": 省略的消息数, "budget_tokens": 预算}
+    """
+    budget = max_tokens - reserve_tokens - tools_tokens(tools)
+    original_tokens = sum(message_tokens(m) for m in messages)
+    stats = {"original_tokens": original_tokens + tools_tokens(tools), "dropped_messages": 0,
+             "budget_tokens": max_tokens - reserve_tokens}
+
+    if original_tokens <= budget:
+        stats["prompt_tokens"] = stats["original_tokens"]
+        return messages, stats
+
+    head, turns = _split_turns(messages)
+    used = sum(message_tokens(m) for m in head)
+    kept: List[List[Dict[str, Any]]] = []
+    # 从最近一轮往前保留，直到预算用完（为摘要留出空间）
+    for position, turn in enumerate(reversed(turns)):
+        cost = sum(message_tokens(m) for m in turn)
+        if position > 0 and used + cost > budget - summary_tokens - MESSAGE_OVERHEAD_TOKENS:
+            break
+        kept.insert(0, turn)
+        used += cost
+
+    dropped = turns[:len(turns) - len(kept)]
+    result = list(head)
+    if dropped:
+        summary = _summarize_turns(dropped, summary_tokens)
+        result.append(summary)
+        used += message_tokens(summary)
+    for turn in kept:
+        result.extend(turn)
+
+    stats["dropped_messages"] = sum(len(turn) for turn in dropped)
+    stats["prompt_tokens"] = used + tools_tokens(tools)
+    return result, stats
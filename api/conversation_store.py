@@ -0,0 +1,497 @@
+import os
+import json
+import uuid
+import base64
+import sqlite3
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# 会话存储配置，可通过环境变量调整
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "sqlite")  # sqlite 或 memory（不持久化）
+CONVERSATION_DB = os.getenv("CONVERSATION_DB", "conversations.sqlite3")
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "128"))  # 内存中保留的活跃会话数
+CONVERSATION_FLUSH_MS = float(os.getenv("CONVERSATION_FLUSH_MS", "50"))  # 写入攒批的时间窗口
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_FIELDS = ("role", "content", "reasoning_content", "context_info")
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def encode_cursor(created_at: str, conversation_id: str) -> str:
+    """把列表最后一项的 (创建时间, 会话ID) 编码为不透明的翻页游标"""
+    return base64.urlsafe_b64encode(json.dumps([created_at, conversation_id]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Raises:
+        ValueError: 游标格式不正确
+    """
+    try:
+        created_at, conversation_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError(f"无效的翻页游标: {cursor}")
+    return str(created_at), str(conversation_id)
+
+
+def _summary_page(summaries: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+    """后端多取一条用于判断是否还有下一页"""
+    page = summaries[:limit]
+    has_more = len(summaries) > limit
+    return {
+        "conversations": page,
+        "next_cursor": encode_cursor(page[-1]["created_at"], page[-1]["id"]) if has_more else None,
+    }
+
+
+def _message_page(conversation_id: str, messages: List[Dict[str, Any]], start_seq: int) -> Dict[str, Any]:
+    """messages为从序号start_seq开始的连续消息，按序号升序"""
+    return {
+        "conversation_id": conversation_id,
+        "messages": [dict({field: m.get(field) for field in MESSAGE_FIELDS}, seq=start_seq + i)
+                     for i, m in enumerate(messages)],
+        "next_before": start_seq if start_seq > 0 else None,
+    }
+
+
+class ConversationBackend(ABC):
+    """
+    会话持久化后端接口。所有方法都只在ConversationStore的单个写线程中调用，实现无需加锁
+
+    写操作以 (操作名, 参数) 的形式攒批后通过apply一次提交：
+        ("create", (conversation,))
+        ("append", (conversation_id, start_seq, messages, updated_at))
+        ("title", (conversation_id, title))
+    """
+
+    @abstractmethod
+    def apply(self, ops: List[Tuple[str, tuple]]) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def list_conversations(self) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def list_summaries(self, limit: int, cursor: Optional[Tuple[str, str]] = None) -> List[Dict[str, Any]]:
+        """
+        按创建时间倒序返回最多limit条会话摘要（不含消息），cursor为上一页最后一项的 (创建时间, 会话ID)
+        """
+
+    @abstractmethod
+    def get_messages(self, conversation_id: str, before: Optional[int],
+                     limit: int) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        """
+        返回序号小于before（为None时从末尾开始）的最后limit条消息及其中第一条的序号，会话不存在时返回None
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryConversationBackend(ConversationBackend):
+    """进程内后端，重启后丢失，适合测试和临时部署"""
+
+    def __init__(self):
+        self._conversations: Dict[str, Dict[str, Any]] = {}
+
+    def apply(self, ops: List[Tuple[str, tuple]]) -> None:
+        for op, args in ops:
+            if op == "create":
+                conversation = dict(args[0])
+                conversation["messages"] = [dict(m) for m in conversation["messages"]]
+                self._conversations[conversation["id"]] = conversation
+            elif op == "append":
+                conversation_id, _, messages, _ = args
+                self._conversations[conversation_id]["messages"].extend(dict(m) for m in messages)
+            elif op == "title":
+                self._conversations[args[0]]["title"] = args[1]
+
+    def _copy(self, conversation: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(conversation, messages=[dict(m) for m in conversation["messages"]])
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        conversation = self._conversations.get(conversation_id)
+        return self._copy(conversation) if conversation is not None else None
+
+    def list_conversations(self) -> List[Dict[str, Any]]:
+        return [self._copy(c) for c in self._conversations.values()]
+
+    def list_summaries(self, limit: int, cursor: Optional[Tuple[str, str]] = None) -> List[Dict[str, Any]]:
+        keys = sorted(((c["created_at"], c["id"]) for c in self._conversations.values()), reverse=True)
+        if cursor is not None:
+            keys = [key for key in keys if key < cursor]
+        return [
+            {"id": conversation_id, "title": self._conversations[conversation_id]["title"],
+             "created_at": created_at,
+             "message_count": len(self._conversations[conversation_id]["messages"])}
+            for created_at, conversation_id in keys[:limit]
+        ]
+
+    def get_messages(self, conversation_id: str, before: Optional[int],
+                     limit: int) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None:
+            return None
+        messages = conversation["messages"]
+        end = len(messages) if before is None else max(min(before, len(messages)), 0)
+        start = max(end - limit, 0)
+        return [dict(m) for m in messages[start:end]], start
+
+
+class SQLiteConversationBackend(ConversationBackend):
+    """
+    SQLite后端：WAL模式，一批写操作在一个事务中提交；消息按 (会话ID, 序号) 聚簇存储
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_conversations_created ON conversations (created_at, id);
+        CREATE TABLE IF NOT EXISTS messages (
+            conversation_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            reasoning_content TEXT,
+            context_info TEXT,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (conversation_id, seq)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: str = CONVERSATION_DB):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        # 在写线程中首次使用时才打开数据库
+        if self._db is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(self.SCHEMA)
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _insert_messages(self, conversation_id: str, start_seq: int,
+                         messages: List[Dict[str, Any]], created_at: str) -> None:
+        self.db.executemany(
+            "INSERT OR REPLACE INTO messages (conversation_id, seq, role, content, reasoning_content, "
+            "context_info, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (conversation_id, start_seq + i, m["role"], m.get("content") or "", m.get("reasoning_content"),
+                 json.dumps(m["context_info"], ensure_ascii=False) if m.get("context_info") is not None else None,
+                 created_at)
+                for i, m in enumerate(messages)
+            ],
+        )
+
+    def apply(self, ops: List[Tuple[str, tuple]]) -> None:
+        db = self.db
+        with db:
+            for op, args in ops:
+                if op == "create":
+                    conversation = args[0]
+                    db.execute(
+                        "INSERT OR REPLACE INTO conversations (id, title, created_at, updated_at, message_count) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (conversation["id"], conversation["title"], conversation["created_at"],
+                         conversation["created_at"], len(conversation["messages"])),
+                    )
+                    self._insert_messages(conversation["id"], 0, conversation["messages"], conversation["created_at"])
+                elif op == "append":
+                    conversation_id, start_seq, messages, updated_at = args
+                    self._insert_messages(conversation_id, start_seq, messages, updated_at)
+                    db.execute(
+                        "UPDATE conversations SET message_count = ?, updated_at = ? WHERE id = ?",
+                        (start_seq + len(messages), updated_at, conversation_id),
+                    )
+                elif op == "title":
+                    db.execute("UPDATE conversations SET title = ? WHERE id = ?", (args[1], args[0]))
+
+    @staticmethod
+    def _message(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "role": row["role"],
+            "content": row["content"],
+            "reasoning_content": row["reasoning_content"],
+            "context_info": json.loads(row["context_info"]) if row["context_info"] is not None else None,
+        }
+
+    def _messages(self, conversation_id: str) -> List[Dict[str, Any]]:
+        rows = self.db.execute(
+            "SELECT * FROM messages WHERE conversation_id = ? ORDER BY seq", (conversation_id,)
+        ).fetchall()
+        return [self._message(row) for row in rows]
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        row = self.db.execute(
+            "SELECT id, title, created_at FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(row, messages=self._messages(conversation_id))
+
+    def list_conversations(self) -> List[Dict[str, Any]]:
+        rows = self.db.execute("SELECT id, title, created_at FROM conversations ORDER BY created_at, id").fetchall()
+        return [dict(row, messages=self._messages(row["id"])) for row in rows]
+
+    def list_summaries(self, limit: int, cursor: Optional[Tuple[str, str]] = None) -> List[Dict[str, Any]]:
+        # 走 (created_at, id) 索引倒序扫描，代价只与页大小有关
+        sql = "SELECT id, title, created_at, message_count FROM conversations"
+        params: tuple = ()
+        if cursor is not None:
+            sql += " WHERE created_at < ? OR (created_at = ? AND id < ?)"
+            params = (cursor[0], cursor[0], cursor[1])
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        return [dict(row) for row in self.db.execute(sql, params + (limit,)).fetchall()]
+
+    def get_messages(self, conversation_id: str, before: Optional[int],
+                     limit: int) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        row = self.db.execute("SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        if row is None:
+            return None
+        end = row["message_count"] if before is None else max(min(before, row["message_count"]), 0)
+        # 主键 (conversation_id, seq) 上的范围扫描
+        rows = self.db.execute(
+            "SELECT * FROM messages WHERE conversation_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (conversation_id, max(end - limit, 0), end),
+        ).fetchall()
+        return [self._message(r) for r in rows], max(end - limit, 0)
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class ConversationStore:
+    """
+    会话存储：活跃会话保存在内存LRU中，写操作在时间窗口内攒批，由单个后台线程一次提交，
+    不阻塞事件循环。读请求与写批次在同一线程中按提交顺序执行，未命中LRU时也能读到刚写入的数据。
+
+    返回的会话字典由存储持有，调用方不要直接修改，应通过append_messages/set_title更新。
+    """
+
+    def __init__(self, backend: ConversationBackend, cache_size: int = CONVERSATION_CACHE_SIZE,
+                 flush_ms: float = CONVERSATION_FLUSH_MS):
+        self.backend = backend
+        self.cache_size = cache_size
+        self.flush_interval = flush_ms / 1000
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-store")
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pending: List[Tuple[str, tuple]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._last_flush: Optional[asyncio.Future] = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.flushes = 0
+        self.write_errors = 0
+
+    def _remember(self, conversation: Dict[str, Any]) -> None:
+        self._cache[conversation["id"]] = conversation
+        self._cache.move_to_end(conversation["id"])
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _enqueue(self, op: str, *args) -> None:
+        self._pending.append((op, args))
+        self.writes += 1
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._flush)
+
+    def _flush(self) -> Optional[asyncio.Future]:
+        """把待写操作作为一批提交到写线程，返回该批次的future"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return self._last_flush
+        ops, self._pending = self._pending, []
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self.backend.apply, ops)
+        future.add_done_callback(self._flush_done)
+        self.flushes += 1
+        self._last_flush = future
+        return future
+
+    def _flush_done(self, future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            self.write_errors += 1
+            logger.error(f"保存会话失败: {future.exception()}")
+
+    async def _read(self, fn, *args):
+        # 先提交待写批次：写线程按顺序执行，读操作一定排在这些写入之后
+        self._flush()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def create(self, title: str = "新对话",
+                     messages: Optional[List[Dict[str, Any]]] = None,
+                     conversation_id: Optional[str] = None) -> Dict[str, Any]:
+        conversation = {
+            "id": conversation_id or str(uuid.uuid4()),
+            "title": title,
+            "created_at": _now(),
+            "messages": [dict(m) for m in (messages or [])],
+        }
+        self._remember(conversation)
+        self._enqueue("create", dict(conversation, messages=list(conversation["messages"])))
+        return conversation
+
+    async def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """返回会话（含全部消息），不存在时返回None"""
+        conversation = self._cache.get(conversation_id)
+        if conversation is not None:
+            self._cache.move_to_end(conversation_id)
+            self.hits += 1
+            return conversation
+        self.misses += 1
+        conversation = await self._read(self.backend.get, conversation_id)
+        if conversation is None:
+            return None
+        # 等待读取期间其他请求可能已加载并更新了该会话，以内存中的为准
+        cached = self._cache.get(conversation_id)
+        if cached is not None:
+            return cached
+        self._remember(conversation)
+        return conversation
+
+    async def exists(self, conversation_id: Optional[str]) -> bool:
+        return bool(conversation_id) and await self.get(conversation_id) is not None
+
+    async def append_messages(self, conversation_id: str,
+                              messages: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        向会话追加消息
+
+        Returns:
+            更新后的会话，会话不存在时返回None
+        """
+        conversation = await self.get(conversation_id)
+        if conversation is None:
+            return None
+        messages = [{field: m.get(field) for field in MESSAGE_FIELDS if field in m} for m in messages]
+        start_seq = len(conversation["messages"])
+        conversation["messages"].extend(messages)
+        self._enqueue("append", conversation_id, start_seq, messages, _now())
+        return conversation
+
+    async def set_title(self, conversation_id: str, title: str) -> None:
+        conversation = await self.get(conversation_id)
+        if conversation is None:
+            return
+        conversation["title"] = title
+        self._enqueue("title", conversation_id, title)
+
+    async def list_conversations(self) -> List[Dict[str, Any]]:
+        """返回所有会话（含全部消息），按创建时间排序"""
+        return await self._read(self.backend.list_conversations)
+
+    async def list_summaries(self, limit: int = 50, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        分页返回会话摘要（id、标题、创建时间、消息数），按创建时间倒序
+
+        Args:
+            limit: 每页数量
+            cursor: 上一页返回的next_cursor，为None时从最新的会话开始
+
+        Returns:
+            {"conversations": [...], "next_cursor": 下一页游标，没有更多时为None}
+
+        Raises:
+            ValueError: 游标格式不正确
+        """
+        position = decode_cursor(cursor) if cursor else None
+        summaries = await self._read(self.backend.list_summaries, limit + 1, position)
+        return _summary_page(summaries, limit)
+
+    async def get_messages(self, conversation_id: str, before: Optional[int] = None,
+                           limit: int = 50) -> Optional[Dict[str, Any]]:
+        """
+        分页返回会话消息：序号小于before的最后limit条，按序号升序，每条消息带seq字段
+
+        Returns:
+            {"conversation_id", "messages", "next_before": 更早一页的before参数，已到开头时为None}，
+            会话不存在时返回None
+        """
+        conversation = self._cache.get(conversation_id)
+        if conversation is not None:
+            # 活跃会话直接从内存切片；不在LRU中的会话只读取这一页消息，不会整体载入内存
+            self._cache.move_to_end(conversation_id)
+            self.hits += 1
+            messages = conversation["messages"]
+            end = len(messages) if before is None else max(min(before, len(messages)), 0)
+            start = max(end - limit, 0)
+            return _message_page(conversation_id, messages[start:end], start)
+        self.misses += 1
+        result = await self._read(self.backend.get_messages, conversation_id, before, limit)
+        if result is None:
+            return None
+        messages, start = result
+        return _message_page(conversation_id, messages, start)
+
+    async def flush(self) -> None:
+        """等待所有已提交的写操作落盘"""
+        future = self._flush()
+        if future is not None:
+            await asyncio.shield(future)
+
+    async def close(self) -> None:
+        try:
+            await self.flush()
+        finally:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self.backend.close)
+            self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__,
+            "cached": len(self._cache),
+            "cache_size": self.cache_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "flushes": self.flushes,
+            "pending": len(self._pending),
+            "write_errors": self.write_errors,
+        }
+
+
+def create_conversation_store(kind: str = CONVERSATION_STORE, path: str = CONVERSATION_DB) -> ConversationStore:
+    """
+    按配置创建会话存储
+
+    Args:
+        kind: sqlite 或 memory
+        path: SQLite数据库文件路径
+    """
+    if kind == "sqlite":
+        return ConversationStore(SQLiteConversationBackend(path))
+    if kind == "memory":
+        return ConversationStore(MemoryConversationBackend())
+    raise ValueError(f"未知的会话存储类型: {kind}，可选 sqlite 或 memory")
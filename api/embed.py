@@ -1,83 +1,608 @@
 import os
+import io
+import json
+import time
+import hashlib
 import numpy as np
 import pickle
-from typing import List, Dict, Tuple, Optional, Union, Any
-from FlagEmbedding import FlagAutoModel
+import threading
+from typing import List, Dict, Tuple, Optional, Union, Any, Sequence
 import glob
 from tqdm import tqdm
+try:
+    from ann_index import build_index, load_index, remove_index, exact_search, recall_at_k
+    from query_cache import QueryEmbeddingCache
+except ImportError:
+    from api.ann_index import build_index, load_index, remove_index, exact_search, recall_at_k
+    from api.query_cache import QueryEmbeddingCache
 
 
 MODELNAME='BAAI/bge-base-en-v1.5'
 QUERYQUESTION="Represent this sentence for searching relevant passages:"
+EMBEDDING_DTYPE = np.float32
+
+# 列式存储格式的文件名
+STORE_FORMAT_VERSION = 1
+STORE_META_FILE = "store_meta.json"
+VECTORS_FILE = "vectors.npy"
+TEXTS_FILE = "texts.npy"
+TEXT_OFFSETS_FILE = "text_offsets.npy"
+FILE_NAMES_FILE = "file_names.npy"
+FILE_NAME_OFFSETS_FILE = "file_name_offsets.npy"
+# 增量处理清单：记录每个源文件的大小/修改时间/内容哈希及其片段行号
+MANIFEST_FILE = "manifest.json"
+
+# 编码时每批的片段数量
+ENCODE_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+# 保存时建立的近似最近邻索引类型：ivf / hnsw / none
+DEFAULT_INDEX_TYPE = os.getenv("EMBEDDING_INDEX", "ivf")
+
+
+class StringColumn(Sequence):
+    """
+    只读字符串列，所有字符串以UTF-8拼接在一个字节数组中，按偏移量按需解码
+    
+    配合np.load(mmap_mode='r')使用时，多个进程共享同一份页缓存，
+    不会为每个字符串创建Python对象
+    """
+    
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray, empty_as_none: bool = False):
+        self.blob = blob
+        self.offsets = offsets
+        self.empty_as_none = empty_as_none
+    
+    def __len__(self) -> int:
+        return max(len(self.offsets) - 1, 0)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError(index)
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        value = bytes(self.blob[start:end]).decode('utf-8')
+        if self.empty_as_none and not value:
+            return None
+        return value
+
+
+def _save_npy_atomic(path: str, array: np.ndarray) -> None:
+    """
+    先写临时文件再替换，正在mmap旧文件的读进程不受影响
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def _save_strings(blob_path: str, offsets_path: str, strings: Sequence[Optional[str]]) -> None:
+    """
+    将字符串列表保存为 字节数组 + 偏移量数组 两个.npy文件，None保存为空串
+    """
+    encoded = [(s or '').encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    _save_npy_atomic(blob_path, blob)
+    _save_npy_atomic(offsets_path, offsets)
+
+
+def _load_strings(blob_path: str, offsets_path: str, empty_as_none: bool = False) -> StringColumn:
+    """
+    以内存映射方式加载由_save_strings保存的字符串列
+    """
+    blob = np.load(blob_path, mmap_mode='r')
+    offsets = np.load(offsets_path, mmap_mode='r')
+    return StringColumn(blob, offsets, empty_as_none=empty_as_none)
+
+
+def write_columnar_store(output_dir: str, texts: Sequence[str],
+                         file_names: Sequence[Optional[str]],
+                         embeddings: np.ndarray,
+                         model_name: Optional[str] = None) -> None:
+    """
+    将文本、文件名和向量矩阵写为列式存储
+    
+    Args:
+        output_dir: 输出目录路径
+        texts: 文本列表
+        file_names: 与texts一一对应的文件名列表
+        embeddings: 向量矩阵，第i行对应texts[i]
+        model_name: 生成向量所用的模型名称，仅记录在元数据中
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    embeddings = np.ascontiguousarray(embeddings)
+    
+    _save_npy_atomic(os.path.join(output_dir, VECTORS_FILE), embeddings)
+    _save_strings(os.path.join(output_dir, TEXTS_FILE),
+                  os.path.join(output_dir, TEXT_OFFSETS_FILE), texts)
+    _save_strings(os.path.join(output_dir, FILE_NAMES_FILE),
+                  os.path.join(output_dir, FILE_NAME_OFFSETS_FILE), file_names)
+    
+    # 元数据最后写入，作为存储完整的标志
+    meta = {
+        "format_version": STORE_FORMAT_VERSION,
+        "count": len(texts),
+        "dim": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        "dtype": str(embeddings.dtype),
+        "model_name": model_name,
+    }
+    meta_path = os.path.join(output_dir, STORE_META_FILE)
+    with open(meta_path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def is_columnar_store(input_dir: str) -> bool:
+    """
+    判断目录中是否存在列式存储
+    """
+    return os.path.exists(os.path.join(input_dir, STORE_META_FILE))
+
+
+def _append_npy(path: str, rows: np.ndarray) -> bool:
+    """
+    在已有.npy文件末尾追加行并原地更新头部的shape
+    
+    先写数据再改头部：中途失败时旧头部仍描述一个完整的旧数组
+    
+    Returns:
+        是否追加成功；dtype或列数不一致、头部长度变化时返回False，由调用方整体重写
+    """
+    rows = np.ascontiguousarray(rows)
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        header_len = f.tell()
+        if fortran_order or dtype != rows.dtype or tuple(shape[1:]) != tuple(rows.shape[1:]):
+            return False
+        
+        header = io.BytesIO()
+        header_data = {
+            'descr': np.lib.format.dtype_to_descr(dtype),
+            'fortran_order': False,
+            'shape': (shape[0] + rows.shape[0],) + tuple(shape[1:]),
+        }
+        if version == (1, 0):
+            np.lib.format.write_array_header_1_0(header, header_data)
+        else:
+            np.lib.format.write_array_header_2_0(header, header_data)
+        if len(header.getvalue()) != header_len:
+            return False
+        
+        # 截掉上次失败追加可能遗留的尾部数据
+        f.truncate(header_len + int(np.prod(shape)) * dtype.itemsize)
+        f.seek(0, os.SEEK_END)
+        f.write(rows.tobytes())
+        f.flush()
+        f.seek(0)
+        f.write(header.getvalue())
+    return True
+
+
+def append_columnar_store(output_dir: str, texts: Sequence[str],
+                          file_names: Sequence[Optional[str]],
+                          embeddings: np.ndarray) -> bool:
+    """
+    向已有的列式存储原地追加行，不重写已有数据
+    
+    Args:
+        output_dir: 列式存储目录
+        texts: 新增的文本
+        file_names: 新增文本对应的文件名
+        embeddings: 新增的向量
+        
+    Returns:
+        是否追加成功；失败时存储保持原样，调用方应整体重写
+    """
+    meta_path = os.path.join(output_dir, STORE_META_FILE)
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get("count", 0) == 0:
+        return False
+    
+    # 新字符串的偏移量需要接在旧字节数组之后
+    string_columns = []
+    for blob_file, offsets_file, strings in [(TEXTS_FILE, TEXT_OFFSETS_FILE, texts),
+                                             (FILE_NAMES_FILE, FILE_NAME_OFFSETS_FILE, file_names)]:
+        old_offsets = np.load(os.path.join(output_dir, offsets_file), mmap_mode='r')
+        encoded = [(s or '').encode('utf-8') for s in strings]
+        offsets = np.cumsum([len(b) for b in encoded], dtype=np.int64) + int(old_offsets[-1])
+        blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        string_columns.append((blob_file, blob, offsets_file, offsets))
+    
+    if not _append_npy(os.path.join(output_dir, VECTORS_FILE), np.asarray(embeddings)):
+        return False
+    for blob_file, blob, offsets_file, offsets in string_columns:
+        if not _append_npy(os.path.join(output_dir, blob_file), blob):
+            return False
+        if not _append_npy(os.path.join(output_dir, offsets_file), offsets):
+            return False
+    
+    meta["count"] = meta["count"] + len(texts)
+    with open(meta_path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(meta_path + ".tmp", meta_path)
+    return True
+
+
+def file_sha256(file_path: str) -> str:
+    """
+    计算文件内容的SHA-256
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(store_dir: str) -> Dict[str, Any]:
+    """
+    读取存储目录中的增量处理清单，不存在时返回空清单
+    """
+    manifest_path = os.path.join(store_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {"version": 1, "files": {}}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(store_dir: str, manifest: Dict[str, Any]) -> None:
+    """
+    保存增量处理清单
+    """
+    manifest_path = os.path.join(store_dir, MANIFEST_FILE)
+    with open(manifest_path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def migrate_pickle_store(input_dir: str, output_dir: Optional[str] = None) -> int:
+    """
+    将旧版 embeddings.pkl / file_info.pkl 转换为列式存储，不需要加载嵌入模型
+    
+    Args:
+        input_dir: 包含旧版pickle文件的目录
+        output_dir: 输出目录，默认与input_dir相同
+        
+    Returns:
+        转换的向量数量
+    """
+    output_dir = output_dir or input_dir
+    embeddings_path = os.path.join(input_dir, "embeddings.pkl")
+    if not os.path.exists(embeddings_path):
+        raise FileNotFoundError(f"未找到嵌入向量文件: {embeddings_path}")
+    
+    with open(embeddings_path, 'rb') as f:
+        text_embeddings = pickle.load(f)
+    file_info = {}
+    file_info_path = os.path.join(input_dir, "file_info.pkl")
+    if os.path.exists(file_info_path):
+        with open(file_info_path, 'rb') as f:
+            file_info = pickle.load(f)
+    
+    texts = list(text_embeddings.keys())
+    if texts:
+        embeddings = np.stack([np.asarray(text_embeddings[text], dtype=EMBEDDING_DTYPE) for text in texts])
+    else:
+        embeddings = np.zeros((0, 0), dtype=EMBEDDING_DTYPE)
+    write_columnar_store(output_dir, texts, [file_info.get(text) for text in texts], embeddings)
+    print(f"已将 {len(texts)} 个嵌入向量从 {input_dir} 转换为列式存储: {output_dir}")
+    return len(texts)
+
+
+class _ModelSlot:
+    """编码模型的按需加载槽位，可由多个TextEmbedding共享"""
+
+    def __init__(self):
+        self.model = None
+        self.lock = threading.Lock()
+
 
 class TextEmbedding:
     """
     文本嵌入类，用于存储文本与embedding对，并提供相关功能
     """
     
-    def __init__(self, model_name: str = MODELNAME, 
+    def __init__(self, model_name: Optional[str] = MODELNAME, 
                  query_instruction: str = QUERYQUESTION,
-                 use_fp16: bool = True):
+                 use_fp16: bool = True,
+                 dtype: Union[str, np.dtype] = EMBEDDING_DTYPE):
         """
         初始化TextEmbedding类
         
         Args:
-            model_name: 使用的模型名称
+            model_name: 使用的模型名称；为None时不带编码模型（只读模式），只能用search_by_vectors检索
             query_instruction: 检索指令
             use_fp16: 是否使用fp16精度
+            dtype: 向量矩阵的存储精度，float32（默认）或float16（内存减半，打分稍慢）
+        """
+        self.model_name = model_name
+        self.query_instruction = query_instruction
+        self.use_fp16 = use_fp16
+        # 编码模型在第一次需要编码时才加载（导入torch和加载权重需要数秒和数百MB内存）
+        # 可与其他存储共享，见share_model
+        self._model_slot = _ModelSlot()
+        self.dtype = np.dtype(dtype)
+        # 列式存储：第i行向量对应 texts[i] 和 file_names[i]
+        self.texts: List[str] = []
+        self.file_names: List[Optional[str]] = []
+        self.embeddings: np.ndarray = np.zeros((0, 0), dtype=self.dtype)
+        # 文本 -> 行号，用于去重和按文本查找；从磁盘映射加载时按需构建
+        self._text_index: Optional[Dict[str, int]] = {}
+        # 近似最近邻索引，为None时做暴力检索
+        self.index = None
+        # 与磁盘上的列式存储一致的前缀行数，用于原地追加
+        self._persisted_dir: Optional[str] = None
+        self._persisted_count = 0
+        # 查询向量缓存，大小/TTL/磁盘目录由 QUERY_CACHE_* 环境变量配置
+        self.query_cache = QueryEmbeddingCache(namespace=f"{model_name}\n{query_instruction}")
+
+    @property
+    def model(self):
+        """
+        BGE编码模型，首次访问时加载
+        
+        Raises:
+            RuntimeError: 以只读模式（model_name=None）创建的存储没有编码模型
+        """
+        slot = self._model_slot
+        if slot.model is None:
+            if self.model_name is None:
+                raise RuntimeError("该嵌入存储以只读模式加载（model_name=None），无法编码文本；"
+                                   "请指定model_name，或使用search_by_vectors传入预先计算的查询向量")
+            with slot.lock:
+                if slot.model is None:
+                    from FlagEmbedding import FlagAutoModel
+                    print(f"正在加载编码模型 {self.model_name}...")
+                    slot.model = FlagAutoModel.from_finetuned(self.model_name,
+                                                              query_instruction_for_retrieval=self.query_instruction,
+                                                              use_fp16=self.use_fp16)
+        return slot.model
+    
+    @model.setter
+    def model(self, model) -> None:
+        self._model_slot.model = model
+    
+    @property
+    def model_loaded(self) -> bool:
+        return self._model_slot.model is not None
+
+    def share_model(self, other: Optional['TextEmbedding']) -> bool:
+        """
+        与另一个存储共享编码模型：模型名、检索指令和精度相同时两者使用同一个按需加载的模型，
+        无论哪一个先需要编码都只加载一次，避免在内存中加载第二份BGE模型
+
+        Returns:
+            bool: 是否共享
+        """
+        if other is None or other is self or self.model_name is None:
+            return False
+        if (other.model_name, other.query_instruction, other.use_fp16) != \
+                (self.model_name, self.query_instruction, self.use_fp16):
+            return False
+        self._model_slot = other._model_slot
+        return True
+
+    def warm_up(self) -> threading.Thread:
+        """
+        在后台线程中预加载编码模型，第一次查询无需等待模型加载；只读存储（model_name=None）不加载
+        """
+        def run():
+            try:
+                if self.model_name is not None:
+                    self.model
+            except Exception as e:
+                print(f"预加载编码模型失败: {e}")
+
+        thread = threading.Thread(target=run, name="embedding-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def _get_text_index(self) -> Dict[str, int]:
+        """
+        获取 文本->行号 索引，不存在时从texts构建
+        """
+        if self._text_index is None:
+            self._text_index = {text: i for i, text in enumerate(self.texts)}
+        return self._text_index
+
+    def _materialize(self) -> None:
+        """
+        将内存映射的只读列转换为可修改的内存副本，在写入前调用
+        """
+        if not isinstance(self.texts, list):
+            self.texts = list(self.texts)
+        if not isinstance(self.file_names, list):
+            self.file_names = list(self.file_names)
+        if isinstance(self.embeddings, np.memmap) or not self.embeddings.flags.writeable:
+            self.embeddings = np.array(self.embeddings, dtype=self.dtype)
+
+    def _add_embeddings(self, texts: List[str], embeddings: np.ndarray,
+                        file_names: Optional[List[Optional[str]]] = None) -> None:
+        """
+        将一批文本及其embedding写入矩阵，已存在的文本覆盖原有行
+        
+        Args:
+            texts: 文本列表
+            embeddings: 与texts一一对应的embedding矩阵
+            file_names: 对应的文件名列表
+        """
+        embeddings = np.asarray(embeddings, dtype=self.dtype)
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+        self._materialize()
+        # 语料变化后索引过期，保存时重建
+        self.index = None
+        text_index = self._get_text_index()
+        if len(self.texts) == 0:
+            self.embeddings = np.zeros((0, embeddings.shape[1]), dtype=self.dtype)
+        
+        base = self.embeddings.shape[0]
+        new_rows = []
+        for i, text in enumerate(texts):
+            file_name = file_names[i] if file_names and i < len(file_names) else None
+            row = text_index.get(text)
+            if row is not None:
+                if row >= base:
+                    # 同一批次内重复的文本，以最后一次为准
+                    new_rows[row - base] = i
+                else:
+                    self.embeddings[row] = embeddings[i]
+                    if row < self._persisted_count:
+                        # 已落盘的行被修改，下次保存不能只追加
+                        self._persisted_dir = None
+                if file_name:
+                    self.file_names[row] = file_name
+                continue
+            text_index[text] = len(self.texts)
+            self.texts.append(text)
+            self.file_names.append(file_name)
+            new_rows.append(i)
+        
+        if new_rows:
+            self.embeddings = np.concatenate([self.embeddings, embeddings[new_rows]], axis=0)
+
+    def _set_from_dicts(self, text_embeddings: Dict[str, np.ndarray],
+                        file_info: Dict[str, str]) -> None:
+        """
+        从旧版的 文本->embedding / 文本->文件名 字典重建列式存储
+        """
+        self._reset()
+        if not text_embeddings:
+            return
+        texts = list(text_embeddings.keys())
+        embeddings = np.stack([text_embeddings[text] for text in texts])
+        self._add_embeddings(texts, embeddings, [file_info.get(text) for text in texts])
+
+    def _to_dicts(self) -> Tuple[Dict[str, np.ndarray], Dict[str, str]]:
+        """
+        导出为旧版的 文本->embedding / 文本->文件名 字典
+        """
+        text_embeddings = {text: self.embeddings[i] for i, text in enumerate(self.texts)}
+        file_info = {text: file_name for text, file_name in zip(self.texts, self.file_names) if file_name}
+        return text_embeddings, file_info
+
+    def remove_rows(self, rows: Sequence[int]) -> np.ndarray:
+        """
+        删除指定行并压缩存储
+        
+        Args:
+            rows: 要删除的行号
+            
+        Returns:
+            旧行号 -> 新行号 的映射数组，被删除的行为-1
+        """
+        self._materialize()
+        keep = np.ones(len(self), dtype=bool)
+        keep[np.asarray(list(rows), dtype=np.int64)] = False
+        mapping = np.full(len(self), -1, dtype=np.int64)
+        mapping[keep] = np.arange(int(keep.sum()))
+        
+        self.embeddings = self.embeddings[keep]
+        self.texts = [text for text, k in zip(self.texts, keep) if k]
+        self.file_names = [file_name for file_name, k in zip(self.file_names, keep) if k]
+        self._text_index = None
+        self.index = None
+        self._persisted_dir = None
+        return mapping
+        
+    @staticmethod
+    def chunk_texts(texts: List[str], truncate_length: Optional[int] = None,
+                    file_names: Optional[List[str]] = None) -> Tuple[List[str], List[Optional[str]]]:
+        """
+        将文档切分为片段，不计算embedding
+        
+        Args:
+            texts: 文本列表
+            truncate_length: 截断长度，如果为None则不截断
+            file_names: 对应的文件名列表
+            
+        Returns:
+            (片段列表, 片段对应的文件名列表)，被截断的文档文件名带 #chunkN 后缀
+        """
+        chunks = []
+        chunk_file_names = []
+        for i, text in enumerate(texts):
+            file_name = file_names[i] if file_names and i < len(file_names) else None
+            
+            if truncate_length is None or len(text) <= truncate_length:
+                chunks.append(text)
+                chunk_file_names.append(file_name)
+                continue
+            
+            # 文本长度大于截断长度，需要截断
+            pieces = [text[j:j+truncate_length] for j in range(0, len(text), truncate_length)]
+            print(f"文本 {i+1}/{len(texts)} 被截断为 {len(pieces)} 个片段")
+            chunks.extend(pieces)
+            # 为每个chunk添加文件信息和chunk索引
+            chunk_file_names.extend(f"{file_name}#chunk{j+1}" if file_name else None
+                                    for j in range(len(pieces)))
+        return chunks, chunk_file_names
+    
+    def encode_batched(self, texts: List[str], batch_size: int = ENCODE_BATCH_SIZE) -> np.ndarray:
+        """
+        按长度排序后以固定大小的批次编码，减少padding，结果按原顺序返回
+        
+        Args:
+            texts: 文本列表
+            batch_size: 每批编码的文本数量
+            
+        Returns:
+            与texts一一对应的embedding矩阵
         """
-        self.model = FlagAutoModel.from_finetuned(model_name,
-                                                 query_instruction_for_retrieval=query_instruction,
-                                                 use_fp16=use_fp16)
-        self.text_embeddings: Dict[str, np.ndarray] = {}
-        # 添加文件信息存储
-        self.file_info: Dict[str, str] = {}  # 文本 -> 文件名映射
+        if not texts:
+            return np.zeros((0, 0), dtype=self.dtype)
+        
+        # 由长到短排序：同一批内长度相近，且最长的批次最先暴露显存/内存问题
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        embeddings = None
         
-    def add_texts(self, texts: List[str], truncate_length: Optional[int] = None, file_names: Optional[List[str]] = None) -> None:
+        start_time = time.time()
+        for start in tqdm(range(0, len(order), batch_size), desc="计算嵌入"):
+            batch_ids = order[start:start + batch_size]
+            batch_embeddings = np.asarray(
+                self.model.encode([texts[i] for i in batch_ids], batch_size=batch_size),
+                dtype=self.dtype,
+            )
+            if embeddings is None:
+                embeddings = np.empty((len(texts), batch_embeddings.shape[-1]), dtype=self.dtype)
+            embeddings[batch_ids] = batch_embeddings
+        elapsed = max(time.time() - start_time, 1e-9)
+        print(f"编码 {len(texts)} 个片段耗时 {elapsed:.1f} 秒，{len(texts) / elapsed:.1f} 片段/秒")
+        return embeddings
+    
+    def add_texts(self, texts: List[str], truncate_length: Optional[int] = None,
+                  file_names: Optional[List[str]] = None,
+                  batch_size: int = ENCODE_BATCH_SIZE) -> None:
         """
         批量添加文本并计算embedding
         
+        先切分所有文档，再把全部片段按长度排序后分批编码，
+        避免逐个文档调用模型造成的小批次和大量padding
+        
         Args:
             texts: 文本列表
             truncate_length: 截断长度，如果为None则不截断
             file_names: 对应的文件名列表，如果提供，则会存储文本与文件名的对应关系
+            batch_size: 每批编码的片段数量
         """
-        if truncate_length is None:
-            # 不截断，直接计算embedding
-            print("计算文本嵌入...")
-            embeddings = self.model.encode(texts)
-            for i, text in enumerate(tqdm(texts, desc="处理文本")):
-                self.text_embeddings[text] = embeddings[i]
-                # 如果提供了文件名，则存储文本与文件名的对应关系
-                if file_names and i < len(file_names):
-                    self.file_info[text] = file_names[i]
-        else:
-            # 需要截断处理
-            print("处理文本并截断...")
-            for i, text in enumerate(tqdm(texts, desc="处理文本")):
-                file_name = file_names[i] if file_names and i < len(file_names) else None
-                
-                if len(text) <= truncate_length:
-                    # 文本长度小于截断长度，直接计算embedding
-                    embedding = self.model.encode([text])[0]
-                    self.text_embeddings[text] = embedding
-                    if file_name:
-                        self.file_info[text] = file_name
-                else:
-                    # 文本长度大于截断长度，需要截断
-                    chunks = []
-                    for j in range(0, len(text), truncate_length):
-                        chunk = text[j:j+truncate_length]
-                        chunks.append(chunk)
-                    
-                    print(f"文本 {i+1}/{len(texts)} 被截断为 {len(chunks)} 个片段")
-                    # 计算每个chunk的embedding
-                    chunk_embeddings = self.model.encode(chunks)
-                    for j, chunk in enumerate(tqdm(chunks, desc=f"处理文本 {i+1} 的片段")):
-                        self.text_embeddings[chunk] = chunk_embeddings[j]
-                        if file_name:
-                            # 为每个chunk添加文件信息和chunk索引
-                            self.file_info[chunk] = f"{file_name}#chunk{j+1}"
+        print("处理文本并截断..." if truncate_length else "计算文本嵌入...")
+        chunks, chunk_file_names = self.chunk_texts(texts, truncate_length, file_names)
+        if not chunks:
+            return
+        embeddings = self.encode_batched(chunks, batch_size=batch_size)
+        self._add_embeddings(chunks, embeddings, chunk_file_names)
     
     def process_directory(self, directory_path: str, file_pattern: str = "*.txt", 
                           truncate_length: Optional[int] = None, 
@@ -122,50 +647,284 @@ class TextEmbedding:
         if texts:
             print(f"开始处理 {len(texts)} 个文本...")
             self.add_texts(texts, truncate_length=truncate_length, file_names=file_names)
-            print(f"文本处理完成，共生成 {len(self.text_embeddings)} 个嵌入向量")
+            print(f"文本处理完成，共生成 {len(self)} 个嵌入向量")
     
-    def save_with_file_info(self, output_dir: str) -> None:
+    def update_directory(self, directory_path: str, store_dir: str, file_pattern: str = "*.txt",
+                         truncate_length: Optional[int] = None, encoding: str = 'utf-8',
+                         index_type: Optional[str] = DEFAULT_INDEX_TYPE) -> Dict[str, int]:
         """
-        将文本embedding和文件信息保存到指定目录
+        增量处理目录：只嵌入新增或内容变化的文件，删除已移除文件的片段，并保存到store_dir
+        
+        store_dir中的manifest.json记录每个文件的大小、修改时间、内容哈希和片段行号。
+        大小和修改时间未变的文件直接跳过；变化时再比较内容哈希。
+        只有新增文件时向已有存储原地追加，否则整体重写
+        
+        Args:
+            directory_path: 目录路径
+            store_dir: 嵌入向量存储目录，通常由load_with_file_info从同一目录加载
+            file_pattern: 文件匹配模式，默认为"*.txt"
+            truncate_length: 截断长度，如果为None则不截断
+            encoding: 文件编码，默认为'utf-8'
+            index_type: 保存时建立的索引类型
+            
+        Returns:
+            统计信息：新增、更新、删除、未变化的文件数量，以及新编码的片段数量
+        """
+        store_dir_abs = os.path.abspath(store_dir)
+        manifest = load_manifest(store_dir) if self._persisted_dir == store_dir_abs else {"files": {}}
+        
+        # 切分参数变化时所有片段都失效，需要全部重建
+        if manifest["files"] and (manifest.get("truncate_length") != truncate_length
+                                  or manifest.get("file_pattern") != file_pattern):
+            print("切分参数与清单不一致，重新处理全部文件")
+            self._reset()
+            manifest = {"files": {}}
+        old_files = manifest["files"]
+        
+        current_files: Dict[str, Dict[str, Any]] = {}
+        pending = []  # (文件名, 内容, 清单条目)
+        for file_path in sorted(glob.glob(os.path.join(directory_path, file_pattern))):
+            file_name = os.path.basename(file_path)
+            try:
+                stat = os.stat(file_path)
+                entry = old_files.get(file_name)
+                if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                    current_files[file_name] = entry
+                    continue
+                
+                sha256 = file_sha256(file_path)
+                if entry and entry["sha256"] == sha256:
+                    # 只有修改时间变化，内容未变
+                    current_files[file_name] = dict(entry, size=stat.st_size, mtime=stat.st_mtime)
+                    continue
+                
+                with open(file_path, 'r', encoding=encoding) as f:
+                    content = f.read()
+                pending.append((file_name, content, {"size": stat.st_size, "mtime": stat.st_mtime,
+                                                     "sha256": sha256, "chunk_ids": []}))
+            except Exception as e:
+                print(f"处理文件 {file_path} 时出错: {str(e)}")
+                # 读取失败时保留旧片段，避免误删
+                if file_name in old_files:
+                    current_files[file_name] = old_files[file_name]
+        
+        pending_names = {file_name for file_name, _, _ in pending}
+        removed = [name for name in old_files if name not in current_files and name not in pending_names]
+        changed = [name for name in pending_names if name in old_files]
+        
+        # 删除已移除或已变化文件的片段（仍被其他文件引用的相同片段保留）
+        still_used = {row for entry in current_files.values() for row in entry["chunk_ids"]}
+        old_rows = {row for name in removed + changed for row in old_files[name]["chunk_ids"]}
+        drop_rows = old_rows - still_used
+        # 保留下来的共享片段原来可能标注为被删除/修改的文件，需要重新确定文件名
+        relabel_rows = old_rows & still_used
+        if drop_rows:
+            mapping = self.remove_rows(sorted(drop_rows))
+            for entry in current_files.values():
+                entry["chunk_ids"] = [int(mapping[row]) for row in entry["chunk_ids"]]
+            relabel_rows = {int(mapping[row]) for row in relabel_rows}
+        
+        # 切分并批量编码所有待处理文件
+        encoded_count = 0
+        if pending:
+            file_chunks = []
+            all_chunks, all_chunk_file_names = [], []
+            for file_name, content, _ in pending:
+                chunks, chunk_file_names = self.chunk_texts([content], truncate_length, [file_name])
+                file_chunks.append(chunks)
+                all_chunks.extend(chunks)
+                all_chunk_file_names.extend(chunk_file_names)
+            
+            if all_chunks:
+                embeddings = self.encode_batched(all_chunks)
+                self._add_embeddings(all_chunks, embeddings, all_chunk_file_names)
+                encoded_count = len(all_chunks)
+            
+            text_index = self._get_text_index()
+            for (file_name, _, entry), chunks in zip(pending, file_chunks):
+                # 按片段在文件中的顺序记录，用于恢复片段的文件名标注（#chunkN）
+                entry["chunk_ids"] = [text_index[chunk] for chunk in chunks]
+                current_files[file_name] = entry
+                relabel_rows.update(entry["chunk_ids"])
+        
+        self._sync_file_names(current_files, relabel_rows)
+        
+        stats = {
+            "added": len(pending) - len(changed),
+            "updated": len(changed),
+            "removed": len(removed),
+            "unchanged": len(current_files) - len(pending),
+            "encoded_chunks": encoded_count,
+        }
+        print(f"增量处理完成: 新增 {stats['added']} 个文件，更新 {stats['updated']} 个，"
+              f"删除 {stats['removed']} 个，未变化 {stats['unchanged']} 个")
+        
+        self.save_incremental(store_dir, index_type=index_type)
+        save_manifest(store_dir, {
+            "version": 1,
+            "directory": os.path.abspath(directory_path),
+            "file_pattern": file_pattern,
+            "truncate_length": truncate_length,
+            "files": current_files,
+        })
+        return stats
+    
+    def _sync_file_names(self, files: Dict[str, Dict[str, Any]], rows: set) -> None:
+        """
+        按清单重新确定指定片段的文件名：多个文件包含相同片段时取排序最后的文件（与整体重建一致），
+        避免片段的文件名仍指向已删除或已修改的文件
+        
+        Args:
+            files: 清单中的文件条目，chunk_ids按片段顺序排列
+            rows: 需要检查的行号
+        """
+        labels = {}
+        for name in sorted(files):
+            chunk_ids = files[name]["chunk_ids"]
+            for j, row in enumerate(chunk_ids):
+                if row in rows:
+                    labels[row] = name if len(chunk_ids) == 1 else f"{name}#chunk{j + 1}"
+        stale = [row for row, label in labels.items() if self.file_names[row] != label]
+        if not stale:
+            return
+        self._materialize()
+        for row in stale:
+            self.file_names[row] = labels[row]
+        if min(stale) < self._persisted_count:
+            # 已落盘的行被修改，下次保存不能只追加
+            self._persisted_dir = None
+    
+    def save_incremental(self, output_dir: str, index_type: Optional[str] = DEFAULT_INDEX_TYPE) -> bool:
+        """
+        保存到output_dir：若只在已落盘数据之后新增了行则原地追加，否则整体重写
         
         Args:
             output_dir: 输出目录路径
+            index_type: 索引类型
+            
+        Returns:
+            是否以追加方式保存
         """
-        # 确保输出目录存在
-        os.makedirs(output_dir, exist_ok=True)
+        if self._persisted_dir != os.path.abspath(output_dir) or not is_columnar_store(output_dir):
+            self.save_with_file_info(output_dir, index_type, keep_manifest=True)
+            return False
         
-        print(f"保存嵌入向量到 {output_dir}...")
+        start = self._persisted_count
+        if start == len(self) and self.index is not None:
+            print("存储无变化，跳过保存")
+            return True
         
-        # 保存embedding
-        embeddings_path = os.path.join(output_dir, "embeddings.pkl")
-        with open(embeddings_path, 'wb') as f:
-            pickle.dump(self.text_embeddings, f)
+        if start < len(self):
+            if not append_columnar_store(output_dir, self.texts[start:], self.file_names[start:],
+                                         self.embeddings[start:]):
+                self.save_with_file_info(output_dir, index_type, keep_manifest=True)
+                return False
+            self._write_preview(output_dir, start, mode='a')
+            print(f"已向 {output_dir} 追加 {len(self) - start} 个嵌入向量")
+            self._persisted_count = len(self)
         
-        # 保存文件信息
-        file_info_path = os.path.join(output_dir, "file_info.pkl")
-        with open(file_info_path, 'wb') as f:
-            pickle.dump(self.file_info, f)
+        self.build_index(output_dir, index_type)
+        return True
+    
+    def _write_preview(self, output_dir: str, start: int = 0, mode: str = 'w') -> None:
+        """
+        保存文本内容到文本文件，方便查看
         
-        # 保存文本内容到文本文件，方便查看
+        Args:
+            output_dir: 输出目录路径
+            start: 从第几行开始写
+            mode: 文件打开模式，'w'覆盖，'a'追加
+        """
         texts_path = os.path.join(output_dir, "texts.txt")
-        with open(texts_path, 'w', encoding='utf-8') as f:
-            for i, (text, file_name) in enumerate(tqdm(self.file_info.items(), desc="保存文本信息")):
+        with open(texts_path, mode, encoding='utf-8') as f:
+            for i in tqdm(range(start, len(self)), desc="保存文本信息"):
+                text, file_name = self.texts[i], self.file_names[i]
+                if not file_name:
+                    continue
                 f.write(f"文件: {file_name}\n")
                 f.write(f"内容: {text[:100]}...\n" if len(text) > 100 else f"内容: {text}\n")
                 f.write("-" * 80 + "\n")
+    
+    def save_with_file_info(self, output_dir: str, index_type: Optional[str] = DEFAULT_INDEX_TYPE,
+                            keep_manifest: bool = False, **index_params) -> None:
+        """
+        将文本embedding和文件信息以列式格式保存到指定目录
+        
+        目录中包含向量矩阵 vectors.npy、文本与文件名的 字节数组+偏移量 文件，
+        以及元数据 store_meta.json，加载时可直接内存映射。
+        同时建立并保存近似最近邻索引
+        
+        Args:
+            output_dir: 输出目录路径
+            index_type: 索引类型，'ivf'、'hnsw'，None或'none'表示不建索引
+            keep_manifest: 是否保留增量处理清单；整体保存新语料时旧清单已失效，默认删除
+            **index_params: 传给索引构建的参数，如nlist、m、ef_construction
+        """
+        # 确保输出目录存在
+        os.makedirs(output_dir, exist_ok=True)
+        
+        print(f"保存嵌入向量到 {output_dir}...")
+        
+        write_columnar_store(output_dir, self.texts, self.file_names, self.embeddings,
+                             model_name=self.model_name)
+        self._persisted_dir = os.path.abspath(output_dir)
+        self._persisted_count = len(self)
+        
+        manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+        if not keep_manifest and os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        
+        self._write_preview(output_dir)
         
-        print(f"保存完成，共保存了 {len(self.text_embeddings)} 个嵌入向量")
+        self.build_index(output_dir, index_type, **index_params)
+        
+        print(f"保存完成，共保存了 {len(self)} 个嵌入向量")
+    
+    def build_index(self, output_dir: Optional[str] = None, index_type: Optional[str] = DEFAULT_INDEX_TYPE,
+                    **index_params) -> None:
+        """
+        建立近似最近邻索引，并报告相对暴力检索的recall@10
+        
+        Args:
+            output_dir: 索引保存目录，为None时只在内存中建立
+            index_type: 索引类型，'ivf'、'hnsw'，None或'none'表示不建索引
+            **index_params: 传给索引构建的参数
+        """
+        if output_dir:
+            remove_index(output_dir)
+        self.index = None
+        if not index_type or index_type == 'none' or len(self) == 0:
+            return
+        
+        try:
+            print(f"建立 {index_type} 索引...")
+            self.index = build_index(index_type, self.embeddings, **index_params)
+        except ImportError as e:
+            print(f"建立索引失败，将使用暴力检索: {str(e)}")
+            return
+        
+        if output_dir:
+            self.index.save(output_dir)
+        
+        # 用语料中的随机样本作查询，检查召回率
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(self), min(100, len(self)), replace=False)
+        recall = recall_at_k(self.index, self.embeddings, self.embeddings[np.sort(sample)], k=10)
+        print(f"{index_type} 索引 recall@10 = {recall:.3f}")
     
     @classmethod
-    def load_with_file_info(cls, input_dir: str, model_name: str = MODELNAME,
+    def load_with_file_info(cls, input_dir: str, model_name: Optional[str] = MODELNAME,
                            query_instruction: str = QUERYQUESTION,
                            use_fp16: bool = True) -> 'TextEmbedding':
         """
         从指定目录加载文本embedding和文件信息
         
+        优先以内存映射方式加载列式存储；目录中只有旧版pickle文件时回退到pickle加载，
+        可用 `python embed.py migrate <目录>` 一次性转换
+        
         Args:
             input_dir: 输入目录路径
-            model_name: 使用的模型名称
+            model_name: 使用的模型名称，为None时只读加载，不会导入或加载编码模型
             query_instruction: 检索指令
             use_fp16: 是否使用fp16精度
             
@@ -175,27 +934,104 @@ class TextEmbedding:
         print(f"从 {input_dir} 加载嵌入向量...")
         instance = cls(model_name, query_instruction, use_fp16)
         
+        if is_columnar_store(input_dir):
+            instance._load_columnar(input_dir)
+            print(f"已加载 {len(instance)} 个嵌入向量（内存映射）")
+            return instance
+        
+        print(f"未找到列式存储，尝试加载旧版pickle文件（建议运行 python embed.py migrate {input_dir}）")
+        
         # 加载embedding
+        text_embeddings = {}
         embeddings_path = os.path.join(input_dir, "embeddings.pkl")
         if os.path.exists(embeddings_path):
             with open(embeddings_path, 'rb') as f:
-                instance.text_embeddings = pickle.load(f)
-            print(f"已加载 {len(instance.text_embeddings)} 个嵌入向量")
+                text_embeddings = pickle.load(f)
+            print(f"已加载 {len(text_embeddings)} 个嵌入向量")
         else:
             print(f"未找到嵌入向量文件: {embeddings_path}")
         
         # 加载文件信息
+        file_info = {}
         file_info_path = os.path.join(input_dir, "file_info.pkl")
         if os.path.exists(file_info_path):
             with open(file_info_path, 'rb') as f:
-                instance.file_info = pickle.load(f)
-            print(f"已加载 {len(instance.file_info)} 个文件信息")
+                file_info = pickle.load(f)
+            print(f"已加载 {len(file_info)} 个文件信息")
         else:
             print(f"未找到文件信息文件: {file_info_path}")
         
+        instance._set_from_dicts(text_embeddings, file_info)
         return instance
     
-    def search_similar_texts(self, query: str, top_n: int = 5, min_similarity: float = 0.5) -> List[Tuple[str, float, Optional[str]]]:
+    def _load_columnar(self, input_dir: str) -> None:
+        """
+        以只读内存映射方式加载列式存储，写入时再按需转换为内存副本
+        
+        Args:
+            input_dir: 输入目录路径
+        """
+        self.embeddings = np.load(os.path.join(input_dir, VECTORS_FILE), mmap_mode='r')
+        self.dtype = self.embeddings.dtype
+        self.texts = _load_strings(os.path.join(input_dir, TEXTS_FILE),
+                                   os.path.join(input_dir, TEXT_OFFSETS_FILE))
+        self.file_names = _load_strings(os.path.join(input_dir, FILE_NAMES_FILE),
+                                        os.path.join(input_dir, FILE_NAME_OFFSETS_FILE),
+                                        empty_as_none=True)
+        self._text_index = None
+        self.index = load_index(input_dir, len(self))
+        self._persisted_dir = os.path.abspath(input_dir)
+        self._persisted_count = len(self)
+    
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        编码查询文本，先查缓存，未命中的查询合并为一次模型调用
+        
+        Args:
+            queries: 查询文本列表
+            
+        Returns:
+            与queries一一对应的查询向量矩阵
+        """
+        vectors: List[Optional[np.ndarray]] = [self.query_cache.get(query) for query in queries]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        
+        if missing:
+            print(f"计算 {len(missing)} 条查询文本的嵌入向量...")
+            encoded = np.asarray(self.model.encode([queries[i] for i in missing]), dtype=self.dtype)
+            if encoded.ndim == 1:
+                encoded = encoded.reshape(1, -1)
+            for i, vector in zip(missing, encoded):
+                self.query_cache.put(queries[i], vector)
+                vectors[i] = vector
+        
+        return np.stack([np.asarray(vector, dtype=self.dtype) for vector in vectors])
+    
+    def _format_results(self, ids: np.ndarray, scores: np.ndarray,
+                        min_similarity: float) -> List[Tuple[str, float, Optional[str]]]:
+        """
+        将按分数降序排列的(行号, 分数)转换为结果元组，并按阈值过滤
+        
+        Args:
+            ids: 行号数组
+            scores: 与ids对应的相似度分数
+            min_similarity: 最小相似度阈值
+            
+        Returns:
+            包含(文本, 相似度, 文件名)元组的列表，按相似度降序排列
+        """
+        results = []
+        for row, score in zip(ids, scores):
+            similarity = float(score)
+            if similarity < min_similarity:
+                break
+            row = int(row)
+            results.append((self.texts[row], similarity, self.file_names[row]))
+        return results
+
+    def search_similar_texts(self, query: str, top_n: int = 5, min_similarity: float = 0.5,
+                             nprobe: Optional[int] = None, ef: Optional[int] = None,
+                             exact: bool = False) -> List[Tuple[str, float, Optional[str]]]:
         """
         搜索与查询文本最相似的文本
         
@@ -203,33 +1039,110 @@ class TextEmbedding:
             query: 查询文本
             top_n: 返回的最相似文本数量
             min_similarity: 最小相似度阈值
+            nprobe: IVF索引探查的桶数量，越大召回率越高、越慢
+            ef: HNSW索引的候选队列长度，越大召回率越高、越慢
+            exact: 为True时忽略近似索引，做暴力检索
             
         Returns:
             包含(文本, 相似度, 文件名)元组的列表，按相似度降序排列
         """
-        if not self.text_embeddings:
-            return []
+        return self.search_many([query], top_n=top_n, min_similarity=min_similarity,
+                                nprobe=nprobe, ef=ef, exact=exact)[0]
+    
+    def search_many(self, queries: List[str], top_n: int = 5,
+                    min_similarity: float = 0.5, nprobe: Optional[int] = None,
+                    ef: Optional[int] = None,
+                    exact: bool = False) -> List[List[Tuple[str, float, Optional[str]]]]:
+        """
+        批量搜索，多条查询只做一次编码；无近似索引时只做一次矩阵乘法
         
-        print(f"计算查询文本 '{query}' 的嵌入向量...")
-        # 计算查询文本的embedding
-        query_embedding = self.model.encode([query])[0]
+        Args:
+            queries: 查询文本列表
+            top_n: 每条查询返回的最相似文本数量
+            min_similarity: 最小相似度阈值
+            nprobe: IVF索引探查的桶数量
+            ef: HNSW索引的候选队列长度
+            exact: 为True时忽略近似索引，做暴力检索
+            
+        Returns:
+            与queries一一对应的结果列表，每项格式同search_similar_texts
+        """
+        if len(self) == 0 or not queries:
+            return [[] for _ in queries]
         
-        # 计算相似度
-        print("计算相似度...")
-        similarities = []
-        for text, embedding in tqdm(self.text_embeddings.items(), desc="计算相似度"):
-            similarity = np.dot(query_embedding, embedding)
-            if similarity >= min_similarity:
-                file_name = self.file_info.get(text)
-                similarities.append((text, float(similarity), file_name))
+        query_embeddings = self.encode_queries(queries)
+        return self.search_by_vectors(query_embeddings, top_n=top_n, min_similarity=min_similarity,
+                                      nprobe=nprobe, ef=ef, exact=exact)
+    
+    def search_by_vectors(self, query_vectors: np.ndarray, top_n: int = 5,
+                          min_similarity: float = 0.5, nprobe: Optional[int] = None,
+                          ef: Optional[int] = None,
+                          exact: bool = False) -> List[List[Tuple[str, float, Optional[str]]]]:
+        """
+        用预先计算的查询向量检索，不需要编码模型，适合只读加载（model_name=None）的存储
         
-        # 按相似度降序排序
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        查询向量会被L2归一化，与BGE编码结果的余弦相似度口径一致
         
-        print(f"找到 {len(similarities)} 个相似度大于 {min_similarity} 的文本")
+        Args:
+            query_vectors: 查询向量矩阵 (Q, D)，单条查询可传一维向量 (D,)
+            top_n: 每条查询返回的最相似文本数量
+            min_similarity: 最小相似度阈值
+            nprobe: IVF索引探查的桶数量
+            ef: HNSW索引的候选队列长度
+            exact: 为True时忽略近似索引，做暴力检索
+            
+        Returns:
+            与查询向量一一对应的结果列表，每项格式同search_similar_texts
+            
+        Raises:
+            ValueError: 查询向量维度与存储不一致
+        """
+        query_vectors = np.asarray(query_vectors, dtype=self.dtype)
+        if query_vectors.ndim == 1:
+            query_vectors = query_vectors.reshape(1, -1)
+        if len(self) == 0 or len(query_vectors) == 0:
+            return [[] for _ in range(len(query_vectors))]
+        if query_vectors.ndim != 2 or query_vectors.shape[1] != self.embeddings.shape[1]:
+            raise ValueError(f"查询向量维度 {query_vectors.shape} 与存储的向量维度 {self.embeddings.shape[1]} 不一致")
         
-        # 返回前top_n个结果
-        return similarities[:top_n]
+        norms = np.linalg.norm(query_vectors.astype(np.float32), axis=1, keepdims=True)
+        query_vectors = (query_vectors / np.maximum(norms, 1e-12)).astype(self.dtype)
+        
+        if self.index is not None and not exact:
+            hits = self.index.search(self.embeddings, query_vectors, top_n, nprobe=nprobe, ef=ef)
+        else:
+            # (Q, D) x (D, N) -> (Q, N)，再用argpartition取top-k
+            hits = exact_search(self.embeddings, query_vectors, top_n)
+        
+        results = [self._format_results(ids, scores, min_similarity) for ids, scores in hits]
+        print(f"相似度计算完成，返回 {sum(len(r) for r in results)} 个结果")
+        return results
+    
+    def search_by_vector(self, query_vector: np.ndarray, top_n: int = 5,
+                         min_similarity: float = 0.5, nprobe: Optional[int] = None,
+                         ef: Optional[int] = None,
+                         exact: bool = False) -> List[Tuple[str, float, Optional[str]]]:
+        """
+        用单个预先计算的查询向量检索，参数同search_by_vectors
+        """
+        return self.search_by_vectors(np.asarray(query_vector).reshape(1, -1), top_n=top_n,
+                                      min_similarity=min_similarity, nprobe=nprobe, ef=ef,
+                                      exact=exact)[0]
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        返回存储的统计信息，不会加载编码模型
+        """
+        return {
+            "count": len(self),
+            "dim": int(self.embeddings.shape[1]) if self.embeddings.ndim == 2 else 0,
+            "dtype": str(self.dtype),
+            "files": len({name for name in self.file_names if name is not None}),
+            "memory_mapped": isinstance(self.embeddings, np.memmap),
+            "index": type(self.index).__name__ if self.index is not None else None,
+            "model_name": self.model_name,
+            "model_loaded": self.model_loaded,
+        }
     
     def save(self, file_path: str) -> None:
         """
@@ -239,16 +1152,17 @@ class TextEmbedding:
             file_path: 保存的文件路径
         """
         print(f"保存嵌入向量到 {file_path}...")
+        text_embeddings, file_info = self._to_dicts()
         data = {
-            'text_embeddings': self.text_embeddings,
-            'file_info': self.file_info
+            'text_embeddings': text_embeddings,
+            'file_info': file_info
         }
         with open(file_path, 'wb') as f:
             pickle.dump(data, f)
-        print(f"保存完成，共保存了 {len(self.text_embeddings)} 个嵌入向量")
+        print(f"保存完成，共保存了 {len(self)} 个嵌入向量")
     
     @classmethod
-    def load(cls, file_path: str, model_name: str = MODELNAME,
+    def load(cls, file_path: str, model_name: Optional[str] = MODELNAME,
              query_instruction: str = QUERYQUESTION,
              use_fp16: bool = True) -> 'TextEmbedding':
         """
@@ -256,7 +1170,7 @@ class TextEmbedding:
         
         Args:
             file_path: 加载的文件路径
-            model_name: 使用的模型名称
+            model_name: 使用的模型名称，为None时只读加载，不会导入或加载编码模型
             query_instruction: 检索指令
             use_fp16: 是否使用fp16精度
             
@@ -271,12 +1185,10 @@ class TextEmbedding:
                 data = pickle.load(f)
                 # 兼容旧版本的保存格式
                 if isinstance(data, dict) and 'text_embeddings' in data:
-                    instance.text_embeddings = data['text_embeddings']
-                    instance.file_info = data.get('file_info', {})
+                    instance._set_from_dicts(data['text_embeddings'], data.get('file_info', {}))
                 else:
-                    instance.text_embeddings = data
-                    instance.file_info = {}
-            print(f"加载完成，共加载了 {len(instance.text_embeddings)} 个嵌入向量")
+                    instance._set_from_dicts(data, {})
+            print(f"加载完成，共加载了 {len(instance)} 个嵌入向量")
         else:
             print(f"文件 {file_path} 不存在")
         
@@ -289,7 +1201,7 @@ class TextEmbedding:
         Returns:
             文本列表
         """
-        return list(self.text_embeddings.keys())
+        return list(self.texts)
     
     def get_file_info(self, text: str) -> Optional[str]:
         """
@@ -301,7 +1213,8 @@ class TextEmbedding:
         Returns:
             文本对应的文件信息，如果不存在则返回None
         """
-        return self.file_info.get(text)
+        row = self._get_text_index().get(text)
+        return self.file_names[row] if row is not None else None
     
     def get_embedding(self, text: str) -> Optional[np.ndarray]:
         """
@@ -313,18 +1226,64 @@ class TextEmbedding:
         Returns:
             文本对应的embedding，如果不存在则返回None
         """
-        return self.text_embeddings.get(text)
+        row = self._get_text_index().get(text)
+        return self.embeddings[row] if row is not None else None
+    
+    def _reset(self) -> None:
+        """
+        重置列式存储
+        """
+        self.texts = []
+        self.file_names = []
+        self.embeddings = np.zeros((0, 0), dtype=self.dtype)
+        self._text_index = {}
+        self.index = None
+        self._persisted_dir = None
+        self._persisted_count = 0
     
     def clear(self) -> None:
         """
         清空所有存储的文本与embedding对
         """
-        self.text_embeddings.clear()
-        self.file_info.clear()
+        self._reset()
         print("已清空所有文本和嵌入向量")
     
     def __len__(self) -> int:
         """
         返回存储的文本数量
         """
-        return len(self.text_embeddings)
\ No newline at end of file
+        return len(self.texts)
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='文本嵌入存储工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help='将旧版pickle存储转换为列式存储')
+    migrate_parser.add_argument('input_dir', help='包含embeddings.pkl和file_info.pkl的目录')
+    migrate_parser.add_argument('--output-dir', default=None, help='输出目录，默认与输入目录相同')
+    index_parser = subparsers.add_parser('index', help='为列式存储重建近似最近邻索引并报告recall@k')
+    index_parser.add_argument('input_dir', help='列式存储目录')
+    index_parser.add_argument('--type', default=DEFAULT_INDEX_TYPE, help='索引类型: ivf / hnsw / none')
+    index_parser.add_argument('--k', type=int, default=10, help='召回率评估的k')
+    index_parser.add_argument('--nprobe', type=int, default=None, help='评估时IVF探查的桶数量')
+    index_parser.add_argument('--ef', type=int, default=None, help='评估时HNSW的候选队列长度')
+    info_parser = subparsers.add_parser('info', help='只读加载存储并输出统计信息（不加载编码模型）')
+    info_parser.add_argument('input_dir', help='列式存储或旧版pickle存储目录')
+    args = parser.parse_args()
+    
+    if args.command == 'info':
+        store = TextEmbedding.load_with_file_info(args.input_dir, model_name=None)
+        print(json.dumps(store.stats(), ensure_ascii=False, indent=2))
+    elif args.command == 'migrate':
+        migrate_pickle_store(args.input_dir, args.output_dir)
+    elif args.command == 'index':
+        vectors = np.load(os.path.join(args.input_dir, VECTORS_FILE), mmap_mode='r')
+        remove_index(args.input_dir)
+        if args.type and args.type != 'none' and len(vectors) > 0:
+            index = build_index(args.type, vectors)
+            index.save(args.input_dir)
+            sample = np.sort(np.random.default_rng(0).choice(len(vectors), min(200, len(vectors)), replace=False))
+            recall = recall_at_k(index, vectors, vectors[sample], k=args.k, nprobe=args.nprobe, ef=args.ef)
+            print(f"{args.type} 索引已保存到 {args.input_dir}，recall@{args.k} = {recall:.3f}")
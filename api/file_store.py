@@ -0,0 +1,328 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import mimetypes
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# 允许通过 /api/files 访问的输出目录（相对于服务的工作目录）
+ALLOWED_FILE_PREFIXES = ("simulation_results/", "plot_results/")
+# 内容寻址文件的存放目录，必须位于上面的某个目录下
+CONTENT_DIR = os.getenv("CONTENT_DIR", "simulation_results/content")
+# 图像的返回方式：inline 在SSE/JSON中内联base64；url 只返回内容寻址的文件URL，由浏览器单独获取并缓存
+IMAGE_DELIVERY = os.getenv("IMAGE_DELIVERY", "inline")
+IMAGE_DELIVERY_MODES = ("inline", "url")
+
+FILES_URL_PREFIX = "/api/files/"
+# 内容寻址文件的文件名为内容哈希，内容永远不会改变
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# 输出目录的保留策略：总大小或未访问时长超出上限时，按最近访问时间淘汰最久未用的文件
+OUTPUT_CACHE_DIRS = tuple(d for d in os.getenv("OUTPUT_CACHE_DIRS", "simulation_results,plot_results").split(",") if d)
+OUTPUT_CACHE_MAX_MB = float(os.getenv("OUTPUT_CACHE_MAX_MB", "1024"))  # 0表示不限制大小
+OUTPUT_CACHE_MAX_AGE_DAYS = float(os.getenv("OUTPUT_CACHE_MAX_AGE_DAYS", "30"))  # 0表示不按时长淘汰
+OUTPUT_SWEEP_INTERVAL = float(os.getenv("OUTPUT_SWEEP_INTERVAL", "600"))  # 清理间隔（秒），0表示不启动后台清理
+
+_CONTENT_NAME_RE = re.compile(r"^([0-9a-f]{32})\.\w+$")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def store_content(data: bytes, ext: str = "png") -> str:
+    """
+    以内容哈希为文件名保存数据，相同内容只保存一份
+
+    Returns:
+        相对于工作目录的文件路径，可用content_url转换为URL
+    """
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    file_path = f"{CONTENT_DIR.rstrip('/')}/{digest}.{ext}"
+    if os.path.exists(file_path):
+        # 复用已有文件也算一次访问，避免被输出目录清理当作闲置文件删除
+        touch(file_path)
+        return file_path
+    write_atomic(file_path, data)
+    return file_path
+
+
+def write_atomic(file_path: str, data: bytes) -> None:
+    """先写临时文件再原子替换，并发写入同一文件时读者不会看到半个文件"""
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, file_path)
+
+
+def input_key(kind: str, inputs: Any) -> str:
+    """
+    由图类型和输入生成稳定的文件名哈希：相同输入总是得到同一个文件名
+
+    Args:
+        kind: 图类型，如"jv_curve"、"curve"
+        inputs: 可JSON序列化的输入（字典键顺序无关）
+    """
+    payload = json.dumps([kind, inputs], sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def touch(file_path: str) -> None:
+    """
+    记录一次访问：只更新访问时间，修改时间（ETag依赖它）保持不变
+
+    不依赖文件系统自动更新atime（relatime/noatime挂载下不可靠），由读取方显式设置
+    """
+    try:
+        stat = os.stat(file_path)
+        os.utime(file_path, ns=(time.time_ns(), stat.st_mtime_ns))
+    except OSError:
+        pass
+
+
+def content_url(file_path: str) -> str:
+    return FILES_URL_PREFIX + file_path.replace(os.sep, "/")
+
+
+def resolve_file(file_path: str) -> Optional[str]:
+    """
+    校验请求的文件路径，只允许访问输出目录内的文件（拒绝 ../ 等越界路径）
+
+    Returns:
+        规范化后的相对路径，不允许访问时返回None
+    """
+    normalized = os.path.normpath(file_path).replace(os.sep, "/")
+    if normalized.startswith("/") or normalized.startswith("../"):
+        return None
+    if not any(normalized.startswith(prefix) for prefix in ALLOWED_FILE_PREFIXES):
+        return None
+    return normalized
+
+
+def content_hash(file_path: str) -> Optional[str]:
+    """内容寻址文件返回其内容哈希，其他文件返回None"""
+    directory, name = os.path.split(file_path)
+    if os.path.normpath(directory) != os.path.normpath(CONTENT_DIR):
+        return None
+    match = _CONTENT_NAME_RE.match(name)
+    return match.group(1) if match else None
+
+
+def file_etag(file_path: str, stat: os.stat_result) -> str:
+    digest = content_hash(file_path)
+    if digest:
+        return f'"{digest}"'
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def cache_control(file_path: str) -> str:
+    # 带时间戳命名的文件内容也不会变，但路径不含哈希，仍让浏览器用ETag重新验证
+    return IMMUTABLE_CACHE_CONTROL if content_hash(file_path) else "no-cache"
+
+
+def media_type(file_path: str) -> str:
+    return mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """判断If-None-Match/If-Range请求头是否与ETag匹配（弱比较）"""
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段Range请求头
+
+    Returns:
+        (起始字节, 结束字节)，闭区间；格式不支持（如多段）时返回None，按完整文件响应
+
+    Raises:
+        ValueError: 范围超出文件大小，应返回416
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    if size == 0:
+        # 空文件没有任何可满足的范围
+        raise ValueError(f"无效的范围: {header}")
+    start, end = match.groups()
+    if start == "":
+        # bytes=-N 表示最后N个字节
+        length = int(end)
+        if length == 0:
+            raise ValueError(f"无效的范围: {header}")
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError(f"无效的范围: {header}")
+    return start, end
+
+
+def read_range(file_path: str, start: int, end: int) -> bytes:
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start + 1)
+
+
+class OutputCache:
+    """
+    以输入哈希命名的输出文件缓存：相同输入的图像直接从磁盘读取，不再重新渲染；
+    后台清理按最近访问时间（LRU）淘汰文件，使输出目录的总大小和文件存活时长保持在上限内
+    """
+
+    def __init__(self, directories: Tuple[str, ...] = OUTPUT_CACHE_DIRS,
+                 max_bytes: Optional[int] = int(OUTPUT_CACHE_MAX_MB * 1024 * 1024),
+                 max_age: Optional[float] = OUTPUT_CACHE_MAX_AGE_DAYS * 86400):
+        """
+        Args:
+            directories: 受保留策略管理的目录（递归）
+            max_bytes: 总大小上限（字节），None或0表示不限制
+            max_age: 距最近一次访问的最长保留时间（秒），None或0表示不限制
+        """
+        self.directories = directories
+        self.max_bytes = max_bytes or None
+        self.max_age = max_age or None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.files = 0
+        self.bytes = 0
+        self.last_sweep: Optional[float] = None
+
+    @staticmethod
+    def path(directory: str, prefix: str, key: str, ext: str = "png") -> str:
+        return os.path.join(directory, f"{prefix}_{key}.{ext}")
+
+    def get(self, file_path: str) -> Optional[bytes]:
+        """读取已渲染的文件并记录访问，不存在时返回None"""
+        found = self.get_many([file_path])
+        return found[0] if found else None
+
+    def get_many(self, file_paths: List[str]) -> Optional[List[bytes]]:
+        """一次渲染产生多个文件时使用：全部存在才算命中，否则返回None"""
+        try:
+            contents = []
+            for file_path in file_paths:
+                with open(file_path, "rb") as f:
+                    contents.append(f.read())
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        for file_path in file_paths:
+            touch(file_path)
+        with self._lock:
+            self.hits += 1
+        return contents
+
+    def put(self, file_path: str, data: bytes) -> str:
+        """保存渲染结果，返回文件路径"""
+        existed = os.path.exists(file_path)
+        write_atomic(file_path, data)
+        with self._lock:
+            self.writes += 1
+            if not existed:
+                self.files += 1
+                self.bytes += len(data)
+        return file_path
+
+    def _scan(self) -> List[Tuple[float, int, str]]:
+        """列出受管理的文件：(最近访问时间, 大小, 路径)"""
+        entries = []
+        for directory in self.directories:
+            for root, _, names in os.walk(directory):
+                for name in names:
+                    if name.endswith(".tmp"):
+                        continue  # 正在写入的临时文件
+                    file_path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(file_path)
+                    except OSError:
+                        continue
+                    entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, file_path))
+        return entries
+
+    def sweep(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        执行一次清理：先删除超过保留时长未访问的文件，总大小仍超限时从最久未访问的文件开始删除
+
+        Returns:
+            本次删除的文件数和字节数
+        """
+        now = time.time() if now is None else now
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        removed = removed_bytes = 0
+        kept = len(entries)
+        for accessed, size, file_path in entries:
+            expired = self.max_age is not None and now - accessed > self.max_age
+            oversize = self.max_bytes is not None and total > self.max_bytes
+            if not (expired or oversize):
+                break
+            try:
+                os.remove(file_path)
+            except OSError:
+                continue
+            total -= size
+            kept -= 1
+            removed += 1
+            removed_bytes += size
+        with self._lock:
+            self.evictions += removed
+            self.evicted_bytes += removed_bytes
+            self.files = kept
+            self.bytes = total
+            self.last_sweep = now
+        if removed:
+            logger.info(f"输出目录清理：删除 {removed} 个文件，释放 {removed_bytes / 1024 / 1024:.1f} MB")
+        return {"removed": removed, "removed_bytes": removed_bytes}
+
+    def start_sweeper(self, interval: float = OUTPUT_SWEEP_INTERVAL) -> threading.Thread:
+        """在后台线程中立即清理一次，之后每隔interval秒清理一次"""
+        def run():
+            while True:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.warning(f"输出目录清理失败: {e}")
+                if self._stop.wait(interval):
+                    return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="output-sweeper", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "directories": list(self.directories),
+                "files": self.files,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "max_age_seconds": self.max_age,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "last_sweep": self.last_sweep,
+            }
@@ -1,22 +1,34 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse, Response
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Tuple, Any
-from openai import OpenAI
+from openai import AsyncOpenAI
+import httpx
 import os
 from dotenv import load_dotenv
-from datetime import datetime
-import uuid
 import json
 import asyncio
+import time
 from starlette.background import BackgroundTask
 import base64
 import io
-from matplotlib.figure import Figure
+import pandas as pd
 import logging
 from fastapi.staticfiles import StaticFiles
-from mlutil import predict_solar_params
+from mlutil import (
+    predict_batch, prediction_cache, render_cache, render_jv_curve_png, render_sweep_png, jv_curve_data,
+    PredictionBatcher, grid_points, latin_hypercube, check_sweep_params, build_sweep_inputs, summarize_sweep,
+    feature_name,
+)
+from workers import WorkerPool, PoolSaturated, server_timing
+from model_registry import registry, MODEL_WARMUP
+from conversation_store import create_conversation_store
+from context_window import build_context, compact_tool_result
+from file_store import (
+    IMAGE_DELIVERY, IMAGE_DELIVERY_MODES, store_content, content_url, resolve_file, file_etag, cache_control,
+    media_type, etag_matches, parse_range, read_range, touch,
+)
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -25,9 +37,7 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 # MCP客户端相关导入
-from contextlib import AsyncExitStack
-from mcp import ClientSession
-from mcp.client.sse import sse_client
+from mcp_pool import MCPSessionPool, ToolSchemaCache, MCP_INTERNAL_TOOLS
 
 # 加载环境变量
 load_dotenv()
@@ -45,120 +55,99 @@ app.add_middleware(
 
 # 添加静态文件服务
 @app.get("/api/files/{file_path:path}")
-async def get_file(file_path: str):
-    """提供对生成的图表和文件的访问"""
+async def get_file(file_path: str, request: Request):
+    """提供对生成的图表和文件的访问，支持ETag条件请求和Range分段请求"""
     try:
         # 设置安全限制，只允许访问指定目录
-        allowed_prefixes = ["simulation_results/", "plot_results/"]
-        is_allowed = any(file_path.startswith(prefix) for prefix in allowed_prefixes)
-        
-        if not is_allowed:
+        file_full_path = resolve_file(file_path)
+        if file_full_path is None:
             raise HTTPException(status_code=403, detail="Access forbidden")
         
-        # 构建文件的完整路径
-        file_full_path = file_path
-        
         # 检查文件是否存在
-        if not os.path.exists(file_full_path):
+        try:
+            stat = os.stat(file_full_path)
+        except FileNotFoundError:
             raise HTTPException(status_code=404, detail=f"File {file_path} not found")
+        # 记录访问时间（不改变修改时间和ETag），输出目录按最近访问时间清理
+        touch(file_full_path)
+        
+        # 内容寻址文件可被浏览器永久缓存，其他文件用ETag重新验证
+        etag = file_etag(file_full_path, stat)
+        headers = {"ETag": etag, "Cache-Control": cache_control(file_full_path), "Accept-Ranges": "bytes"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        
+        # If-Range与当前版本不一致时忽略Range，返回完整文件
+        range_header = request.headers.get("range")
+        if range_header and (not request.headers.get("if-range") or etag_matches(request.headers.get("if-range"), etag)):
+            try:
+                byte_range = parse_range(range_header, stat.st_size)
+            except ValueError as e:
+                raise HTTPException(status_code=416, detail=str(e), headers={"Content-Range": f"bytes */{stat.st_size}"})
+            if byte_range is not None:
+                start, end = byte_range
+                data = await asyncio.to_thread(read_range, file_full_path, start, end)
+                headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+                return Response(content=data, status_code=206, media_type=media_type(file_full_path), headers=headers)
         
         # 返回文件
-        return FileResponse(
-            file_full_path,
-            media_type="image/png" if file_path.endswith(".png") else "application/octet-stream"
-        )
+        return FileResponse(file_full_path, media_type=media_type(file_full_path), headers=headers)
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
         logger.info(f"获取文件时出错: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error serving file: {str(e)}")
 
-# 初始化 OpenAI 客户端
-client = OpenAI(
+# LLM连接池配置：所有会话共享同一个异步HTTP客户端，复用keep-alive连接
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))  # 两个流式分块之间的最长等待时间
+
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    ),
+    timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+)
+
+# 初始化 OpenAI 异步客户端，流式读取不会阻塞事件循环
+client = AsyncOpenAI(
     api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
+    base_url="https://api.deepseek.com",
+    http_client=http_client
 )
 
-# 内存存储对话历史
-conversations: Dict[str, dict] = {}
+# 对话历史：默认持久化到SQLite（CONVERSATION_STORE / CONVERSATION_DB），内存中只保留活跃会话
+conversation_store = create_conversation_store()
 
 # MCP服务器地址
 MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://localhost:12346/sse")
+# 预测后端：mcp 转发到MCP服务器（本进程不加载模型）；local 在本进程加载模型；
+# auto 已连接MCP服务器时转发，否则在本地预测
+PREDICTION_BACKEND = os.getenv("PREDICTION_BACKEND", "auto")
 
-# MCP客户端类
-class MCPClient:
-    def __init__(self):
-        # 初始化会话和流对象
-        self.session: Optional[ClientSession] = None
-        self._streams_context = None
-        self._session_context = None
-        
-    async def connect(self, server_url: str = MCP_SERVER_URL):
-        """连接到MCP服务器"""
-        try:
-            # 使用SSE客户端连接到服务器
-            self._streams_context = sse_client(url=server_url)
-            streams = await self._streams_context.__aenter__()
-            
-            # 创建会话
-            self._session_context = ClientSession(*streams)
-            self.session = await self._session_context.__aenter__()
-            
-            # 初始化
-            await self.session.initialize()
-            
-            # 列出可用工具，验证连接
-            response = await self.session.list_tools()
-            tool_names = [tool.name for tool in response.tools]
-            logger.info(f"已连接到MCP服务器，可用工具: {tool_names}")
-            return True
-        except Exception as e:
-            logger.info(f"连接MCP服务器失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return False
-            
-    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]):
-        """调用MCP工具"""
-        if not self.session:
-            raise ValueError("MCP会话未初始化，请先调用connect()")
-        
-        try:
-            result = await self.session.call_tool(tool_name, arguments)
-            return result
-        except Exception as e:
-            logger.info(f"调用MCP工具 {tool_name} 失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            raise
-
-    async def list_tools(self):
-        """获取可用工具列表"""
-        if not self.session:
-            raise ValueError("MCP会话未初始化，请先调用connect()")
-        
-        try:
-            response = await self.session.list_tools()
-            return response.tools
-        except Exception as e:
-            logger.info(f"获取工具列表失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            raise
-            
-    async def cleanup(self):
-        """清理会话和连接"""
-        try:
-            if self._session_context:
-                await self._session_context.__aexit__(None, None, None)
-            if self._streams_context:
-                await self._streams_context.__aexit__(None, None, None)
-            logger.info("已断开MCP连接")
-        except Exception as e:
-            logger.info(f"清理MCP连接失败: {str(e)}")
+# 全局MCP会话池：多个会话并行执行不同对话的工具调用，断开后自动重连
+mcp_client = MCPSessionPool(MCP_SERVER_URL)
 
-# 全局MCP客户端实例
-mcp_client = MCPClient()
+def openai_tool(tool) -> Dict[str, Any]:
+    """将MCP工具定义转换为OpenAI的function calling格式"""
+    return {
+        "type": "function",
+        "function": {
+            "name": tool.name,
+            "description": tool.description,
+            "parameters": tool.inputSchema
+        }
+    }
+
+# 转换后的工具列表缓存，MCP重连或工具列表变化时失效
+tool_schema_cache = ToolSchemaCache(mcp_client, convert=openai_tool)
+# 模型在一轮中请求多个工具调用时，最多同时执行的数量
+TOOL_CALL_CONCURRENCY = int(os.getenv("TOOL_CALL_CONCURRENCY", "4"))
 
 # 在应用启动时连接MCP服务器
 @app.on_event("startup")
@@ -166,21 +155,31 @@ async def startup_event():
     global mcp_client
     try:
         # 连接到MCP服务器
-        connected = await mcp_client.connect()
+        connected = await mcp_client.start()
         if connected:
             logger.info(f"成功连接到MCP服务器: {MCP_SERVER_URL}")
+            # 预先获取工具列表，第一条消息不必再等待
+            tools = await tool_schema_cache.get()
+            logger.info(f"MCP服务器可用工具: {[tool['function']['name'] for tool in tools]}")
         else:
-            logger.info(f"警告: 无法连接到MCP服务器: {MCP_SERVER_URL}，将使用本地功能")
+            logger.info(f"警告: 无法连接到MCP服务器: {MCP_SERVER_URL}，将使用本地功能并在后台持续重连")
     except Exception as e:
         logger.info(f"MCP连接初始化失败: {str(e)}")
         import traceback
         traceback.print_exc()
+    
+    # 需要本地预测时在后台预加载模型，不阻塞端口开放
+    if not use_remote_prediction() and MODEL_WARMUP:
+        registry.warm_up()
 
 # 在应用关闭时断开MCP连接
 @app.on_event("shutdown")
 async def shutdown_event():
     global mcp_client
-    await mcp_client.cleanup()
+    await mcp_client.close()
+    await client.close()
+    await conversation_store.close()
+    prediction_pool.shutdown()
 
 class Message(BaseModel):
     role: str
@@ -192,6 +191,7 @@ class ChatRequest(BaseModel):
     messages: List[Message]
     conversation_id: str = None
     model: str = "deepseek-chat"  # 默认使用 deepseek-chat
+    image_mode: Optional[str] = None  # inline 或 url，默认由 IMAGE_DELIVERY 决定
 
 class Conversation(BaseModel):
     id: str
@@ -199,26 +199,94 @@ class Conversation(BaseModel):
     created_at: str
     messages: List[Message]
 
+def tool_result_content(result) -> Tuple[str, list]:
+    """
+    从MCP工具返回结果中提取文本和图像
+
+    Returns:
+        Tuple[str, list]: 结果文本，以及图像对象列表（有data和format属性）
+    """
+    # 处理不同类型的工具返回结果
+    if isinstance(result.content, list) and all(hasattr(item, 'text') for item in result.content):
+        # 如果是TextContent对象列表，提取所有text属性并合并
+        result_content = " ".join(item.text for item in result.content)
+    elif hasattr(result.content, 'text'):
+        # 单个TextContent对象
+        text_content = result.content.text
+        
+        # 将字典或列表转换为字符串
+        if isinstance(text_content, dict) or isinstance(text_content, list):
+            result_content = json.dumps(text_content, ensure_ascii=False)
+        else:
+            result_content = str(text_content)
+    else:
+        # 其他情况尝试JSON序列化
+        result_content = json.dumps(result.content) if not isinstance(result.content, str) else str(result.content)
+    
+    # 检查是否有图像结果
+    images = list(result.content.image) if hasattr(result.content, 'image') else []
+    if images:
+        # 添加图像信息到结果
+        result_content += "\n(结果包含图像数据)"
+    return result_content, images
+
+async def execute_tool_call(tool_name: str, arguments: Dict[str, Any]) -> Tuple[str, list, bool]:
+    """
+    执行一个MCP工具调用，失败时把错误信息作为结果返回，保证每个工具调用都有对应的tool消息
+
+    Returns:
+        Tuple[str, list, bool]: 结果文本、图像列表、是否失败
+    """
+    if tool_name in MCP_INTERNAL_TOOLS:
+        error_msg = f"工具 {tool_name} 调用失败: 该工具仅供内部使用"
+        logger.info(error_msg)
+        return error_msg, [], True
+    if not mcp_client.connected:
+        error_msg = f"工具 {tool_name} 调用失败: MCP服务器未连接"
+        logger.info(error_msg)
+        return error_msg, [], True
+    try:
+        result = await mcp_client.call_tool(tool_name, arguments)
+        # 记录工具返回结果的类型，便于调试
+        logger.info(f"工具 {tool_name} 返回结果类型: {type(result.content).__name__}")
+        result_content, images = tool_result_content(result)
+        logger.info(f"工具 {tool_name} 调用成功")
+        return result_content, images, False
+    except Exception as e:
+        error_msg = f"工具 {tool_name} 调用失败: {str(e)}"
+        logger.info(error_msg)
+        return error_msg, [], True
+
+async def image_event_content(img, image_mode: str) -> Dict[str, Any]:
+    """
+    图像事件的内容：inline模式内联base64；url模式保存为内容寻址文件，只发送URL
+    """
+    image_format = img.format if getattr(img, 'format', None) else 'png'
+    if image_mode == "url":
+        file_path = await asyncio.to_thread(store_content, img.data, image_format)
+        return {'image_url': content_url(file_path), 'format': image_format}
+    return {'image_data': base64.b64encode(img.data).decode('utf-8'), 'format': image_format}
+
+def tool_result_summary(tool_name: str, result_content: str, failed: bool) -> str:
+    """工具结果的简短摘要，用于前端上下文显示"""
+    if failed or len(result_content) <= 200:
+        return result_content
+    return f"工具 {tool_name} 返回结果: {result_content[:200]}..."
+
 async def generate_stream_response(chat_request: ChatRequest, disconnect_event: asyncio.Event):
     try:
         logger.info(f"开始处理请求，模型: {chat_request.model}")
         
+        image_mode = chat_request.image_mode or IMAGE_DELIVERY
+        
         # 准备OpenAI消息格式
         openai_messages = [{"role": msg.role, "content": msg.content} for msg in chat_request.messages]
         
         # 获取MCP工具列表
         available_tools = []
-        if mcp_client.session:
+        if mcp_client.connected:
             try:
-                tools = await mcp_client.list_tools()
-                available_tools = [{ 
-                    "type": "function",
-                    "function": {
-                        "name": tool.name,
-                        "description": tool.description,
-                        "parameters": tool.inputSchema
-                    }
-                } for tool in tools]
+                available_tools = await tool_schema_cache.get()
                 logger.info(f"为模型提供了 {len(available_tools)} 个可用工具")
             except Exception as e:
                 logger.info(f"获取工具列表失败: {str(e)}")
@@ -237,20 +305,28 @@ async def generate_stream_response(chat_request: ChatRequest, disconnect_event:
         
         while True:
             try:
+                # 按token预算裁剪历史，只发送预算内的消息
+                request_tools = available_tools if is_first_response and available_tools else None
+                request_messages, context_stats = build_context(openai_messages, tools=request_tools)
+                logger.info(f"发送上下文: 约 {context_stats['prompt_tokens']} tokens"
+                            f"（完整历史约 {context_stats['original_tokens']} tokens，"
+                            f"省略 {context_stats['dropped_messages']} 条消息）")
+                yield f"data: {json.dumps({'type': 'usage', 'content': context_stats})}\n\n"
+                
                 # 初始API调用或后续调用
                 if is_first_response:
                     # 首次调用，可能使用工具
-                    response = client.chat.completions.create(
+                    response = await client.chat.completions.create(
                         model=chat_request.model,
-                        messages=openai_messages,
-                        tools=available_tools if available_tools else None,
+                        messages=request_messages,
+                        tools=request_tools,
                         stream=True
                     )
                 else:
                     # 后续调用，无需再次提供工具列表
-                    response = client.chat.completions.create(
+                    response = await client.chat.completions.create(
                         model=chat_request.model,
-                        messages=openai_messages,
+                        messages=request_messages,
                         stream=True
                     )
                 
@@ -258,10 +334,12 @@ async def generate_stream_response(chat_request: ChatRequest, disconnect_event:
                 current_content = ""
                 has_tool_calls = False
                 
-                for chunk in response:
+                async for chunk in response:
                     # 检查客户端是否断开连接
                     if disconnect_event.is_set():
                         logger.info("检测到客户端断开连接，停止生成")
+                        # 关闭上游流，释放连接回连接池
+                        await response.close()
                         break
                     
                     delta = chunk.choices[0].delta
@@ -334,8 +412,9 @@ async def generate_stream_response(chat_request: ChatRequest, disconnect_event:
                     # 将当前助手消息添加到历史
                     openai_messages.append(assistant_message)
                     
-                    # 处理所有累积的工具调用
-                    for idx, tool_info in accumulated_tool_calls.items():
+                    # 解析所有累积的工具调用，保持模型给出的顺序
+                    pending_calls = []  # (tool_call_id, 工具名, 参数)
+                    for idx, tool_info in sorted(accumulated_tool_calls.items()):
                         # 验证是否有足够的信息
                         if not tool_info['id'] or not tool_info['name']:
                             logger.info(f"工具调用信息不完整，跳过: {tool_info}")
@@ -361,93 +440,66 @@ async def generate_stream_response(chat_request: ChatRequest, disconnect_event:
                                 "arguments": arguments_str
                             }
                         })
+                        pending_calls.append((tool_info['id'], tool_name, arguments))
+                    
+                    # 并发执行互不依赖的工具调用（最多TOOL_CALL_CONCURRENCY个同时进行），
+                    # 每个调用完成后立即把结果和图像推送给前端
+                    limit = asyncio.Semaphore(TOOL_CALL_CONCURRENCY)
+                    
+                    async def run_tool_call(index: int, tool_name: str, arguments: Dict[str, Any]):
+                        async with limit:
+                            return (index,) + await execute_tool_call(tool_name, arguments)
+                    
+                    outcomes: List[Optional[Tuple[str, bool]]] = [None] * len(pending_calls)
+                    tasks = [asyncio.ensure_future(run_tool_call(i, tool_name, arguments))
+                             for i, (_, tool_name, arguments) in enumerate(pending_calls)]
+                    try:
+                        for next_done in asyncio.as_completed(tasks):
+                            index, result_content, images, failed = await next_done
+                            outcomes[index] = (result_content, failed)
+                            tool_name = pending_calls[index][1]
+                            
+                            # 单独发送图像数据，但不将其添加到消息历史中
+                            for i, img in enumerate(images):
+                                try:
+                                    image_data = {
+                                        'type': 'image', 
+                                        'content': await image_event_content(img, image_mode)
+                                    }
+                                    image_data['content'].update({'tool_name': tool_name, 'image_index': i})
+                                    yield f"data: {json.dumps(image_data)}\n\n"
+                                    logger.info(f"发送工具 {tool_name} 的图像数据 #{i}")
+                                except Exception as e:
+                                    logger.info(f"处理图像数据时出错: {str(e)}")
+                            
+                            tool_event = {
+                                'type': 'tool_result',
+                                'content': {
+                                    'tool_name': tool_name,
+                                    'index': index,
+                                    'error': failed,
+                                    'summary': tool_result_summary(tool_name, result_content, failed)
+                                }
+                            }
+                            yield f"data: {json.dumps(tool_event)}\n\n"
+                    finally:
+                        # 客户端断开时取消尚未完成的调用
+                        for task in tasks:
+                            task.cancel()
+                    
+                    # 按工具调用的原始顺序把结果添加到历史记录中，过长的结果（如批量仿真的结果表）先压缩
+                    for (tool_call_id, tool_name, _), (result_content, failed) in zip(pending_calls, outcomes):
+                        openai_messages.append({
+                            "role": "tool",
+                            "tool_call_id": tool_call_id,
+                            "content": compact_tool_result(result_content)
+                        })
                         
-                        # 执行工具调用
-                        if mcp_client.session:
-                            try:
-                                result = await mcp_client.call_tool(tool_name, arguments)
-                                
-                                # 处理结果内容
-                                result_content = ""
-                                
-                                # 处理不同类型的工具返回结果
-                                if isinstance(result.content, list) and all(hasattr(item, 'text') for item in result.content):
-                                    # 如果是TextContent对象列表，提取所有text属性并合并
-                                    result_content = " ".join(item.text for item in result.content)
-                                elif hasattr(result.content, 'text'):
-                                    # 单个TextContent对象
-                                    text_content = result.content.text
-                                    
-                                    # 将字典或列表转换为字符串
-                                    if isinstance(text_content, dict) or isinstance(text_content, list):
-                                        result_content = json.dumps(text_content, ensure_ascii=False)
-                                    else:
-                                        result_content = str(text_content)
-                                else:
-                                    # 其他情况尝试JSON序列化
-                                    result_content = json.dumps(result.content) if not isinstance(result.content, str) else str(result.content)
-                                
-                                # 记录工具返回结果的类型，便于调试
-                                logger.info(f"工具 {tool_name} 返回结果类型: {type(result.content).__name__}")
-                                
-                                # 检查是否有图像结果
-                                has_images = hasattr(result.content, 'image') and len(result.content.image) > 0
-                                if has_images:
-                                    # 添加图像信息到结果
-                                    result_content += "\n(结果包含图像数据)"
-                                    
-                                    # 单独处理图像数据，发送给前端
-                                    for i, img in enumerate(result.content.image):
-                                        try:
-                                            # 转换为base64编码
-                                            img_base64 = base64.b64encode(img.data).decode('utf-8')
-                                            
-                                            # 发送图像数据，但不将其添加到消息历史中
-                                            image_data = {
-                                                'type': 'image', 
-                                                'content': {
-                                                    'tool_name': tool_name,
-                                                    'image_data': img_base64,
-                                                    'image_index': i,
-                                                    'format': img.format if hasattr(img, 'format') else 'png'
-                                                }
-                                            }
-                                            yield f"data: {json.dumps(image_data)}\n\n"
-                                            logger.info(f"发送工具 {tool_name} 的图像数据 #{i}")
-                                        except Exception as e:
-                                            logger.info(f"处理图像数据时出错: {str(e)}")
-                                
-                                # 将工具调用结果添加到历史记录中
-                                openai_messages.append({
-                                    "role": "tool",
-                                    "tool_call_id": tool_info['id'],
-                                    "content": result_content
-                                })
-                                
-                                # 记录工具结果，用于上下文显示
-                                tool_results.append({
-                                    "call": tool_name,
-                                    "summary": f"工具 {tool_name} 返回结果: {result_content[:200]}..." if len(result_content) > 200 else result_content
-                                })
-                                
-                                logger.info(f"工具 {tool_name} 调用成功")
-                                
-                            except Exception as e:
-                                error_msg = f"工具 {tool_name} 调用失败: {str(e)}"
-                                logger.info(error_msg)
-                                
-                                # 添加错误信息
-                                openai_messages.append({
-                                    "role": "tool",
-                                    "tool_call_id": tool_info['id'],
-                                    "content": error_msg
-                                })
-                                
-                                # 记录错误结果
-                                tool_results.append({
-                                    "call": tool_name,
-                                    "summary": error_msg
-                                })
+                        # 记录工具结果，用于上下文显示
+                        tool_results.append({
+                            "call": tool_name,
+                            "summary": tool_result_summary(tool_name, result_content, failed)
+                        })
                     
                     # 添加工具调用信息到助手消息
                     if tool_calls:
@@ -478,7 +530,7 @@ async def generate_stream_response(chat_request: ChatRequest, disconnect_event:
         yield f"data: {json.dumps({'type': 'done', 'content': ''})}\n\n"
 
         # 保存完整的消息到对话历史
-        if chat_request.conversation_id in conversations:
+        if await conversation_store.exists(chat_request.conversation_id):
             # 如果是中断的消息，添加标记
             if disconnect_event.is_set():
                 if full_content:
@@ -495,14 +547,15 @@ async def generate_stream_response(chat_request: ChatRequest, disconnect_event:
             }
             
             # 更新对话历史
-            conversations[chat_request.conversation_id]["messages"].append(user_message)
-            conversations[chat_request.conversation_id]["messages"].append(assistant_message)
+            conversation = await conversation_store.append_messages(
+                chat_request.conversation_id, [user_message, assistant_message]
+            )
             
             # 如果是新对话的第一条消息，用它来命名对话
-            if len(conversations[chat_request.conversation_id]["messages"]) == 3:  # 包含欢迎消息、用户消息和助手回复
+            if len(conversation["messages"]) == 3:  # 包含欢迎消息、用户消息和助手回复
                 first_user_message = chat_request.messages[-1].content
                 title = first_user_message[:20] + ("..." if len(first_user_message) > 20 else "")
-                conversations[chat_request.conversation_id]["title"] = title
+                await conversation_store.set_title(chat_request.conversation_id, title)
 
     except Exception as e:
         error_msg = f"生成响应时出错: {str(e)}"
@@ -513,29 +566,43 @@ async def generate_stream_response(chat_request: ChatRequest, disconnect_event:
 
 @app.post("/api/chat/create")
 async def create_conversation():
-    conversation_id = str(uuid.uuid4())
-    conversations[conversation_id] = {
-        "id": conversation_id,
-        "title": "新对话",
-        "created_at": datetime.now().isoformat(),
-        "messages": [
+    return await conversation_store.create(
+        title="新对话",
+        messages=[
             {
                 "role": "system",
                 "content": "欢迎讨论太阳能电池相关的问题"
             }
         ]
-    }
-    return conversations[conversation_id]
+    )
 
 @app.get("/api/chat/history")
 async def get_history():
-    return list(conversations.values())
+    """返回全部会话及其消息（数据量随使用增长，侧边栏应改用 /api/chat/conversations 分页获取）"""
+    return await conversation_store.list_conversations()
+
+@app.get("/api/chat/conversations")
+async def list_conversations(limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None):
+    """按创建时间倒序分页返回会话摘要：id、标题、创建时间、消息数"""
+    try:
+        return await conversation_store.list_summaries(limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/chat/{conversation_id}/messages")
+async def get_conversation_messages(conversation_id: str, before: Optional[int] = Query(None, ge=0),
+                                    limit: int = Query(50, ge=1, le=500)):
+    """返回序号小于before的最后limit条消息；用响应中的next_before继续向前翻页"""
+    page = await conversation_store.get_messages(conversation_id, before=before, limit=limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail=f"会话 {conversation_id} 不存在")
+    return page
 
 @app.post("/api/chat/send")
 async def send_message(chat_request: ChatRequest, request: Request):
     try:
         # 如果没有会话ID，创建新会话
-        if not chat_request.conversation_id or chat_request.conversation_id not in conversations:
+        if not await conversation_store.exists(chat_request.conversation_id):
             conversation = await create_conversation()
             chat_request.conversation_id = conversation["id"]
         
@@ -585,7 +652,18 @@ async def get_models():
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "ok"} 
+    remote = use_remote_prediction()
+    return {
+        "status": "ok",
+        # 转发到MCP服务器时以连接状态为准，本地预测时以模型是否加载完成为准
+        "ready": mcp_client.connected if remote else registry.ready,
+        "prediction_backend": "mcp" if remote else "local",
+        "mcp_connected": mcp_client.connected,
+        "mcp_pool": mcp_client.stats(),
+        "mcp_tools": tool_schema_cache.stats(),
+        "models": registry.status(),
+        "conversations": conversation_store.stats()
+    }
 
 # 太阳能电池参数模型
 class SolarParams(BaseModel):
@@ -623,45 +701,207 @@ async def get_default_params():
     }
     return default_params
 
+def solar_params_to_dict(params: SolarParams) -> Dict[str, float]:
+    """将请求参数转换为模型特征名的字典"""
+    return {
+        'Si_thk': params.Si_thk,
+        't_SiO2': params.t_SiO2, 
+        't_polySi_rear_P': params.t_polySi_rear_P,
+        'front_junc': params.front_junc,
+        'rear_junc': params.rear_junc,
+        'resist_rear': params.resist_rear,
+        'Nd_top': params.Nd_top,
+        'Nd_rear': params.Nd_rear,
+        'Nt_polySi_top': params.Nt_polySi_top,
+        'Nt_polySi_rear': params.Nt_polySi_rear,
+        'Dit Si-SiOx': params.Dit_Si_SiOx,
+        'Dit SiOx-Poly': params.Dit_SiOx_Poly,
+        'Dit top': params.Dit_top
+    }
+
+# 预测和渲染在独立的工作池中执行，不阻塞事件循环；池满时返回429
+prediction_pool = WorkerPool()
+# 并发到达的单组参数预测合并为一次批量预测
+prediction_batcher = PredictionBatcher(pool=prediction_pool)
+
+def use_remote_prediction() -> bool:
+    """是否把预测转发到MCP服务器，而不在本进程加载模型"""
+    return PREDICTION_BACKEND == "mcp" or (PREDICTION_BACKEND == "auto" and mcp_client.connected)
+
+async def predict_rows_remote(rows: List[Dict[str, float]]) -> List[Dict[str, float]]:
+    """通过MCP服务器的predict_rows工具批量预测"""
+    result = await mcp_client.call_tool("predict_rows", {"rows": rows})
+    text = " ".join(item.text for item in result.content if hasattr(item, 'text'))
+    if result.isError:
+        raise RuntimeError(f"MCP服务器预测失败: {text}")
+    return json.loads(text)["text"]["predictions"]
+
+# 转发到MCP服务器的请求同样合并批次；缓存由MCP服务器负责，它能感知模型更新
+remote_prediction_batcher = PredictionBatcher(batch_fn=predict_rows_remote, use_cache=False)
+
+def get_prediction_batcher() -> PredictionBatcher:
+    return remote_prediction_batcher if use_remote_prediction() else prediction_batcher
+
+async def predict_chunk(input_df: pd.DataFrame) -> pd.DataFrame:
+    """批量预测一块扫描点，按预测后端转发到MCP服务器或在本地工作池中执行"""
+    if use_remote_prediction():
+        predictions = await predict_rows_remote(input_df.to_dict('records'))
+        return pd.DataFrame(predictions, index=input_df.index)
+    return await prediction_pool.run(predict_batch, input_df)
+
+async def predict_and_render(input_params: Dict[str, float], include_image: bool) -> Tuple[Dict[str, float], Optional[bytes], Dict[str, float]]:
+    """
+    经微批处理器预测，需要时在工作池中渲染JV曲线（同一组参数只渲染一次）
+    
+    返回预测结果、PNG字节（未渲染时为None）和各阶段耗时
+    """
+    start = time.perf_counter()
+    predictions = await get_prediction_batcher().predict(input_params)
+    timing = {"predict_ms": (time.perf_counter() - start) * 1000}
+    png = None
+    if include_image:
+        (_, png), render_timing = await prediction_pool.run_timed(
+            render_jv_curve_png, input_params, False, predictions
+        )
+        timing["render_queue_ms"] = render_timing["queue_ms"]
+        timing["render_ms"] = render_timing["run_ms"]
+    return predictions, png, timing
+
+def busy_exception(e: PoolSaturated) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+
 # 太阳能电池参数预测，通过主流程中的工具调用已覆盖，此处保留API兼容性
+# include_image=false 时为数据模式：只返回预测结果和JV曲线数组，不渲染图像
+# image_mode=url 时不内联base64，返回内容寻址的 jv_curve_url
 @app.post("/api/solar/predict")
-async def predict_params(params: SolarParams):
+async def predict_params(params: SolarParams, response: Response, include_image: bool = True,
+                         image_mode: Optional[str] = None):
+    image_mode = image_mode or IMAGE_DELIVERY
+    if image_mode not in IMAGE_DELIVERY_MODES:
+        raise HTTPException(status_code=400, detail=f"未知的图像返回方式: {image_mode}，可选 {IMAGE_DELIVERY_MODES}")
     try:
-        
         # 将参数转为字典
-        input_params = {
-            'Si_thk': params.Si_thk,
-            't_SiO2': params.t_SiO2, 
-            't_polySi_rear_P': params.t_polySi_rear_P,
-            'front_junc': params.front_junc,
-            'rear_junc': params.rear_junc,
-            'resist_rear': params.resist_rear,
-            'Nd_top': params.Nd_top,
-            'Nd_rear': params.Nd_rear,
-            'Nt_polySi_top': params.Nt_polySi_top,
-            'Nt_polySi_rear': params.Nt_polySi_rear,
-            'Dit Si-SiOx': params.Dit_Si_SiOx,
-            'Dit SiOx-Poly': params.Dit_SiOx_Poly,
-            'Dit top': params.Dit_top
-        }
+        input_params = solar_params_to_dict(params)
         
-        # 预测参数
-        predictions, fig = predict_solar_params(input_params)
+        predictions, png, timing = await predict_and_render(input_params, include_image)
+        response.headers["Server-Timing"] = server_timing(timing)
+        logger.info(f"预测完成: {', '.join(f'{name} {value:.1f}' for name, value in timing.items())}")
         
-        # 将图像转换为base64编码
-        buf = io.BytesIO()
-        fig.savefig(buf, format='png')
-        buf.seek(0)
-        img_base64 = base64.b64encode(buf.read()).decode('utf-8')
-        
-        # 返回预测结果和图像
-        return {
+        result = {
             "predictions": predictions,
-            "jv_curve": img_base64
+            "jv_data": jv_curve_data(predictions)
         }
+        if include_image and image_mode == "url":
+            result["jv_curve_url"] = content_url(await asyncio.to_thread(store_content, png))
+        elif include_image:
+            result["jv_curve"] = base64.b64encode(png).decode('utf-8')
+        return result
+    except PoolSaturated as e:
+        raise busy_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# 按需渲染JV曲线，直接返回PNG；同一组参数只渲染一次
+@app.post("/api/solar/render")
+async def render_jv_curve(params: SolarParams):
+    try:
+        _, png, timing = await predict_and_render(solar_params_to_dict(params), True)
+        return Response(content=png, media_type="image/png", headers={"Server-Timing": server_timing(timing)})
+    except PoolSaturated as e:
+        raise busy_exception(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 预测缓存命中统计
+@app.get("/api/solar/cache-stats")
+async def get_prediction_cache_stats():
+    return {**prediction_cache.stats(), "render_cache": render_cache.stats()}
+
+# 工作池状态：运行中/排队任务数、拒绝次数和平均耗时
+@app.get("/api/solar/pool-stats")
+async def get_pool_stats():
+    return {
+        **prediction_pool.stats(),
+        "batcher": prediction_batcher.stats(),
+        "remote_batcher": remote_prediction_batcher.stats()
+    }
+
+# 多维扫描请求
+class SweepRequest(BaseModel):
+    param_ranges: Optional[Dict[str, List[float]]] = None  # 网格扫描 {参数名: [初始值, 步长, 结束值]}
+    bounds: Optional[Dict[str, List[float]]] = None        # 拉丁超立方采样 {参数名: [下限, 上限]}
+    n_samples: Optional[int] = None                        # 拉丁超立方采样点数
+    seed: int = 0
+    base_params: Optional[Dict[str, float]] = None         # 固定参数，未提供的使用默认值
+    include_plot: bool = True                              # 扫描两个参数时是否返回等高线图
+
+# 每块预测的行数，每块完成后推送一次进度
+SWEEP_CHUNK_SIZE = int(os.getenv("SWEEP_CHUNK_SIZE", "2000"))
+
+async def generate_sweep_response(sweep_request: SweepRequest, input_df, swept: List[str]):
+    """分块预测并以SSE推送进度，最后推送列式结果"""
+    try:
+        total = len(input_df)
+        chunks = []
+        for start in range(0, total, SWEEP_CHUNK_SIZE):
+            # 预测是CPU密集型操作，转发到MCP服务器或放到工作池中执行，避免阻塞事件循环
+            chunk = await predict_chunk(input_df.iloc[start:start + SWEEP_CHUNK_SIZE])
+            chunks.append(chunk)
+            progress = {'done': min(start + SWEEP_CHUNK_SIZE, total), 'total': total}
+            yield f"data: {json.dumps({'type': 'progress', 'content': progress})}\n\n"
+        
+        results_df = pd.concat(chunks)
+        for name in swept:
+            results_df[name] = input_df[feature_name(name)].to_numpy()
+        
+        result = summarize_sweep(results_df, swept)
+        result["design"] = "grid" if sweep_request.param_ranges is not None else "latin_hypercube"
+        
+        if sweep_request.include_plot and len(swept) == 2 and total >= 4:
+            png = await prediction_pool.run(
+                render_sweep_png, results_df, swept[0], swept[1], sweep_request.param_ranges is not None
+            )
+            result["plot"] = base64.b64encode(png).decode('utf-8')
+        
+        yield f"data: {json.dumps({'type': 'result', 'content': result})}\n\n"
+    except Exception as e:
+        logger.info(f"多维扫描出错: {str(e)}")
+        yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
+    
+    yield f"data: {json.dumps({'type': 'done', 'content': ''})}\n\n"
+
+# 多维参数扫描：网格或拉丁超立方采样，以SSE推送进度和结果
+@app.post("/api/solar/sweep")
+async def sweep_params(sweep_request: SweepRequest):
+    try:
+        if (sweep_request.param_ranges is None) == (sweep_request.bounds is None):
+            raise ValueError("Provide exactly one of param_ranges or bounds")
+        check_sweep_params(list(sweep_request.param_ranges if sweep_request.param_ranges is not None
+                                else sweep_request.bounds))
+        if sweep_request.param_ranges is not None:
+            points = grid_points(sweep_request.param_ranges)
+        else:
+            if not sweep_request.n_samples:
+                raise ValueError("n_samples is required when sampling with bounds")
+            points = latin_hypercube(sweep_request.bounds, sweep_request.n_samples, seed=sweep_request.seed)
+        input_df = build_sweep_inputs(points, sweep_request.base_params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # 工作池已满时直接拒绝，而不是开始一个无法推进的流
+    if prediction_pool.saturated():
+        raise busy_exception(PoolSaturated("仿真服务繁忙，请稍后重试"))
+    
+    return StreamingResponse(
+        generate_sweep_response(sweep_request, input_df, list(points.keys())),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
 # 直接运行入口点
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,383 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncContextManager, Callable, Dict, List, Optional
+
+
+# MCP连接池配置，可通过环境变量调整
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "4"))  # 同时保持的MCP会话数，即可并行执行的工具调用数
+MCP_HEALTH_INTERVAL = float(os.getenv("MCP_HEALTH_INTERVAL", "15"))  # 空闲会话的心跳间隔（秒）
+MCP_PING_TIMEOUT = float(os.getenv("MCP_PING_TIMEOUT", "5"))
+MCP_CONNECT_TIMEOUT = float(os.getenv("MCP_CONNECT_TIMEOUT", "10"))
+MCP_RECONNECT_MIN_BACKOFF = float(os.getenv("MCP_RECONNECT_MIN_BACKOFF", "0.5"))
+MCP_RECONNECT_MAX_BACKOFF = float(os.getenv("MCP_RECONNECT_MAX_BACKOFF", "30"))
+MCP_CHECKOUT_TIMEOUT = float(os.getenv("MCP_CHECKOUT_TIMEOUT", "10"))  # 等待空闲会话（或重连完成）的最长时间
+MCP_CALL_TIMEOUT = float(os.getenv("MCP_CALL_TIMEOUT", "300"))  # 单次请求（工具调用、获取工具列表）的最长时间
+MCP_TOOLS_TTL = float(os.getenv("MCP_TOOLS_TTL", "300"))  # 工具列表缓存的有效期（秒）
+# 只供后端内部调用的工具（批量预测转发、统计查询），不提供给模型：避免模型传入超大参数，也节省每次请求的提示token
+MCP_INTERNAL_TOOLS = frozenset(name.strip() for name in os.getenv(
+    "MCP_INTERNAL_TOOLS", "predict_rows,get_query_cache_stats,get_prediction_cache_stats").split(",") if name.strip())
+
+logger = logging.getLogger(__name__)
+
+
+class MCPUnavailable(RuntimeError):
+    """在等待时间内没有可用的MCP会话（服务器未启动、正在重连或所有会话都忙）"""
+
+
+@asynccontextmanager
+async def open_sse_session(server_url: str, on_tools_changed: Optional[Callable[[], None]] = None):
+    """
+    建立一个SSE连接上的MCP会话并完成初始化
+
+    Args:
+        server_url: MCP服务器SSE地址
+        on_tools_changed: 收到服务器的工具列表变化通知时调用
+    """
+    # mcp客户端只在真正连接时导入
+    from mcp import ClientSession, types
+    from mcp.client.sse import sse_client
+
+    async def message_handler(message) -> None:
+        if (on_tools_changed is not None and isinstance(message, types.ServerNotification)
+                and isinstance(message.root, types.ToolListChangedNotification)):
+            on_tools_changed()
+
+    async with sse_client(url=server_url) as streams:
+        try:
+            session_context = ClientSession(*streams, message_handler=message_handler)
+        except TypeError:  # 较早版本的mcp不支持message_handler，只能靠重连和TTL刷新工具列表
+            session_context = ClientSession(*streams)
+        async with session_context as session:
+            await asyncio.wait_for(session.initialize(), MCP_CONNECT_TIMEOUT)
+            yield session
+
+
+def _is_server_error(error: Exception) -> bool:
+    """服务器正常返回的错误（如参数错误）不代表连接断开，不应重连或重试"""
+    try:
+        from mcp.shared.exceptions import McpError
+    except ImportError:
+        return False
+    return isinstance(error, McpError)
+
+
+class MCPConnection:
+    """
+    池中的一个MCP会话，由专属的后台任务持有：建立连接、定期心跳、断开后按指数退避重连。
+    sse_client内部使用anyio任务组，进入和退出必须在同一个任务中，因此连接不能在请求任务中打开或关闭。
+    """
+
+    def __init__(self, pool: "MCPSessionPool", index: int):
+        self.pool = pool
+        self.index = index
+        self.session = None
+        self.busy = False
+        self.connected_at: Optional[float] = None
+        self.attempted = False  # 是否已完成过一次连接尝试（无论成败）
+        self._broken = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.ensure_future(self._run())
+
+    @property
+    def available(self) -> bool:
+        return self.session is not None and not self._broken.is_set()
+
+    def mark_broken(self) -> None:
+        """调用失败时标记，后台任务会关闭并重建该会话"""
+        self._broken.set()
+
+    async def _run(self) -> None:
+        backoff = MCP_RECONNECT_MIN_BACKOFF
+        while not self.pool.closed:
+            try:
+                async with self.pool.connect(self.pool.server_url, self.pool.invalidate) as session:
+                    self._broken.clear()
+                    self.session = session
+                    self.connected_at = time.time()
+                    backoff = MCP_RECONNECT_MIN_BACKOFF
+                    await self.pool._on_connected(self)
+                    await self._monitor(session)
+            except Exception as e:  # 连接断开时anyio可能抛出ExceptionGroup
+                if not self.pool.closed:
+                    logger.info(f"MCP会话 #{self.index} 连接失败或已断开: {str(e)}")
+            finally:
+                self.attempted = True
+                if self.session is not None:
+                    self.session = None
+                    self.pool.disconnects += 1
+            if self.pool.closed:
+                break
+            await self.pool._notify()
+            # 加入随机抖动，避免服务器重启后所有会话同时重连
+            await asyncio.sleep(backoff * random.uniform(0.5, 1.0))
+            backoff = min(backoff * 2, MCP_RECONNECT_MAX_BACKOFF)
+
+    async def _monitor(self, session) -> None:
+        """空闲时定期ping，失败或被标记断开时返回以触发重连"""
+        while not self.pool.closed:
+            try:
+                await asyncio.wait_for(self._broken.wait(), MCP_HEALTH_INTERVAL)
+                return
+            except asyncio.TimeoutError:
+                pass
+            if self.busy:
+                continue
+            try:
+                await asyncio.wait_for(session.send_ping(), MCP_PING_TIMEOUT)
+            except Exception as e:
+                logger.info(f"MCP会话 #{self.index} 心跳失败: {str(e)}")
+                return
+
+    async def stop(self) -> None:
+        self._broken.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, MCP_PING_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                self._task.cancel()
+            except Exception:
+                pass
+
+
+class MCPSessionPool:
+    """
+    MCP会话池：保持size个独立的SSE会话，每次工具调用独占借出一个，
+    不同会话的工具调用可以并行；会话断开后在后台自动重连，调用方等待重连而不是直接失败。
+
+    generation在每次有会话（重新）连接成功或服务器通知工具列表变化时加一，依赖服务器状态的缓存（如ToolSchemaCache）据此失效。
+    """
+
+    def __init__(self, server_url: str, size: int = MCP_POOL_SIZE,
+                 connect: Callable[[str, Callable[[], None]], AsyncContextManager] = open_sse_session,
+                 checkout_timeout: float = MCP_CHECKOUT_TIMEOUT, call_timeout: float = MCP_CALL_TIMEOUT):
+        self.server_url = server_url
+        self.size = size
+        self.connect = connect
+        self.checkout_timeout = checkout_timeout
+        self.call_timeout = call_timeout
+        self.connections: List[MCPConnection] = []
+        self.closed = False
+        self.generation = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.disconnects = 0
+        self.timeouts = 0
+        self.call_timeouts = 0
+
+    @property
+    def connected(self) -> bool:
+        """是否至少有一个会话可用"""
+        return any(c.available for c in self.connections)
+
+    async def start(self, wait: float = MCP_CONNECT_TIMEOUT) -> bool:
+        """
+        启动所有会话的后台连接任务，等待第一个会话连接成功或所有会话的首次连接都失败（最多wait秒）
+
+        Returns:
+            bool: 是否已有会话连接成功；为False时后台仍会持续重连
+        """
+        self.closed = False
+        self._condition = asyncio.Condition()
+        self.connections = [MCPConnection(self, i) for i in range(self.size)]
+        for connection in self.connections:
+            connection.start()
+        try:
+            async with self._condition:
+                await asyncio.wait_for(self._condition.wait_for(
+                    lambda: self.connected or all(c.attempted for c in self.connections)), wait)
+        except asyncio.TimeoutError:
+            pass
+        return self.connected
+
+    def invalidate(self) -> None:
+        """服务器状态可能已变化，使依赖generation的缓存失效"""
+        self.generation += 1
+
+    async def _on_connected(self, connection: MCPConnection) -> None:
+        self.invalidate()
+        logger.info(f"MCP会话 #{connection.index} 已连接: {self.server_url}")
+        await self._notify()
+
+    async def _notify(self) -> None:
+        async with self._condition:
+            self._condition.notify_all()
+
+    async def _acquire(self, timeout: float) -> MCPConnection:
+        if self._condition is None or self.closed:
+            raise MCPUnavailable("MCP连接池未启动")
+
+        def idle() -> Optional[MCPConnection]:
+            for connection in self.connections:
+                if connection.available and not connection.busy:
+                    return connection
+            return None
+
+        async with self._condition:
+            try:
+                await asyncio.wait_for(self._condition.wait_for(lambda: idle() is not None), timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                state = "所有会话都忙" if self.connected else "没有已连接的会话"
+                raise MCPUnavailable(f"{timeout:.0f}秒内没有可用的MCP会话（{state}）")
+            connection = idle()
+            connection.busy = True
+            return connection
+
+    async def _release(self, connection: MCPConnection) -> None:
+        connection.busy = False
+        await self._notify()
+
+    @asynccontextmanager
+    async def checkout(self, timeout: Optional[float] = None):
+        """
+        独占借出一个已连接的会话
+
+        Raises:
+            MCPUnavailable: 等待超时
+        """
+        connection = await self._acquire(self.checkout_timeout if timeout is None else timeout)
+        try:
+            yield connection
+        finally:
+            await self._release(connection)
+
+    async def _request(self, name: str, fn: Callable[[Any], Any]) -> Any:
+        """
+        借出会话执行请求；连接层面的失败会标记该会话重连并换一个会话重试。
+        服务器重启后池中所有会话都已失效，最多重试size次，最后一次会用上重连后的会话
+
+        超过call_timeout未返回时同样视为连接异常并重建该会话（半开连接上的请求永远不会返回，
+        不能一直占用会话），但不重试：请求可能已在服务器上执行，重试会重复执行工具
+
+        Raises:
+            MCPUnavailable: 没有可用会话，或请求超时
+        """
+        self.calls += 1
+        attempts = self.size + 1
+        for attempt in range(attempts):
+            async with self.checkout() as connection:
+                session = connection.session
+                try:
+                    return await asyncio.wait_for(fn(session), self.call_timeout)
+                except asyncio.TimeoutError:
+                    self.call_timeouts += 1
+                    self.failures += 1
+                    logger.info(f"MCP会话 #{connection.index} 执行 {name} 超过{self.call_timeout:.0f}秒未返回，重建该会话")
+                    connection.mark_broken()
+                    raise MCPUnavailable(f"MCP请求 {name} 超过{self.call_timeout:.0f}秒未返回")
+                except Exception as e:
+                    if _is_server_error(e) or attempt == attempts - 1:
+                        self.failures += 1
+                        logger.info(f"MCP请求 {name} 失败: {str(e)}")
+                        raise
+                    logger.info(f"MCP会话 #{connection.index} 执行 {name} 时连接异常，重连后重试: {str(e)}")
+                    connection.mark_broken()
+                    self.retries += 1
+
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]):
+        """调用MCP工具"""
+        return await self._request(tool_name, lambda session: session.call_tool(tool_name, arguments))
+
+    async def list_tools(self):
+        """获取可用工具列表"""
+        response = await self._request("list_tools", lambda session: session.list_tools())
+        return response.tools
+
+    async def close(self) -> None:
+        """关闭所有会话"""
+        self.closed = True
+        await asyncio.gather(*(connection.stop() for connection in self.connections))
+        logger.info("已断开MCP连接")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "server_url": self.server_url,
+            "size": self.size,
+            "connected": sum(c.available for c in self.connections),
+            "busy": sum(c.busy for c in self.connections),
+            "generation": self.generation,
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "disconnects": self.disconnects,
+            "checkout_timeouts": self.timeouts,
+            "call_timeouts": self.call_timeouts,
+        }
+
+
+class ToolSchemaCache:
+    """
+    缓存MCP服务器的工具列表（可选转换为其他格式，如OpenAI的tools参数），
+    每次对话不必再往返一次list_tools；超过ttl或连接池的generation变化（重连、工具列表变化通知）时重新获取
+    """
+
+    def __init__(self, pool: MCPSessionPool, ttl: float = MCP_TOOLS_TTL,
+                 convert: Optional[Callable[[Any], Any]] = None, exclude: frozenset = MCP_INTERNAL_TOOLS):
+        """
+        Args:
+            pool: MCP连接池
+            ttl: 缓存有效期（秒）
+            convert: 工具定义的转换函数（如转换为OpenAI格式）
+            exclude: 不对外提供的工具名
+        """
+        self.pool = pool
+        self.ttl = ttl
+        self.convert = convert
+        self.exclude = exclude
+        self._tools: Optional[List[Any]] = None
+        self._generation: Optional[int] = None
+        self._fetched_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _valid(self) -> bool:
+        return (self._tools is not None and self._generation == self.pool.generation
+                and time.time() - self._fetched_at < self.ttl)
+
+    async def get(self) -> List[Any]:
+        """
+        返回（转换后的）工具列表，并发的未命中只请求一次服务器
+
+        Raises:
+            MCPUnavailable: 缓存失效且没有可用的MCP会话
+        """
+        if self._valid():
+            self.hits += 1
+            return self._tools
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._valid():
+                self.hits += 1
+                return self._tools
+            self.misses += 1
+            # 先记录generation：获取期间若发生重连，下次调用会再次刷新
+            generation = self.pool.generation
+            tools = [tool for tool in await self.pool.list_tools() if getattr(tool, "name", None) not in self.exclude]
+            self._tools = [self.convert(tool) for tool in tools] if self.convert else tools
+            self._generation = generation
+            self._fetched_at = time.time()
+            return self._tools
+
+    def invalidate(self) -> None:
+        self._tools = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cached": self._tools is not None,
+            "valid": self._valid(),
+            "tools": len(self._tools) if self._tools is not None else 0,
+            "age_seconds": time.time() - self._fetched_at if self._tools is not None else None,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
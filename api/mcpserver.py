@@ -1,40 +1,47 @@
 #!/usr/bin/env python3
 import os
+import time
+import asyncio
 import base64
-import io
 from typing import Dict, Any, List, Tuple, Optional
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.figure import Figure
-from autogluon.tabular import TabularPredictor, TabularDataset
 from mcp.server.fastmcp import FastMCP, Context, Image
 from starlette.applications import Starlette
 from mcp.server.sse import SseServerTransport
 from starlette.requests import Request
+from starlette.responses import JSONResponse
 from starlette.routing import Mount, Route
 from mcp.server import Server
 import uvicorn
 from dotenv import load_dotenv
-from embed import TextEmbedding  # 导入嵌入模块
+from embed import TextEmbedding, is_columnar_store  # 导入嵌入模块
+from mlutil import (  # 加载预测模型并提供批量预测
+    predict_batch, prediction_cache, render_cache, check_model_version, render_jv_curve_png, render_sweep_png,
+    render_batch_pngs, jv_curve_data, PredictionBatcher, DEFAULT_PARAMS, grid_points, latin_hypercube,
+    check_sweep_params, build_sweep_inputs, summarize_sweep, feature_name, TARGETS, pyplot_locked, fig_to_png,
+)
+from file_store import OutputCache, input_key, OUTPUT_SWEEP_INTERVAL  # 以输入哈希命名输出文件，并按保留策略清理
+from workers import WorkerPool  # 预测和渲染的工作池
+from model_registry import registry, MODEL_WARMUP  # 预测模型在首次使用或后台预热时加载
+
 load_dotenv()
 
 # 初始化FastMCP服务器
 mcp = FastMCP("太阳能电池仿真服务")
 
-# 加载模型目录
-model_base_path = os.getenv("MODEL_DIR", "final_small")
-if not os.path.exists(model_base_path):
-    raise FileNotFoundError(f"模型目录 {model_base_path} 不存在")
+# 多维扫描每次预测的行数（每块完成后报告一次进度），以及结果中内联返回列数据的最大点数
+SWEEP_CHUNK_SIZE = int(os.getenv("SWEEP_CHUNK_SIZE", "2000"))
+SWEEP_INLINE_POINTS = int(os.getenv("SWEEP_INLINE_POINTS", "200"))
+
+# 预测和渲染放到工作池中执行，避免CPU密集任务阻塞服务器；池满时工具调用直接报错
+prediction_pool = WorkerPool()
+# 并发的单组参数仿真请求在短时间窗口内合并为一次批量预测
+prediction_batcher = PredictionBatcher(pool=prediction_pool)
 
-# 加载所有预测模型
-predictor = {}
-for param in ['Vm', 'Im', 'Voc', 'Jsc', 'FF', 'Eff']:
-    model_path = os.path.join(model_base_path, param)
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"模型 {param} 不存在于路径 {model_path}")
-    predictor[param] = TabularPredictor.load(model_path)
+# 输出图像以输入哈希命名，重复请求直接从磁盘读取；后台按大小和访问时间清理输出目录
+output_cache = OutputCache()
 
 # 初始化文本嵌入
 embedding_dir = os.getenv("EMBEDDING_DIR", "embedding")
@@ -58,14 +65,6 @@ def load_text_embedding():
 # 调用加载函数
 load_text_embedding()
 
-def fig_to_image(fig: Figure) -> Image:
-    """将matplotlib图像转换为MCP Image对象"""
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png')
-    buf.seek(0)
-    img_data = buf.getvalue()
-    return Image(data=img_data, format="png")
-
 @mcp.tool()
 async def draw_curve(
     x_data: list,         # x轴数据列表
@@ -106,6 +105,44 @@ async def draw_curve(
     if len(x_data) != len(y_data):
         raise ValueError("x轴和y轴数据长度必须相同")
     
+    # 文件以全部绘图参数的哈希命名，相同输入直接返回已保存的图像
+    output_dir = os.getenv("OUTPUT_DIR", "plot_results")
+    file_path = output_cache.path(output_dir, "curve", input_key("curve", {
+        "x_data": x_data, "y_data": y_data, "x_label": x_label, "y_label": y_label, "title": title,
+        "line_style": line_style, "color": color, "fig_size": fig_size
+    }))
+    # 渲染和文件读写都在工作池/线程中执行，不阻塞事件循环
+    png = await asyncio.to_thread(output_cache.get, file_path)
+    if png is None:
+        png = await prediction_pool.run(render_curve_png, x_data, y_data, x_label, y_label, title, line_style,
+                                        color, fig_size)
+        if save_file:
+            await asyncio.to_thread(output_cache.put, file_path, png)
+    elif ctx:
+        ctx.info("相同参数的曲线图已存在，直接返回")
+    
+    if not save_file:
+        file_path = None
+    elif ctx:
+        ctx.info(f"曲线图已保存至: {file_path}")
+    
+    if ctx:
+        ctx.info("曲线图绘制完成!")
+    
+    # 返回结果
+    result = {
+        "image": [Image(data=png, format="png")]
+    }
+    result["text"] = {}
+    result["text"]["file_path"] = file_path
+    
+    return result
+
+@pyplot_locked
+def render_curve_png(x_data, y_data, x_label, y_label, title, line_style, color, fig_size) -> bytes:
+    """绘制曲线图并编码为PNG"""
+    import matplotlib.pyplot as plt
+    
     # 创建图表
     fig = plt.figure(figsize=(fig_size[0], fig_size[1]))
     plt.plot(x_data, y_data, line_style, color=color)
@@ -120,40 +157,7 @@ async def draw_curve(
     
     # 自动调整布局
     plt.tight_layout()
-    
-    # 保存图像文件路径（如果需要）
-    file_path = None
-    if save_file:
-        # 确保输出目录存在
-        output_dir = os.getenv("OUTPUT_DIR", "plot_results")
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # 使用当前时间创建文件名，确保不会重复
-        import datetime
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        file_path = os.path.join(output_dir, f"curve_{timestamp}.png")
-        
-        # 保存图像
-        plt.savefig(file_path)
-        
-        if ctx:
-            ctx.info(f"曲线图已保存至: {file_path}")
-    
-    # 转换图像为MCP Image对象
-    curve_image = fig_to_image(fig)
-    plt.close(fig)
-    
-    if ctx:
-        ctx.info("曲线图绘制完成!")
-    
-    # 返回结果
-    result = {
-        "image": [curve_image]
-    }
-    result["text"] = {}
-    result["text"]["file_path"] = file_path
-    
-    return result
+    return fig_to_png(fig)
 
 @mcp.tool()
 async def draw_table(
@@ -199,6 +203,43 @@ async def draw_table(
     if row_labels is None:
         row_labels = [f"行 {i+1}" for i in range(num_rows)]
     
+    # 文件以表格内容和样式参数的哈希命名，相同输入直接返回已保存的图像
+    output_dir = os.getenv("OUTPUT_DIR", "plot_results")
+    file_path = output_cache.path(output_dir, "table", input_key("table", {
+        "table_data": table_data, "col_labels": col_labels, "row_labels": row_labels,
+        "title": title, "fig_size": fig_size
+    }))
+    # 渲染和文件读写都在工作池/线程中执行，不阻塞事件循环
+    png = await asyncio.to_thread(output_cache.get, file_path)
+    if png is None:
+        png = await prediction_pool.run(render_table_png, table_data, col_labels, row_labels, title, fig_size)
+        if save_file:
+            await asyncio.to_thread(output_cache.put, file_path, png)
+    elif ctx:
+        ctx.info("相同内容的表格已存在，直接返回")
+    
+    if not save_file:
+        file_path = None
+    elif ctx:
+        ctx.info(f"表格已保存至: {file_path}")
+    
+    if ctx:
+        ctx.info("数据表格绘制完成!")
+    
+    # 返回结果
+    result = {
+        "image": [Image(data=png, format="png")]
+    }
+    result["text"] = {}
+    result["text"]["file_path"] = file_path
+    
+    return result
+
+@pyplot_locked
+def render_table_png(table_data, col_labels, row_labels, title, fig_size) -> bytes:
+    """绘制数据表格并编码为PNG"""
+    import matplotlib.pyplot as plt
+    
     # 创建图形和表格
     fig, ax = plt.subplots(figsize=(fig_size[0], fig_size[1]))
     
@@ -224,40 +265,47 @@ async def draw_table(
     
     # 自动调整行高
     table.scale(1, 1.5)
-    
-    # 保存图像文件路径（如果需要）
-    file_path = None
-    if save_file:
-        # 确保输出目录存在
-        output_dir = os.getenv("OUTPUT_DIR", "plot_results")
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # 使用当前时间创建文件名，确保不会重复
-        import datetime
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        file_path = os.path.join(output_dir, f"table_{timestamp}.png")
-        
-        # 保存图像
-        plt.savefig(file_path, bbox_inches='tight')
-        
-        if ctx:
-            ctx.info(f"表格已保存至: {file_path}")
-    
-    # 转换图像为MCP Image对象
-    table_image = fig_to_image(fig)
-    plt.close(fig)
-    
-    if ctx:
-        ctx.info("数据表格绘制完成!")
-    
-    # 返回结果
-    result = {
-        "image": [table_image]
+    return fig_to_png(fig, bbox_inches='tight')
+
+def output_path(prefix: str, key: str) -> str:
+    """仿真图像在输出目录中的路径，文件名为输入的哈希"""
+    return output_cache.path(os.getenv("OUTPUT_DIR", "simulation_results"), prefix, key)
+
+async def render_simulation_jv(input_params: Dict[str, float], predictions: Dict[str, float]) -> Tuple[bytes, str, Dict[str, float]]:
+    """
+    渲染带标注的JV曲线并保存，返回PNG、文件路径和渲染耗时
+
+    文件名由输入参数和预测值的哈希决定，已保存过的图像直接从磁盘读取，不进入工作池
+    """
+    file_path = output_path("jv_curve", input_key("jv_curve", {"params": input_params, "predictions": predictions}))
+    png = await asyncio.to_thread(output_cache.get, file_path)
+    if png is not None:
+        return png, file_path, {"render_queue_ms": 0.0, "render_ms": 0.0}
+    (_, png), timing = await prediction_pool.run_timed(render_jv_curve_png, input_params, True, predictions)
+    await asyncio.to_thread(output_cache.put, file_path, png)
+    return png, file_path, {"render_queue_ms": timing["queue_ms"], "render_ms": timing["run_ms"]}
+
+def format_timing(timing: Dict[str, float]) -> Dict[str, float]:
+    return {name: round(value, 1) for name, value in timing.items()}
+
+def solar_input_params(Si_thk, t_SiO2, t_polySi_rear_P, front_junc, rear_junc, resist_rear, Nd_top, Nd_rear,
+                       Nt_polySi_top, Nt_polySi_rear, Dit_Si_SiOx, Dit_SiOx_Poly, Dit_top) -> Dict[str, float]:
+    """将工具参数转换为模型特征名的字典"""
+    return {
+        'Si_thk': Si_thk,
+        't_SiO2': t_SiO2,
+        't_polySi_rear_P': t_polySi_rear_P,
+        'front_junc': front_junc,
+        'rear_junc': rear_junc,
+        'resist_rear': resist_rear,
+        'Nd_top': Nd_top,
+        'Nd_rear': Nd_rear,
+        'Nt_polySi_top': Nt_polySi_top,
+        'Nt_polySi_rear': Nt_polySi_rear,
+        'Dit Si-SiOx': Dit_Si_SiOx,
+        'Dit SiOx-Poly': Dit_SiOx_Poly,
+        'Dit top': Dit_top
     }
-    result["text"] = {}
-    result["text"]["file_path"] = file_path
-    
-    return result
 
 @mcp.tool()
 async def simulate_solar_cell(
@@ -274,6 +322,7 @@ async def simulate_solar_cell(
     Dit_Si_SiOx: float = 1e10,       # Si-SiOx界面态密度(cm^-2)
     Dit_SiOx_Poly: float = 1e10,     # SiOx-Poly界面态密度(cm^-2)
     Dit_top: float = 1e10,           # 顶部界面态密度(cm^-2)
+    include_image: bool = True,      # 是否生成JV曲线图像，False时只返回数据
     ctx: Context = None
 ) -> Dict[str, Any]:
     """
@@ -281,6 +330,8 @@ async def simulate_solar_cell(
     
     这个工具使用预训练的机器学习模型，根据提供的硅片和电池参数，预测太阳能电池的关键性能指标
     并生成对应的电流-电压(JV)曲线。
+    只需要数值（例如比较多组参数、继续计算）时请设置include_image=False，此时返回JV曲线的
+    电压/电流数组而不渲染图像；之后如需展示曲线，可调用render_jv_curve工具。
     
     返回参数:
     - Vm: 最大功率点电压(V)
@@ -289,111 +340,98 @@ async def simulate_solar_cell(
     - Jsc: 短路电流密度(mA/cm²)
     - FF: 填充因子(%)
     - Eff: 效率(%)
-    - JV曲线图像
+    - JV曲线图像（include_image=True）或JV曲线数据（include_image=False）
     """
     if ctx:
         ctx.info("开始太阳能电池仿真...")
     
     # 准备输入参数
-    input_params = {
-        'Si_thk': Si_thk,
-        't_SiO2': t_SiO2,
-        't_polySi_rear_P': t_polySi_rear_P,
-        'front_junc': front_junc,
-        'rear_junc': rear_junc,
-        'resist_rear': resist_rear,
-        'Nd_top': Nd_top,
-        'Nd_rear': Nd_rear,
-        'Nt_polySi_top': Nt_polySi_top,
-        'Nt_polySi_rear': Nt_polySi_rear,
-        'Dit Si-SiOx': Dit_Si_SiOx,
-        'Dit SiOx-Poly': Dit_SiOx_Poly,
-        'Dit top': Dit_top
-    }
-    
-    # 准备输入数据
-    input_df = pd.DataFrame([input_params])
-    input_data = TabularDataset(input_df)
-    
-    # 预测结果字典
-    predictions = {}
+    input_params = solar_input_params(
+        Si_thk, t_SiO2, t_polySi_rear_P, front_junc, rear_junc, resist_rear, Nd_top, Nd_rear,
+        Nt_polySi_top, Nt_polySi_rear, Dit_Si_SiOx, Dit_SiOx_Poly, Dit_top
+    )
     
     if ctx:
         ctx.info("执行预测中...")
     
-    # 对每个参数进行预测
-    for param in ['Vm', 'Im', 'Voc', 'Jsc', 'FF', 'Eff']:
-        predictions[param] = float(predictor[param].predict(input_data).iloc[0])
+    # 预测结果字典（经微批处理器与并发请求合并预测）
+    start = time.perf_counter()
+    predictions = await prediction_batcher.predict(input_params)
+    timing = {"predict_ms": (time.perf_counter() - start) * 1000}
+    
+    if not include_image:
+        if ctx:
+            ctx.info(f"仿真完成（数据模式），耗时 {timing['predict_ms']:.1f} ms")
+        return {"text": {
+            "parameters": predictions,
+            "jv_curve": jv_curve_data(predictions, decimals=4),
+            "timing": format_timing(timing)
+        }}
     
     if ctx:
         ctx.info("生成JV曲线...")
     
-    # 创建JV曲线
-    fig = plt.figure(figsize=(10, 6))
-    
-    # 生成电压点
-    v_points = np.linspace(0, predictions['Voc'], 100)
-    
-    # 计算电流点 (使用简化的单二极管模型)
-    j_points = predictions['Jsc'] * (1 - np.exp((v_points - predictions['Voc']) / 0.026))
-    
-    # 绘制JV曲线
-    plt.plot(v_points, j_points, 'b-', label='JV Curve')
-    plt.plot([0, predictions['Vm']], [predictions['Jsc'], predictions['Im']], 'r--', label='Max Power Line')
-    plt.plot([predictions['Vm']], [predictions['Im']], 'ro', label='Max Power Point')
-    
-    plt.xlabel('Voltage (V)')
-    plt.ylabel('Current Density (mA/cm²)')
-    plt.title('Solar Cell JV Curve')
-    plt.legend()
-    
-    # 在图表中显示关键参数
-    props = dict(boxstyle='round', facecolor='wheat', alpha=0.5)
-    param_text = '\n'.join([
-        f"Voc = {predictions['Voc']:.4f} V",
-        f"Jsc = {predictions['Jsc']:.4f} mA/cm²",
-        f"FF = {predictions['FF']:.2f} %",
-        f"Eff = {predictions['Eff']:.2f} %"
-    ])
-    plt.annotate(param_text, xy=(0.05, 0.05), xycoords='axes fraction', 
-                 bbox=props, fontsize=9)
-    
-    # 保存图像到本地文件
-    import datetime
-    import os
-    
-    # 确保输出目录存在
-    output_dir = os.getenv("OUTPUT_DIR", "simulation_results")
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # 使用当前时间创建文件名，确保不会重复
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-    file_path = os.path.join(output_dir, f"jv_curve_{timestamp}.png")
-    
-    # 保存图像
-    plt.savefig(file_path)
+    # 生成JV曲线，同一组参数的图像只渲染一次
+    png, file_path, render_timing = await render_simulation_jv(input_params, predictions)
+    timing.update(render_timing)
     
     if ctx:
         ctx.info(f"JV曲线已保存至: {file_path}")
-    
-    # 转换图像为MCP Image对象
-    jv_curve_image = fig_to_image(fig)
-    plt.close(fig)
-    
-    if ctx:
-        ctx.info("仿真完成!")
+        ctx.info(f"仿真完成! 预测 {timing['predict_ms']:.1f} ms，渲染 {timing['render_ms']:.1f} ms")
     
     # 返回结果字典和JV曲线图像
     result = {
-        "image": [jv_curve_image]
+        "image": [Image(data=png, format="png")]
     }
     result["text"] = {}
     result["text"]["parameters"] = predictions
     result["text"]["file_path"] = file_path
+    result["text"]["timing"] = format_timing(timing)
 
     
     return result
 
+@mcp.tool()
+async def render_jv_curve(
+    Si_thk: float = 180.0,           # 硅片厚度(µm)
+    t_SiO2: float = 1.4,             # 二氧化硅厚度(nm)
+    t_polySi_rear_P: float = 100.0,  # 背面多晶硅厚度(nm)
+    front_junc: float = 0.5,         # 前结(µm)
+    rear_junc: float = 0.5,          # 后结(µm)
+    resist_rear: float = 100.0,      # 背面电阻(Ω)
+    Nd_top: float = 1e20,            # 顶部掺杂浓度(cm^-3)
+    Nd_rear: float = 1e20,           # 背面掺杂浓度(cm^-3)
+    Nt_polySi_top: float = 1e20,     # 顶部多晶硅掺杂浓度(cm^-3)
+    Nt_polySi_rear: float = 1e20,    # 背面多晶硅掺杂浓度(cm^-3)
+    Dit_Si_SiOx: float = 1e10,       # Si-SiOx界面态密度(cm^-2)
+    Dit_SiOx_Poly: float = 1e10,     # SiOx-Poly界面态密度(cm^-2)
+    Dit_top: float = 1e10,           # 顶部界面态密度(cm^-2)
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """
+    按需渲染一组参数的JV曲线图像
+    
+    通常在simulate_solar_cell(include_image=False)得到数据后、需要向用户展示曲线时调用。
+    同一组参数的图像只渲染一次，重复调用直接返回缓存结果。
+    
+    返回:
+    - JV曲线图像及保存的文件路径
+    """
+    input_params = solar_input_params(
+        Si_thk, t_SiO2, t_polySi_rear_P, front_junc, rear_junc, resist_rear, Nd_top, Nd_rear,
+        Nt_polySi_top, Nt_polySi_rear, Dit_Si_SiOx, Dit_SiOx_Poly, Dit_top
+    )
+    predictions = await prediction_batcher.predict(input_params)
+    png, file_path, timing = await render_simulation_jv(input_params, predictions)
+    
+    if ctx:
+        ctx.info(f"JV曲线已保存至: {file_path}")
+    
+    return {
+        "image": [Image(data=png, format="png")],
+        "text": {"parameters": predictions, "file_path": file_path, "timing": format_timing(timing)}
+    }
+
 @mcp.tool()
 async def batch_simulate_solar_cell(
     param_name: str,                # 要批量仿真的参数名
@@ -450,146 +488,195 @@ async def batch_simulate_solar_cell(
     if param_name not in valid_params:
         raise ValueError(f"Parameter name '{param_name}' is invalid. Valid parameters: {list(valid_params.keys())}")
     
-    # 解析参数范围
-    if len(param_range) != 3:
-        raise ValueError("Parameter range must contain three values: [start, step, end]")
-    
-    start_val, step_val, end_val = param_range
-    
-    # 生成参数值列表
-    param_values = np.arange(start_val, end_val + step_val/2, step_val)
+    # 生成参数值列表：与多维扫描共用范围检查（步长为正且有限）和点数上限，超限时不分配数组
+    param_values = grid_points({param_name: param_range})[param_name]
     
     if ctx:
         ctx.info(f"Will simulate {len(param_values)} values for {param_name}: {param_values}")
     
-    # 存储所有仿真结果
-    all_results = []
-    all_v_points = []
-    all_j_points = []
-    
-    # 准备基本参数字典
-    base_params = valid_params.copy()
-    
-    # 对每个参数值进行仿真
-    for val in param_values:
-        if ctx:
-            ctx.info(f"Simulating {param_name} = {val}")
-        
-        # 更新当前参数值
-        base_params[param_name] = val
-        
-        # 准备输入数据
-        input_df = pd.DataFrame([base_params])
-        input_data = TabularDataset(input_df)
-        
-        # 预测结果
-        result = {}
-        for param in ['Vm', 'Im', 'Voc', 'Jsc', 'FF', 'Eff']:
-            result[param] = float(predictor[param].predict(input_data).iloc[0])
-        
-        # 添加当前参数值
-        result[param_name] = val
-        all_results.append(result)
-        
-        # 为JV曲线收集数据
-        v_points = np.linspace(0, result['Voc'], 100)
-        j_points = result['Jsc'] * (1 - np.exp((v_points - result['Voc']) / 0.026))
-        
-        all_v_points.append(v_points)
-        all_j_points.append(j_points)
+    # 一次构建整个扫描的输入表，每个模型只对全部行预测一次
+    input_df = pd.DataFrame({name: np.full(len(param_values), value) for name, value in valid_params.items()})
+    input_df[param_name] = param_values
     
     # 创建结果数据框
-    results_df = pd.DataFrame(all_results)
+    results_df, predict_timing = await prediction_pool.run_timed(predict_batch, input_df)
+    results_df[param_name] = param_values
     
     if ctx:
-        ctx.info("Generating performance trend charts...")
-    
-    # 创建性能趋势图
-    fig_trends = plt.figure(figsize=(12, 8))
-    fig_trends.suptitle(f"Solar Cell Performance vs {param_name}", fontsize=14)
-    
-    # 创建子图
-    axs = fig_trends.subplots(2, 3)
-    axs = axs.flatten()
-    
-    # 绘制各个性能参数的趋势
-    for i, param in enumerate(['Voc', 'Jsc', 'FF', 'Eff', 'Vm', 'Im']):
-        axs[i].plot(results_df[param_name], results_df[param], 'o-')
-        axs[i].set_xlabel(param_name)
-        axs[i].set_ylabel(param)
-    
-    plt.tight_layout()
+        ctx.info("Generating performance trend charts and combined JV curves...")
+    
+    # 渲染趋势图和JV曲线叠加图；图像完全由预测结果决定，以其哈希命名，重复的扫描直接读取已保存的文件
+    key = input_key("batch", {"param_name": param_name, "results": results_df.to_dict("list")})
+    trends_file = output_path(f"trends_{param_name}", key)
+    jv_file = output_path(f"jv_curves_{param_name}", key)
+    cached = await asyncio.to_thread(output_cache.get_many, [trends_file, jv_file])
+    if cached is not None:
+        (trends_png, jv_png), render_timing = cached, {"queue_ms": 0.0, "run_ms": 0.0}
+    else:
+        (trends_png, jv_png), render_timing = await prediction_pool.run_timed(render_batch_pngs, results_df, param_name)
+        await asyncio.to_thread(output_cache.put, trends_file, trends_png)
+        await asyncio.to_thread(output_cache.put, jv_file, jv_png)
+    trends_image = Image(data=trends_png, format="png")
+    jv_curves_image = Image(data=jv_png, format="png")
     
-    # 保存趋势图
-    import datetime
-    import os
+    if ctx:
+        ctx.info(f"Batch simulation completed! predict {predict_timing['run_ms']:.1f} ms, "
+                 f"render {render_timing['run_ms']:.1f} ms")
     
-    # 确保输出目录存在
-    output_dir = os.getenv("OUTPUT_DIR", "simulation_results")
-    os.makedirs(output_dir, exist_ok=True)
+    result = {
+        "image": [trends_image, jv_curves_image]
+    }
+    result["text"] = {}
+    result["text"]["param_name"] = param_name
+    result["text"]["param_values"] = param_values.tolist()
+    result["text"]["results_table"] = results_df.to_dict()
+    result["text"]["trends_file"] = trends_file
+    result["text"]["jv_file"] = jv_file
+    result["text"]["timing"] = {"predict": format_timing(predict_timing), "render": format_timing(render_timing)}
     
-    # 使用当前时间创建文件名
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-    trends_file = os.path.join(output_dir, f"trends_{param_name}_{timestamp}.png")
-    plt.savefig(trends_file)
+    # 返回结果
+    return result
+
+@mcp.tool()
+async def predict_rows(
+    rows: list,                     # 参数字典列表
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """
+    批量预测多组参数的性能指标（供后端服务转发预测请求使用，不生成图像）
     
-    # 转换为MCP Image对象
-    trends_image = fig_to_image(fig_trends)
-    plt.close(fig_trends)
+    参数:
+    - rows: 参数字典列表，键可以是模型特征名（如'Dit Si-SiOx'）或工具参数名（如'Dit_Si_SiOx'），
+      缺省的参数使用默认值
     
-    if ctx:
-        ctx.info("Generating combined JV curves...")
+    返回:
+    - predictions: 与rows一一对应的预测结果 (Vm, Im, Voc, Jsc, FF, Eff)
+    """
+    inputs = [{**DEFAULT_PARAMS, **{feature_name(name): value for name, value in row.items()}} for row in rows]
+    # 经微批处理器预测：命中缓存的行直接返回，其余与其他并发请求合并
+    predictions = await asyncio.gather(*(prediction_batcher.predict(params) for params in inputs))
+    return {"text": {"predictions": predictions}}
+
+@mcp.tool()
+async def sweep_solar_cell(
+    param_ranges: dict = None,      # 网格扫描 {参数名: [初始值, 步长, 结束值]}，支持2-4个参数
+    bounds: dict = None,            # 拉丁超立方采样 {参数名: [下限, 上限]}
+    n_samples: int = None,          # 拉丁超立方采样点数
+    seed: int = 0,                  # 采样随机种子
+    Si_thk: float = 180.0,          # 硅片厚度(µm)
+    t_SiO2: float = 1.4,            # 二氧化硅厚度(nm)
+    t_polySi_rear_P: float = 100.0, # 背面多晶硅厚度(nm)
+    front_junc: float = 0.5,        # 前结(µm)
+    rear_junc: float = 0.5,         # 后结(µm)
+    resist_rear: float = 100.0,     # 背面电阻(Ω)
+    Nd_top: float = 1e20,           # 顶部掺杂浓度(cm^-3)
+    Nd_rear: float = 1e20,          # 背面掺杂浓度(cm^-3)
+    Nt_polySi_top: float = 1e20,    # 顶部多晶硅掺杂浓度(cm^-3)
+    Nt_polySi_rear: float = 1e20,   # 背面多晶硅掺杂浓度(cm^-3)
+    Dit_Si_SiOx: float = 1e10,      # Si-SiOx界面态密度(cm^-2)
+    Dit_SiOx_Poly: float = 1e10,    # SiOx-Poly界面态密度(cm^-2)
+    Dit_top: float = 1e10,          # 顶部界面态密度(cm^-2)
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """
+    多维参数扫描：同时扫描2~4个参数的网格，或用拉丁超立方采样生成上千个空间填充点
     
-    # 创建JV曲线叠加图 - 使用明确的轴对象
-    fig_jv, ax = plt.subplots(figsize=(10, 6))
-    ax.set_title(f"JV Curves vs {param_name}")
+    参数:
+    - param_ranges: 网格扫描，格式为 {参数名: [初始值, 步长, 结束值]}，
+      例如 {"Si_thk": [100, 20, 200], "Dit_Si_SiOx": [1e9, 1e10, 1e11]}
+    - bounds: 拉丁超立方采样，格式为 {参数名: [下限, 上限]}，需同时提供n_samples；
+      跨越两个数量级以上的参数在对数空间采样
+    - n_samples: 拉丁超立方采样点数
+    - seed: 采样随机种子
+    - 其余参数为未被扫描参数的固定值
     
-    # 根据参数值选择一个颜色映射
-    cmap = plt.get_cmap('viridis')
-    norm = plt.Normalize(min(param_values), max(param_values))
+    返回:
+    - 点数、各性能参数的最小/最大/平均值、效率最高的参数组合
+    - 点数不多时返回所有点的列式数据，完整结果另存为CSV文件
+    - 扫描两个参数时返回Voc/Jsc/FF/Eff的等高线图
+    """
+    if (param_ranges is None) == (bounds is None):
+        raise ValueError("Provide exactly one of param_ranges (grid) or bounds with n_samples (Latin hypercube)")
     
-    # 绘制所有JV曲线
-    for i, val in enumerate(param_values):
-        color = cmap(norm(val))
-        ax.plot(all_v_points[i], all_j_points[i], color=color, label=f"{param_name}={val}")
+    base_params = {
+        'Si_thk': Si_thk,
+        't_SiO2': t_SiO2,
+        't_polySi_rear_P': t_polySi_rear_P,
+        'front_junc': front_junc,
+        'rear_junc': rear_junc,
+        'resist_rear': resist_rear,
+        'Nd_top': Nd_top,
+        'Nd_rear': Nd_rear,
+        'Nt_polySi_top': Nt_polySi_top,
+        'Nt_polySi_rear': Nt_polySi_rear,
+        'Dit Si-SiOx': Dit_Si_SiOx,
+        'Dit SiOx-Poly': Dit_SiOx_Poly,
+        'Dit top': Dit_top
+    }
     
-    ax.set_xlabel('Voltage (V)')
-    ax.set_ylabel('Current Density (mA/cm²)')
+    # 生成扫描点
+    check_sweep_params(list(param_ranges if param_ranges is not None else bounds))
+    if param_ranges is not None:
+        points = grid_points(param_ranges)
+    else:
+        if not n_samples:
+            raise ValueError("n_samples is required when sampling with bounds")
+        points = latin_hypercube(bounds, n_samples, seed=seed)
+    swept = list(points.keys())
+    input_df = build_sweep_inputs(points, base_params)
+    total = len(input_df)
+    
+    # 输出文件以扫描输入和模型版本的哈希命名，相同的扫描复用已保存的文件
+    await asyncio.to_thread(check_model_version)
+    key = input_key("contour", {
+        "param_ranges": param_ranges,
+        "bounds": bounds,
+        "n_samples": n_samples if bounds is not None else None,
+        "seed": seed if bounds is not None else None,
+        "base_params": base_params,
+        "model_version": prediction_cache.version,
+    })
     
-    # 添加颜色条 - 修复颜色条问题，明确指定轴对象
-    sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
-    sm.set_array([])
-    cbar = fig_jv.colorbar(sm, ax=ax)
-    cbar.set_label(param_name)
+    if ctx:
+        ctx.info(f"Sweeping {swept} over {total} points...")
     
-    # 如果曲线太多，不显示图例
-    if len(param_values) <= 10:
-        ax.legend(loc='best')
+    # 分块批量预测并报告进度
+    chunks = []
+    for start in range(0, total, SWEEP_CHUNK_SIZE):
+        chunks.append(await prediction_pool.run(predict_batch, input_df.iloc[start:start + SWEEP_CHUNK_SIZE]))
+        if ctx:
+            await ctx.report_progress(min(start + SWEEP_CHUNK_SIZE, total), total)
+    results_df = pd.concat(chunks)
+    for name in swept:
+        results_df[name] = input_df[feature_name(name)].to_numpy()
+    results_df = results_df[swept + TARGETS]
     
-    plt.tight_layout()
+    # 保存完整结果；最多SWEEP_MAX_POINTS行，写文件放到线程中，不阻塞其他请求
+    output_dir = os.getenv("OUTPUT_DIR", "simulation_results")
+    os.makedirs(output_dir, exist_ok=True)
+    csv_file = output_cache.path(output_dir, f"sweep_{'_'.join(swept)}", key, ext="csv")
+    await asyncio.to_thread(results_df.to_csv, csv_file, index=False)
     
-    # 保存JV曲线叠加图
-    jv_file = os.path.join(output_dir, f"jv_curves_{param_name}_{timestamp}.png")
-    plt.savefig(jv_file)
+    result = {"image": []}
+    result["text"] = summarize_sweep(results_df, swept, include_columns=total <= SWEEP_INLINE_POINTS)
+    result["text"]["design"] = "grid" if param_ranges is not None else "latin_hypercube"
+    result["text"]["csv_file"] = csv_file
     
-    # 转换为MCP Image对象
-    jv_curves_image = fig_to_image(fig_jv)
-    plt.close(fig_jv)
+    # 两个参数时绘制等高线图
+    if len(swept) == 2 and total >= 4:
+        if ctx:
+            ctx.info("Generating contour plots...")
+        contour_file = output_path(f"contour_{'_'.join(swept)}", key)
+        png = await asyncio.to_thread(output_cache.get, contour_file)
+        if png is None:
+            png = await prediction_pool.run(render_sweep_png, results_df, swept[0], swept[1], param_ranges is not None)
+            await asyncio.to_thread(output_cache.put, contour_file, png)
+        result["image"].append(Image(data=png, format="png"))
+        result["text"]["contour_file"] = contour_file
     
     if ctx:
-        ctx.info("Batch simulation completed!")
-    
-    result = {
-        "image": [trends_image, jv_curves_image]
-    }
-    result["text"] = {}
-    result["text"]["param_name"] = param_name
-    result["text"]["param_values"] = param_values.tolist()
-    result["text"]["results_table"] = results_df.to_dict()
-    result["text"]["trends_file"] = trends_file
-    result["text"]["jv_file"] = jv_file
+        ctx.info("Sweep completed!")
     
-    # 返回结果
     return result
 
 @mcp.prompt()
@@ -638,6 +725,15 @@ def solar_simulation_help() -> str:
     - 显示各项性能参数随扫描参数变化的趋势图
     - 所有JV曲线的叠加对比图
     
+    ## 多维扫描功能
+    
+    使用sweep_solar_cell同时扫描多个参数:
+    
+    - param_ranges: 网格扫描，例如 {"Si_thk": [100, 20, 200], "Dit_Si_SiOx": [1e9, 1e10, 1e11]}
+    - bounds + n_samples: 拉丁超立方采样，例如 bounds={"Si_thk": [100, 200], "Nd_top": [1e19, 1e21]}, n_samples=2000
+    
+    扫描两个参数时会生成Voc/Jsc/FF/Eff的等高线图，完整结果保存为CSV文件
+    
     ## 示例问题
     
     - "请帮我仿真一个硅片厚度为180µm，二氧化硅厚度为1.5nm的太阳能电池"
@@ -658,13 +754,57 @@ def solar_simulation_help() -> str:
     - Im: 最大功率点电流密度(mA/cm²)
     
     同时会生成JV曲线图，显示电流-电压特性。所有图像都会自动保存到本地文件夹中。
+    只需要数值时可设置include_image=False，返回JV曲线数据而不生成图像，之后用render_jv_curve按需绘图。
     """
 
+@pyplot_locked
+def render_search_results_png(query: str, context_info: List[Dict[str, str]]) -> bytes:
+    """将检索结果绘制为表格图并编码为PNG"""
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(12, len(context_info) * 1.2 + 2))
+    ax.axis('tight')
+    ax.axis('off')
+    
+    table_data = []
+    for item in context_info:
+        # 截断内容以适应表格
+        content_preview = item["content"]
+        if len(content_preview) > 100:
+            content_preview = content_preview[:97] + "..."
+        
+        table_data.append([
+            item["file_name"],
+            content_preview,
+            item["similarity"]
+        ])
+    
+    table = ax.table(
+        cellText=table_data,
+        colLabels=["文件名", "内容预览", "相似度"],
+        loc='center',
+        cellLoc='left'
+    )
+    
+    # 调整表格样式
+    table.auto_set_font_size(False)
+    table.set_fontsize(9)
+    table.scale(1, 1.5)
+    
+    # 设置列宽
+    table.auto_set_column_width([0, 1, 2])
+    
+    plt.title(f"与查询 '{query}' 相关的文本")
+    plt.tight_layout()
+    return fig_to_png(fig)
+
 @mcp.tool()
 async def search_embedded_text(
     query: str,              # 查询文本
     top_n: int = 5,          # 返回的相似文本数量
     min_similarity: float = 0.5,  # 最小相似度阈值
+    nprobe: int = None,      # IVF索引探查的桶数量，越大召回率越高、越慢
+    ef: int = None,          # HNSW索引的候选队列长度，越大召回率越高、越慢
+    exact: bool = False,     # 是否忽略近似索引做暴力检索
     ctx: Context = None
 ) -> Dict[str, Any]:
     """
@@ -677,6 +817,9 @@ async def search_embedded_text(
     - query: 要搜索的查询文本
     - top_n: 返回的最相似文本数量
     - min_similarity: 最小相似度阈值，低于此值的结果将被过滤
+    - nprobe: IVF索引探查的桶数量，默认使用服务端配置
+    - ef: HNSW索引的候选队列长度，默认使用服务端配置
+    - exact: 为True时做精确的暴力检索
     
     返回:
     - 相似文本列表，包含文件名、内容和相似度
@@ -698,8 +841,9 @@ async def search_embedded_text(
         }
     
     try:
-        # 搜索相似文本
-        similar_texts = text_embedding.search_similar_texts(query, top_n=top_n, min_similarity=min_similarity)
+        # 搜索相似文本；编码查询（首次还需加载编码模型）是阻塞操作，在线程中执行
+        similar_texts = await asyncio.to_thread(text_embedding.search_similar_texts, query, top_n=top_n,
+                                                min_similarity=min_similarity, nprobe=nprobe, ef=ef, exact=exact)
         
         # 构建上下文信息
         for text, similarity, file_name in similar_texts:
@@ -711,47 +855,13 @@ async def search_embedded_text(
         
         if ctx:
             ctx.info(f"为查询 '{query}' 找到 {len(context_info)} 个相关上下文")
+        print(f"查询向量缓存: {text_embedding.query_cache.stats()}")
         
         # 创建结果表格图
+        # 与其他渲染一样在工作池中持有pyplot锁绘制，避免与并发渲染争用当前图像
         if context_info and len(context_info) > 0:
-            fig, ax = plt.subplots(figsize=(12, len(context_info) * 1.2 + 2))
-            ax.axis('tight')
-            ax.axis('off')
-            
-            table_data = []
-            for item in context_info:
-                # 截断内容以适应表格
-                content_preview = item["content"]
-                if len(content_preview) > 100:
-                    content_preview = content_preview[:97] + "..."
-                
-                table_data.append([
-                    item["file_name"],
-                    content_preview,
-                    item["similarity"]
-                ])
-            
-            table = ax.table(
-                cellText=table_data,
-                colLabels=["文件名", "内容预览", "相似度"],
-                loc='center',
-                cellLoc='left'
-            )
-            
-            # 调整表格样式
-            table.auto_set_font_size(False)
-            table.set_fontsize(9)
-            table.scale(1, 1.5)
-            
-            # 设置列宽
-            table.auto_set_column_width([0, 1, 2])
-            
-            plt.title(f"与查询 '{query}' 相关的文本")
-            plt.tight_layout()
-            
-            # 转换为MCP Image对象
-            results_image = fig_to_image(fig)
-            plt.close(fig)
+            png = await prediction_pool.run(render_search_results_png, query, context_info)
+            results_image = Image(data=png, format="png")
         else:
             results_image = None
     
@@ -774,12 +884,42 @@ async def search_embedded_text(
         "image": [results_image] if results_image else []
     }
 
+@mcp.tool()
+async def get_query_cache_stats(ctx: Context = None) -> Dict[str, Any]:
+    """
+    查看查询向量缓存的命中统计
+    
+    返回:
+    - 缓存大小、命中次数、磁盘命中次数、未命中次数和命中率
+    """
+    if text_embedding is None:
+        return {"text": {"error": "嵌入向量未加载"}}
+    return {"text": text_embedding.query_cache.stats()}
+
+@mcp.tool()
+async def get_prediction_cache_stats(ctx: Context = None) -> Dict[str, Any]:
+    """
+    查看仿真预测缓存的命中统计
+    
+    返回:
+    - 缓存大小、命中次数、未命中次数、命中率、失效次数和当前模型版本
+    - 渲染缓存统计、输出文件缓存的磁盘占用/命中率/淘汰数，以及工作池的运行/排队任务数、拒绝次数和平均耗时
+    """
+    return {"text": {
+        **prediction_cache.stats(),
+        "render_cache": render_cache.stats(),
+        "output_cache": output_cache.stats(),
+        "worker_pool": prediction_pool.stats(),
+        "batcher": prediction_batcher.stats()
+    }}
+
 @mcp.tool()
 async def process_directory_for_embedding(
     directory_path: str,         # 要处理的目录路径
     file_pattern: str = "*.txt", # 文件匹配模式
     truncate_length: int = None, # 文本截断长度，None表示不截断
     save_dir: str = "embedding", # 保存嵌入向量的目录
+    incremental: bool = True,    # 是否只处理新增或变化的文件
     ctx: Context = None
 ) -> Dict[str, Any]:
     """
@@ -787,12 +927,14 @@ async def process_directory_for_embedding(
     
     这个工具可以将一个目录中的文本文件转换为嵌入向量，用于后续的语义搜索。
     处理完成后，可以直接使用search_embedded_text工具进行搜索。
+    默认增量处理：只嵌入新增或内容变化的文件，并删除已移除文件的片段。
     
     参数:
     - directory_path: 要处理的目录路径
     - file_pattern: 文件匹配模式，如"*.txt"、"*.md"等
     - truncate_length: 文本截断长度，过长的文本将被分割
     - save_dir: 保存嵌入向量的目录
+    - incremental: 为False时重新处理全部文件并覆盖已有存储
     
     返回:
     - 处理结果，包含处理的文件数量、生成的嵌入向量数量等
@@ -802,18 +944,25 @@ async def process_directory_for_embedding(
     if ctx:
         ctx.info(f"开始处理目录 {directory_path} 中的文本文件...")
     
-    try:
-        # 初始化TextEmbedding
-        text_embedding = TextEmbedding()
-        
-        # 处理文本文件
-        text_embedding.process_directory(directory_path, file_pattern, truncate_length)
+    def update_store():
+        # 增量处理时基于已有存储更新，否则从空存储开始
+        if incremental and is_columnar_store(save_dir):
+            embedding = TextEmbedding.load_with_file_info(save_dir)
+        else:
+            embedding = TextEmbedding()
+        # 复用当前检索用的编码模型，不在内存中加载第二份
+        embedding.share_model(text_embedding)
         
         # 确保保存目录存在
         os.makedirs(save_dir, exist_ok=True)
         
-        # 保存嵌入向量
-        text_embedding.save_with_file_info(save_dir)
+        # 处理文本文件并保存嵌入向量
+        stats = embedding.update_directory(directory_path, save_dir, file_pattern, truncate_length)
+        return embedding, stats
+    
+    try:
+        # 加载模型、分块和编码都是阻塞操作，放到线程中执行，不阻塞其他请求
+        text_embedding, stats = await asyncio.to_thread(update_store)
         
         if ctx:
             ctx.info(f"嵌入向量生成完成，已保存到 {save_dir} 目录")
@@ -823,6 +972,7 @@ async def process_directory_for_embedding(
                 "status": "success",
                 "embedding_dir": save_dir,
                 "vector_count": len(text_embedding),
+                "files": stats,
                 "message": f"嵌入向量生成完成，已保存到 {save_dir} 目录",
             }
         }
@@ -857,9 +1007,14 @@ def create_starlette_app(mcp_server: Server, *, debug: bool = False) -> Starlett
                 mcp_server.create_initialization_options(),
             )
 
+    async def handle_health(request: Request) -> JSONResponse:
+        """模型加载状态，供部署检查和后端判断是否就绪"""
+        return JSONResponse({"status": "ok", "models": registry.status(), "output_cache": output_cache.stats()})
+
     return Starlette(
         debug=debug,
         routes=[
+            Route("/health", endpoint=handle_health),
             Route("/sse", endpoint=handle_sse),
             Mount("/messages/", app=sse.handle_post_message),
         ],
@@ -875,6 +1030,17 @@ if __name__ == "__main__":
     parser.add_argument('--stdio', action='store_true', help='使用STDIO而不是SSE')
     args = parser.parse_args()
     
+    # 后台预加载预测模型，不阻塞服务启动
+    if MODEL_WARMUP:
+        registry.warm_up()
+        # 编码模型同样在后台预加载，第一次检索不必等待
+        if text_embedding is not None:
+            text_embedding.warm_up()
+    
+    # 后台按大小和访问时间清理输出目录
+    if OUTPUT_SWEEP_INTERVAL > 0:
+        output_cache.start_sweeper(OUTPUT_SWEEP_INTERVAL)
+    
     if args.stdio:
         # 使用STDIO传输运行
         print("启动太阳能电池仿真MCP服务器，使用STDIO传输")
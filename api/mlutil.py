@@ -1,24 +1,770 @@
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from autogluon.tabular import TabularPredictor, TabularDataset
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, Any, TYPE_CHECKING
+from collections import OrderedDict
 import os
+import math
+import time
+import threading
+import functools
+from io import BytesIO
 from dotenv import load_dotenv
+try:
+    from workers import MicroBatcher, WorkerPool, recycle_process_pools
+    from model_registry import (
+        registry, load_predictors, model_version, model_base_path, TARGETS, FAST_INFERENCE_MODES,
+    )
+except ImportError:
+    from api.workers import MicroBatcher, WorkerPool, recycle_process_pools
+    from api.model_registry import (
+        registry, load_predictors, model_version, model_base_path, TARGETS, FAST_INFERENCE_MODES,
+    )
 load_dotenv()
-model_base_path = os.getenv("MODEL_DIR", "final_small")
-if not os.path.exists(model_base_path):
-    raise FileNotFoundError(f"模型目录 {model_base_path} 不存在")
-predictor={}
-for param in ['Vm', 'Im', 'Voc', 'Jsc', 'FF', 'Eff']:
-    model_path = os.path.join(model_base_path, param)
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"模型 {param} 不存在于路径 {model_path}")
+
+# matplotlib和AutoGluon导入耗时数秒，只在绘图/加载模型时导入，服务可以立即启动
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+    from autogluon.tabular import TabularPredictor
+
+# 单次predict调用的最大行数，超大扫描分块预测以限制内存
+PREDICT_CHUNK_SIZE = int(os.getenv("PREDICT_CHUNK_SIZE", "10000"))
+# 多维扫描允许的最大点数，以及同时扫描的参数个数范围
+SWEEP_MAX_POINTS = int(os.getenv("SWEEP_MAX_POINTS", "100000"))
+SWEEP_MIN_PARAMS = 2
+SWEEP_MAX_PARAMS = int(os.getenv("SWEEP_MAX_PARAMS", "4"))
+# 预测缓存：最大条目数、键中保留的有效数字位数、检查模型目录是否变化的间隔(秒)
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "4096"))
+PREDICTION_CACHE_DIGITS = int(os.getenv("PREDICTION_CACHE_DIGITS", "6"))
+MODEL_VERSION_CHECK_INTERVAL = float(os.getenv("MODEL_VERSION_CHECK_INTERVAL", "30"))
+# 渲染缓存：每组参数的JV曲线PNG只渲染一次
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "256"))
+
+# 模型输入特征
+FEATURES = ['Si_thk', 't_SiO2', 't_polySi_rear_P', 'front_junc', 'rear_junc', 'resist_rear',
+            'Nd_top', 'Nd_rear', 'Nt_polySi_top', 'Nt_polySi_rear',
+            'Dit Si-SiOx', 'Dit SiOx-Poly', 'Dit top']
+# API/工具参数名 -> 模型特征名
+PARAM_ALIASES = {
+    'Dit_Si_SiOx': 'Dit Si-SiOx',
+    'Dit_SiOx_Poly': 'Dit SiOx-Poly',
+    'Dit_top': 'Dit top',
+}
+# 默认输入参数（模型特征名）
+DEFAULT_PARAMS = {
+    'Si_thk': 180,
+    't_SiO2': 1.4,
+    't_polySi_rear_P': 100,
+    'front_junc': 0.5,
+    'rear_junc': 0.5,
+    'resist_rear': 100,
+    'Nd_top': 1e20,
+    'Nd_rear': 1e20,
+    'Nt_polySi_top': 1e20,
+    'Nt_polySi_rear': 1e20,
+    'Dit Si-SiOx': 1e10,
+    'Dit SiOx-Poly': 1e10,
+    'Dit top': 1e10
+}
+
+
+class PredictionCache:
+    """
+    预测结果的LRU缓存，键为按有效数字取整后的13个输入参数，
+    并绑定模型版本：模型目录内容变化时整体失效
+    """
+    
+    def __init__(self, maxsize: int = PREDICTION_CACHE_SIZE, digits: int = PREDICTION_CACHE_DIGITS):
+        self.maxsize = maxsize
+        self.digits = digits
+        self.version: Optional[str] = None
+        self._entries: "OrderedDict[Tuple[float, ...], Dict[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def key(self, input_params: Dict[str, float]) -> Tuple[float, ...]:
+        """
+        按有效数字取整，使 1e20 与 1.0000000001e20 这类等价输入命中同一条目
+        """
+        return tuple(float(f"{float(input_params[name]):.{self.digits}g}") for name in FEATURES)
+    
+    def get(self, key: Tuple[float, ...]) -> Optional[Dict[str, float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry)
+    
+    def put(self, key: Tuple[float, ...], predictions: Dict[str, float], version: Optional[str] = None) -> None:
+        """
+        写入预测结果；给出version（开始预测前读取的self.version）时，若期间模型已更新则丢弃，
+        避免旧模型的结果在失效之后写回缓存
+        """
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._entries[key] = dict(predictions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, version: Optional[str]) -> None:
+        """
+        清空缓存并记录新的模型版本
+        """
+        with self._lock:
+            if self.version is not None:
+                self.invalidations += 1
+            self._entries.clear()
+            self.version = version
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "model_version": self.version,
+            }
+
+
+prediction_cache = PredictionCache()
+_model_lock = threading.Lock()
+# 模型版本在第一次预测时才计算（遍历模型目录），导入本模块不做磁盘I/O
+_last_version_check = 0.0
+_version_check_lock = threading.Lock()
+_version_check_running = False
+
+
+def check_model_version() -> None:
+    """
+    每隔MODEL_VERSION_CHECK_INTERVAL秒检查一次模型目录，内容变化时重新加载模型并清空预测缓存
+
+    遍历模型目录和重新加载模型都是阻塞操作，事件循环中应使用request_model_version_check
+    """
+    global _last_version_check
+    if time.time() - _last_version_check < MODEL_VERSION_CHECK_INTERVAL:
+        return
+    with _model_lock:
+        if time.time() - _last_version_check < MODEL_VERSION_CHECK_INTERVAL:
+            return
+        _last_version_check = time.time()
+        version = model_version(model_base_path)
+        if version == prediction_cache.version:
+            return
+        if prediction_cache.version is None and registry.version in (None, version):
+            # 首次检查只记录版本；已加载的模型与当前目录一致时无需重新加载
+            prediction_cache.invalidate(version)
+            return
+        print(f"检测到模型目录 {model_base_path} 已变化，重新加载模型...")
+        registry.reload()
+        # 进程池中的子进程各自持有模型，先替换进程再更新版本：读到新版本的请求只会提交给新进程
+        recycle_process_pools()
+        prediction_cache.invalidate(version)
+        render_cache.clear()
+
+
+def request_model_version_check() -> None:
+    """
+    非阻塞地触发模型版本检查：未到检查间隔时直接返回，否则在后台线程中执行check_model_version，
+    同一时间最多一个检查线程；供事件循环中的调用方使用
+    """
+    global _version_check_running
+    if time.time() - _last_version_check < MODEL_VERSION_CHECK_INTERVAL:
+        return
+    with _version_check_lock:
+        if _version_check_running:
+            return
+        _version_check_running = True
+    
+    def run():
+        global _version_check_running
+        try:
+            check_model_version()
+        except Exception as e:
+            print(f"检查模型版本失败: {e}")
+        finally:
+            with _version_check_lock:
+                _version_check_running = False
+    
+    threading.Thread(target=run, name="model-version-check", daemon=True).start()
+
+
+def predict_cached(input_params: Dict[str, float]) -> Dict[str, float]:
+    """
+    预测单组参数，相同输入（按有效数字取整）直接返回缓存结果
+    
+    Args:
+        input_params (Dict[str, float]): 13个输入参数，键可以是模型特征名或API参数名
+        
+    Returns:
+        Dict[str, float]: 预测参数字典 (Vm, Im, Voc, Jsc, FF, Eff)
+    """
+    check_model_version()
+    params = {feature_name(name): value for name, value in input_params.items()}
+    key = prediction_cache.key(params)
+    
+    predictions = prediction_cache.get(key)
+    if predictions is None:
+        version = prediction_cache.version
+        row = predict_batch(pd.DataFrame([{name: params[name] for name in FEATURES}])).iloc[0]
+        predictions = {param: float(value) for param, value in row.items()}
+        prediction_cache.put(key, predictions, version)
+    return predictions
+
+
+class RenderCache:
+    """
+    渲染结果（PNG字节）的LRU缓存，键由调用方给出，通常为(图类型, 预测缓存键, 预测值)
+    """
+    
+    def __init__(self, maxsize: int = RENDER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get_or_render(self, key: Tuple, render) -> bytes:
+        """
+        命中时直接返回缓存的PNG，否则调用render()生成并缓存
+        """
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return png
+            self.misses += 1
+        
+        # 渲染在锁外进行，避免阻塞其他参数组的查询
+        png = render()
+        with self._lock:
+            self._entries[key] = png
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return png
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+render_cache = RenderCache()
+
+
+def render_key(kind: str, input_params: Dict[str, float], predictions: Dict[str, float]) -> Tuple:
+    """
+    生成渲染缓存键：图类型 + 取整后的输入参数 + 预测值
+    
+    图像完全由预测值决定，键中包含预测值而非本地模型版本，预测转发到其他进程时同样不会返回过期图像
+    """
+    params = {feature_name(name): value for name, value in input_params.items()}
+    return (kind, prediction_cache.key(params), tuple(predictions[param] for param in TARGETS))
+
+
+# pyplot的"当前图像"是进程内全局状态，线程池中的渲染需串行执行；需要并行渲染时使用进程池
+_pyplot_lock = threading.Lock()
+
+
+def pyplot_locked(fn):
+    """
+    装饰器：持有pyplot锁执行绘图函数
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with _pyplot_lock:
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def fig_to_png(fig: "Figure", **savefig_kwargs) -> bytes:
+    """
+    将matplotlib图像编码为PNG字节并关闭图像，savefig_kwargs传给fig.savefig（如bbox_inches）
+    """
+    import matplotlib.pyplot as plt
+    buf = BytesIO()
+    fig.savefig(buf, format='png', **savefig_kwargs)
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def predict_rows(rows: List[Dict[str, float]]) -> List[Dict[str, float]]:
+    """
+    批量预测多组参数（键为模型特征名），返回与rows对应的预测字典列表
+    """
+    results_df = predict_batch(pd.DataFrame(rows, columns=FEATURES))
+    return [{param: float(value) for param, value in row.items()} for row in results_df.to_dict('records')]
+
+
+class PredictionBatcher(MicroBatcher):
+    """
+    单组参数预测的微批处理器：并发到达的请求合并为一次predict，
+    命中预测缓存的请求不进入批次，结果写回缓存
+    """
+    
+    def __init__(self, pool: Optional[WorkerPool] = None, batch_fn=predict_rows, use_cache: bool = True, **kwargs):
+        """
+        Args:
+            pool (Optional[WorkerPool]): 执行本地预测的工作池
+            batch_fn: 批量预测函数，默认在本进程预测；也可以是转发到其他进程的异步函数
+            use_cache (bool): 是否使用本进程的预测缓存；转发到远程时由远程端缓存，
+                本地缓存无法感知远程模型的版本变化，应关闭
+        """
+        super().__init__(batch_fn, pool=pool, **kwargs)
+        self.use_cache = use_cache
+    
+    async def predict(self, input_params: Dict[str, float]) -> Dict[str, float]:
+        """
+        异步预测单组参数，语义同predict_cached
+        """
+        params = {feature_name(name): value for name, value in input_params.items()}
+        row = {name: params[name] for name in FEATURES}
+        if not self.use_cache:
+            return dict(await self.submit(prediction_cache.key(params), row))
+        
+        # 版本检查在后台线程中进行，不阻塞事件循环
+        request_model_version_check()
+        key = prediction_cache.key(params)
+        predictions = prediction_cache.get(key)
+        if predictions is None:
+            version = prediction_cache.version
+            predictions = await self.submit(key, row)
+            prediction_cache.put(key, predictions, version)
+        return dict(predictions)
+
+
+def predict_batch(input_df: pd.DataFrame, chunk_size: int = PREDICT_CHUNK_SIZE,
+                  predictors: Optional[Dict[str, "TabularPredictor"]] = None) -> pd.DataFrame:
+    """
+    批量预测太阳能电池参数，每个模型对所有行只调用一次predict
+    
+    Args:
+        input_df (pd.DataFrame): 每行一组输入参数，列名同predict_solar_params的输入键
+        chunk_size (int): 单次predict的最大行数，超出时分块
+        predictors (Optional[Dict[str, TabularPredictor]]): 使用的模型，默认为全局加载的模型
+        
+    Returns:
+        pd.DataFrame: 与input_df行对应的预测结果，列为 Vm, Im, Voc, Jsc, FF, Eff
+    """
+    from autogluon.tabular import TabularDataset
+    
+    predictors = predictors or registry.get()
+    results = {param: np.empty(len(input_df), dtype=float) for param in TARGETS}
+    
+    for start in range(0, len(input_df), chunk_size):
+        chunk = TabularDataset(input_df.iloc[start:start + chunk_size])
+        for param in TARGETS:
+            results[param][start:start + len(chunk)] = predictors[param].predict(chunk).to_numpy(dtype=float)
+    
+    return pd.DataFrame(results, index=input_df.index)
+
+
+def jv_curve_points(voc, jsc, n_points: int = 100) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    使用简化的单二极管模型计算JV曲线上的点，支持批量输入
+    
+    Args:
+        voc: 开路电压，标量或形状为(N,)的数组
+        jsc: 短路电流密度，形状与voc相同
+        n_points (int): 每条曲线的采样点数
+        
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: 电压点和电流点，标量输入时形状为(n_points,)，
+        批量输入时形状为(N, n_points)
+    """
+    voc = np.asarray(voc, dtype=float)
+    jsc = np.asarray(jsc, dtype=float)
+    v_points = np.linspace(0, 1, n_points) * voc[..., None]
+    j_points = jsc[..., None] * (1 - np.exp((v_points - voc[..., None]) / 0.026))
+    return v_points, j_points
+
+
+def feature_name(name: str) -> str:
+    """
+    将API/工具参数名（如Dit_Si_SiOx）或模型特征名转换为模型特征名
+    """
+    feature = PARAM_ALIASES.get(name, name)
+    if feature not in FEATURES:
+        raise ValueError(f"Parameter name '{name}' is invalid. Valid parameters: {FEATURES}")
+    return feature
+
+
+def grid_points(param_ranges: Dict[str, List[float]], max_points: int = SWEEP_MAX_POINTS) -> Dict[str, np.ndarray]:
+    """
+    生成多维全因子网格
+    
+    Args:
+        param_ranges (Dict[str, List[float]]): {参数名: [初始值, 步长, 结束值]}
+        max_points (int): 允许的最大点数
+        
+    Returns:
+        Dict[str, np.ndarray]: 每个参数在所有网格点上的取值，第一个参数变化最慢
+    """
+    # 先由范围算出各轴长度并检查总点数，再分配数组：[0, 1e-12, 1] 这类范围不能先生成10^12个点
+    lengths = []
+    for name, param_range in param_ranges.items():
+        feature_name(name)
+        if len(param_range) != 3:
+            raise ValueError(f"Range of '{name}' must contain three values: [start, step, end]")
+        start_val, step_val, end_val = (float(value) for value in param_range)
+        if not all(np.isfinite([start_val, step_val, end_val])) or step_val <= 0 or end_val < start_val:
+            raise ValueError(f"Range of '{name}' must satisfy step > 0 and end >= start")
+        lengths.append(math.floor((end_val - start_val) / step_val + 0.5) + 1)
+    
+    n_points = math.prod(lengths)
+    if n_points > max_points:
+        raise ValueError(f"Grid has {n_points} points, more than the limit of {max_points}")
+    
+    axes = [np.arange(start_val, end_val + step_val / 2, step_val)
+            for start_val, step_val, end_val in param_ranges.values()]
+    mesh = np.meshgrid(*axes, indexing='ij')
+    return {name: values.ravel() for name, values in zip(param_ranges, mesh)}
+
+
+def check_sweep_params(names: List[str]) -> None:
+    """
+    检查多维扫描的参数个数（SWEEP_MIN_PARAMS到SWEEP_MAX_PARAMS个）和参数名
+
+    Raises:
+        ValueError: 参数个数超出范围或参数名无效
+    """
+    if not SWEEP_MIN_PARAMS <= len(names) <= SWEEP_MAX_PARAMS:
+        raise ValueError(f"A sweep must vary {SWEEP_MIN_PARAMS} to {SWEEP_MAX_PARAMS} parameters, got {len(names)}")
+    for name in names:
+        feature_name(name)
+
+
+def latin_hypercube(bounds: Dict[str, List[float]], n_samples: int, seed: int = 0,
+                    log_scale: Optional[List[str]] = None,
+                    max_points: int = SWEEP_MAX_POINTS) -> Dict[str, np.ndarray]:
+    """
+    拉丁超立方采样：每个参数的范围等分为n_samples层，每层恰好取一个点
+    
+    Args:
+        bounds (Dict[str, List[float]]): {参数名: [下限, 上限]}
+        n_samples (int): 采样点数
+        seed (int): 随机种子
+        log_scale (Optional[List[str]]): 在对数空间采样的参数；默认对下限为正且跨越两个数量级以上的参数（如掺杂浓度、界面态密度）取对数
+        max_points (int): 允许的最大点数
         
-    predictor[param] = TabularPredictor.load(model_path)
+    Returns:
+        Dict[str, np.ndarray]: 每个参数的采样值
+    """
+    if n_samples <= 0 or n_samples > max_points:
+        raise ValueError(f"n_samples must be between 1 and {max_points}")
     
+    rng = np.random.default_rng(seed)
+    # 各维度独立打乱层序号，再在层内均匀取点
+    strata = rng.permuted(np.tile(np.arange(n_samples), (len(bounds), 1)), axis=1)
+    unit = (strata + rng.random(strata.shape)) / n_samples
+    
+    points = {}
+    for i, (name, bound) in enumerate(bounds.items()):
+        feature_name(name)
+        if len(bound) != 2 or bound[1] < bound[0]:
+            raise ValueError(f"Bounds of '{name}' must be [low, high] with high >= low")
+        low, high = float(bound[0]), float(bound[1])
+        use_log = name in log_scale if log_scale is not None else (low > 0 and high / low >= 100)
+        if use_log:
+            points[name] = 10 ** (np.log10(low) + unit[i] * (np.log10(high) - np.log10(low)))
+        else:
+            points[name] = low + unit[i] * (high - low)
+    return points
+
 
-def predict_solar_params(input_params: Dict[str, float]) -> Tuple[Dict[str, float], plt.Figure]:
+def build_sweep_inputs(points: Dict[str, np.ndarray], base_params: Optional[Dict[str, float]] = None) -> pd.DataFrame:
+    """
+    将扫描点与固定参数组合为模型输入表
+    
+    Args:
+        points (Dict[str, np.ndarray]): 被扫描参数的取值
+        base_params (Optional[Dict[str, float]]): 固定参数，未提供的使用DEFAULT_PARAMS
+        
+    Returns:
+        pd.DataFrame: 列为模型特征的输入表
+    """
+    n_points = len(next(iter(points.values())))
+    params = dict(DEFAULT_PARAMS)
+    for name, value in (base_params or {}).items():
+        params[feature_name(name)] = value
+    
+    input_df = pd.DataFrame({name: np.full(n_points, float(value)) for name, value in params.items()})
+    for name, values in points.items():
+        input_df[feature_name(name)] = values
+    return input_df
+
+
+def summarize_sweep(results_df: pd.DataFrame, swept: List[str], include_columns: bool = True) -> Dict:
+    """
+    生成扫描结果的紧凑表示
+    
+    Args:
+        results_df (pd.DataFrame): 列为被扫描参数和预测目标的结果表
+        swept (List[str]): 被扫描参数名
+        include_columns (bool): 是否包含所有点的列式数据
+        
+    Returns:
+        Dict: 点数、各目标的统计量、效率最高的点，以及可选的列式数据 {列名: 值列表}
+    """
+    best = results_df.loc[results_df['Eff'].idxmax()]
+    summary = {
+        "swept_params": swept,
+        "n_points": len(results_df),
+        "stats": {
+            param: {
+                "min": float(results_df[param].min()),
+                "max": float(results_df[param].max()),
+                "mean": float(results_df[param].mean()),
+            }
+            for param in TARGETS
+        },
+        "best_eff": {name: float(best[name]) for name in swept + TARGETS},
+    }
+    if include_columns:
+        summary["columns"] = {name: results_df[name].astype(float).tolist() for name in swept + TARGETS}
+    return summary
+
+
+def plot_sweep_2d(results_df: pd.DataFrame, x_name: str, y_name: str, is_grid: bool) -> "Figure":
+    """
+    绘制二维扫描的等高线图（Voc, Jsc, FF, Eff）
+    
+    Args:
+        results_df (pd.DataFrame): 扫描结果
+        x_name (str): x轴参数
+        y_name (str): y轴参数
+        is_grid (bool): 是否为规则网格；否则按散点三角剖分绘制
+        
+    Returns:
+        plt.Figure: 图像
+    """
+    import matplotlib.pyplot as plt
+    
+    fig, axs = plt.subplots(2, 2, figsize=(12, 9))
+    fig.suptitle(f"Solar Cell Performance vs {x_name} and {y_name}", fontsize=14)
+    
+    x = results_df[x_name].to_numpy()
+    y = results_df[y_name].to_numpy()
+    if is_grid:
+        nx, ny = len(np.unique(x)), len(np.unique(y))
+    
+    for ax, param in zip(axs.flatten(), ['Voc', 'Jsc', 'FF', 'Eff']):
+        z = results_df[param].to_numpy()
+        if is_grid:
+            # grid_points中第一个参数变化最慢
+            contour = ax.contourf(x.reshape(nx, ny), y.reshape(nx, ny), z.reshape(nx, ny), levels=20, cmap='viridis')
+        else:
+            contour = ax.tricontourf(x, y, z, levels=20, cmap='viridis')
+            ax.plot(x, y, 'k.', markersize=1, alpha=0.3)
+        fig.colorbar(contour, ax=ax, label=param)
+        ax.set_xlabel(x_name)
+        ax.set_ylabel(y_name)
+        # 跨越多个数量级的参数使用对数坐标
+        if x.min() > 0 and x.max() / x.min() >= 100:
+            ax.set_xscale('log')
+        if y.min() > 0 and y.max() / y.min() >= 100:
+            ax.set_yscale('log')
+    
+    plt.tight_layout()
+    return fig
+
+
+def jv_curve_data(predictions: Dict[str, float], n_points: int = 100, decimals: Optional[int] = None) -> Dict[str, Any]:
+    """
+    返回JV曲线的原始数据，供前端自行绘图或只需要数值的调用方使用
+    
+    Args:
+        predictions (Dict[str, float]): 预测参数字典，至少包含 Voc, Jsc, Vm, Im
+        n_points (int): 曲线采样点数
+        decimals (Optional[int]): 保留的小数位数，为None时不取整
+        
+    Returns:
+        Dict[str, Any]: voltage、current_density 两个列表以及最大功率点 mpp
+    """
+    v_points, j_points = jv_curve_points(predictions['Voc'], predictions['Jsc'], n_points)
+    if decimals is not None:
+        v_points = np.round(v_points, decimals)
+        j_points = np.round(j_points, decimals)
+    return {
+        "voltage": v_points.tolist(),
+        "current_density": j_points.tolist(),
+        "mpp": {"V": predictions['Vm'], "J": predictions['Im']},
+    }
+
+
+def plot_jv_curve(predictions: Dict[str, float], annotate: bool = False) -> "Figure":
+    """
+    根据预测参数绘制JV曲线
+    
+    Args:
+        predictions (Dict[str, float]): 预测参数字典
+        annotate (bool): 是否在图中标注Voc/Jsc/FF/Eff（MCP工具使用的样式）
+    """
+    import matplotlib.pyplot as plt
+    
+    fig = plt.figure(figsize=(10, 6))
+    
+    # 生成电压点和电流点 (使用简化的单二极管模型)
+    v_points, j_points = jv_curve_points(predictions['Voc'], predictions['Jsc'])
+    
+    # 绘制JV曲线
+    if annotate:
+        plt.plot(v_points, j_points, 'b-', label='JV Curve')
+        plt.plot([0, predictions['Vm']], [predictions['Jsc'], predictions['Im']], 'r--', label='Max Power Line')
+        plt.plot([predictions['Vm']], [predictions['Im']], 'ro', label='Max Power Point')
+    else:
+        plt.plot(v_points, j_points, 'b-', label='JV')
+        plt.plot([0, predictions['Vm']], [predictions['Jsc'], predictions['Im']], 'r--', label='MPP')
+        plt.plot([predictions['Vm']], [predictions['Im']], 'ro', label='MPP')
+    
+    plt.xlabel('Voltage (V)')
+    plt.ylabel('Current Density (mA/cm²)')
+    plt.title('Solar Cell JV Curve' if annotate else 'JV Curve')
+    plt.legend()
+    
+    if annotate:
+        # 在图表中显示关键参数
+        props = dict(boxstyle='round', facecolor='wheat', alpha=0.5)
+        param_text = '\n'.join([
+            f"Voc = {predictions['Voc']:.4f} V",
+            f"Jsc = {predictions['Jsc']:.4f} mA/cm²",
+            f"FF = {predictions['FF']:.2f} %",
+            f"Eff = {predictions['Eff']:.2f} %"
+        ])
+        plt.annotate(param_text, xy=(0.05, 0.05), xycoords='axes fraction', 
+                     bbox=props, fontsize=9)
+    
+    return fig
+
+
+@pyplot_locked
+def render_jv_png(predictions: Dict[str, float], annotate: bool = False) -> bytes:
+    """
+    渲染JV曲线为PNG（不经过缓存）
+    """
+    return fig_to_png(plot_jv_curve(predictions, annotate))
+
+
+def render_jv_curve_png(input_params: Dict[str, float], annotate: bool = False,
+                        predictions: Optional[Dict[str, float]] = None) -> Tuple[Dict[str, float], bytes]:
+    """
+    预测并渲染JV曲线PNG，同一组参数（同一模型版本）只渲染一次
+    
+    Args:
+        input_params (Dict[str, float]): 输入参数
+        annotate (bool): 是否标注关键参数
+        predictions (Optional[Dict[str, float]]): 已有的预测结果（如来自微批处理器），为None时在此预测
+    
+    Returns:
+        Tuple[Dict[str, float], bytes]: 预测参数字典和PNG字节
+    """
+    if predictions is None:
+        predictions = predict_cached(input_params)
+    png = render_cache.get_or_render(
+        render_key("jv_curve_annotated" if annotate else "jv_curve", input_params, predictions),
+        lambda: render_jv_png(predictions, annotate),
+    )
+    return predictions, png
+
+
+@pyplot_locked
+def render_sweep_png(results_df: pd.DataFrame, x_name: str, y_name: str, is_grid: bool) -> bytes:
+    """
+    渲染双参数扫描的等高线图为PNG
+    """
+    return fig_to_png(plot_sweep_2d(results_df, x_name, y_name, is_grid))
+
+
+@pyplot_locked
+def render_batch_pngs(results_df: pd.DataFrame, param_name: str) -> Tuple[bytes, bytes]:
+    """
+    渲染单参数批量仿真的性能趋势图和JV曲线叠加图
+    
+    Args:
+        results_df (pd.DataFrame): 预测结果，包含param_name列和各性能参数列
+        param_name (str): 扫描的参数名
+        
+    Returns:
+        Tuple[bytes, bytes]: 趋势图PNG和JV曲线叠加图PNG
+    """
+    import matplotlib.pyplot as plt
+    
+    param_values = results_df[param_name].to_numpy()
+    
+    # 创建性能趋势图
+    fig_trends = plt.figure(figsize=(12, 8))
+    fig_trends.suptitle(f"Solar Cell Performance vs {param_name}", fontsize=14)
+    
+    # 创建子图
+    axs = fig_trends.subplots(2, 3)
+    axs = axs.flatten()
+    
+    # 绘制各个性能参数的趋势
+    for i, param in enumerate(['Voc', 'Jsc', 'FF', 'Eff', 'Vm', 'Im']):
+        axs[i].plot(results_df[param_name], results_df[param], 'o-')
+        axs[i].set_xlabel(param_name)
+        axs[i].set_ylabel(param)
+    
+    fig_trends.tight_layout()
+    trends_png = fig_to_png(fig_trends)
+    
+    # 批量计算所有JV曲线
+    all_v_points, all_j_points = jv_curve_points(results_df['Voc'].to_numpy(), results_df['Jsc'].to_numpy())
+    
+    # 创建JV曲线叠加图 - 使用明确的轴对象
+    fig_jv, ax = plt.subplots(figsize=(10, 6))
+    ax.set_title(f"JV Curves vs {param_name}")
+    
+    # 根据参数值选择一个颜色映射
+    cmap = plt.get_cmap('viridis')
+    norm = plt.Normalize(min(param_values), max(param_values))
+    
+    # 绘制所有JV曲线
+    for i, val in enumerate(param_values):
+        color = cmap(norm(val))
+        ax.plot(all_v_points[i], all_j_points[i], color=color, label=f"{param_name}={val}")
+    
+    ax.set_xlabel('Voltage (V)')
+    ax.set_ylabel('Current Density (mA/cm²)')
+    
+    # 添加颜色条 - 明确指定轴对象
+    sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
+    sm.set_array([])
+    cbar = fig_jv.colorbar(sm, ax=ax)
+    cbar.set_label(param_name)
+    
+    # 如果曲线太多，不显示图例
+    if len(param_values) <= 10:
+        ax.legend(loc='best')
+    
+    fig_jv.tight_layout()
+    jv_png = fig_to_png(fig_jv)
+    
+    return trends_png, jv_png
+
+
+def predict_solar_params(input_params: Dict[str, float], render: bool = True) -> Tuple[Dict[str, float], Optional["Figure"]]:
     """
     使用训练好的模型预测太阳能电池参数并绘制JV曲线
     
@@ -37,48 +783,123 @@ def predict_solar_params(input_params: Dict[str, float]) -> Tuple[Dict[str, floa
             - Dit Si-SiOx: Si-SiOx界面态密度
             - Dit SiOx-Poly: SiOx-Poly界面态密度
             - Dit top: 顶部界面态密度
+        render (bool): 是否绘制JV曲线，为False时只返回预测结果（数据模式）
             
     Returns:
-        Tuple[Dict[str, float], plt.Figure]: 
+        Tuple[Dict[str, float], Optional[plt.Figure]]: 
             - 预测参数字典 (Vm, Im, Voc, Jsc, FF, Eff)
-            - JV曲线图像
+            - JV曲线图像，render为False时为None
     """
-    # 检查模型目录是否存在
-
-    
-    # 准备输入数据
-    input_df = pd.DataFrame([input_params])
-    input_data = TabularDataset(input_df)
-    
     # 预测结果字典
-    predictions = {}
+    predictions = predict_cached(input_params)
     
-    # 对每个参数进行预测
-    for param in ['Vm', 'Im', 'Voc', 'Jsc', 'FF', 'Eff']:
-        predictions[param] = float(predictor[param].predict(input_data).iloc[0])
+    # 创建JV曲线；绘图修改pyplot全局状态，与工作池中的渲染函数共用同一把锁
+    fig = None
+    if render:
+        with _pyplot_lock:
+            fig = plot_jv_curve(predictions)
     
-    # 创建JV曲线
-    fig = plt.figure(figsize=(10, 6))
+    return predictions, fig
+
+# 基准测试的采样范围（各参数的典型取值范围）
+BENCHMARK_BOUNDS = {
+    'Si_thk': [160, 200],
+    't_SiO2': [1, 2],
+    't_polySi_rear_P': [50, 150],
+    'front_junc': [0.3, 0.7],
+    'rear_junc': [0.3, 0.7],
+    'resist_rear': [50, 200],
+    'Nd_top': [1e19, 1e21],
+    'Nd_rear': [1e19, 1e21],
+    'Nt_polySi_top': [1e19, 1e21],
+    'Nt_polySi_rear': [1e19, 1e21],
+    'Dit Si-SiOx': [1e9, 1e12],
+    'Dit SiOx-Poly': [1e9, 1e12],
+    'Dit top': [1e9, 1e12],
+}
+
+
+def benchmark_inference(base_path: str = model_base_path, modes: Tuple[str, ...] = FAST_INFERENCE_MODES,
+                        n_rows: int = 1000, repeats: int = 20, seed: int = 0) -> Dict[str, Dict[str, Any]]:
+    """
+    比较各快速推理模式的单行/批量预测延迟，并以off模式为基准检查预测精度
     
-    # 生成电压点
-    v_points = np.linspace(0, predictions['Voc'], 100)
+    Args:
+        base_path (str): 模型目录
+        modes (Tuple[str, ...]): 参与比较的模式，off会被自动加入作为基准
+        n_rows (int): 批量预测的行数（拉丁超立方采样）
+        repeats (int): 单行预测的重复次数，取中位数
+        seed (int): 采样随机种子
+        
+    Returns:
+        Dict[str, Dict[str, Any]]: 每个模式的 single_row_ms、batch_ms、rows_per_s，
+        以及相对基准的 max_abs_err、max_rel_err（按预测目标）
+    """
+    samples = build_sweep_inputs(latin_hypercube(BENCHMARK_BOUNDS, n_rows, seed=seed))
+    single_row = samples.iloc[:1]
+    modes = ("off",) + tuple(mode for mode in modes if mode != "off")
     
-    # 计算电流点 (使用简化的单二极管模型)
-    j_points = predictions['Jsc'] * (1 - np.exp((v_points - predictions['Voc']) / 0.026))
+    report = {}
+    baseline = None
+    for mode in modes:
+        # 每个模式重新加载，避免前一个模式的常驻内存状态影响结果
+        predictors = load_predictors(base_path, mode)
+        predict_batch(single_row, predictors=predictors)  # 预热
+        
+        single_times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            predict_batch(single_row, predictors=predictors)
+            single_times.append(time.perf_counter() - start)
+        
+        start = time.perf_counter()
+        results_df = predict_batch(samples, predictors=predictors)
+        batch_time = time.perf_counter() - start
+        
+        entry = {
+            "single_row_ms": float(np.median(single_times) * 1000),
+            "batch_ms": batch_time * 1000,
+            "rows_per_s": n_rows / batch_time,
+        }
+        if baseline is None:
+            baseline = results_df
+        else:
+            abs_err = (results_df - baseline).abs()
+            rel_err = abs_err / baseline.abs().clip(lower=1e-12)
+            entry["max_abs_err"] = abs_err.max().to_dict()
+            entry["max_rel_err"] = rel_err.max().to_dict()
+        report[mode] = entry
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
     
-    # 绘制JV曲线
-    plt.plot(v_points, j_points, 'b-', label='JV')
-    plt.plot([0, predictions['Vm']], [predictions['Jsc'], predictions['Im']], 'r--', label='MPP')
-    plt.plot([predictions['Vm']], [predictions['Im']], 'ro', label='MPP')
+    parser = argparse.ArgumentParser(description="太阳能电池参数预测")
+    subparsers = parser.add_subparsers(dest="command")
+    bench_parser = subparsers.add_parser("benchmark", help="比较快速推理模式的延迟和精度")
+    bench_parser.add_argument("--modes", nargs="+", default=list(FAST_INFERENCE_MODES), choices=FAST_INFERENCE_MODES)
+    bench_parser.add_argument("--rows", type=int, default=1000, help="批量预测的行数")
+    bench_parser.add_argument("--repeats", type=int, default=20, help="单行预测的重复次数")
+    bench_parser.add_argument("--rel-tol", type=float, default=1e-3, help="允许的最大相对误差")
+    args = parser.parse_args()
     
-    plt.xlabel('Voltage (V)')
-    plt.ylabel('Current Density (mA/cm²)')
-    plt.title('JV Curve')
-    plt.legend()
+    if args.command == "benchmark":
+        report = benchmark_inference(model_base_path, tuple(args.modes), args.rows, args.repeats)
+        base = report["off"]
+        ok = True
+        for mode, entry in report.items():
+            print(f"[{mode}] 单行 {entry['single_row_ms']:.2f} ms "
+                  f"(x{base['single_row_ms'] / entry['single_row_ms']:.1f})，"
+                  f"批量 {args.rows} 行 {entry['batch_ms']:.1f} ms，{entry['rows_per_s']:.0f} 行/秒")
+            if "max_rel_err" in entry:
+                worst = max(entry["max_rel_err"].values())
+                status = "通过" if worst <= args.rel_tol else "超出容差"
+                ok = ok and worst <= args.rel_tol
+                print(f"    最大相对误差 {worst:.2e}（{status}）: "
+                      + ", ".join(f"{param}={err:.2e}" for param, err in entry["max_rel_err"].items()))
+        raise SystemExit(0 if ok else 1)
     
-    return predictions, fig
-
-if __name__ == "__main__":
     # 准备输入参数
     input_params = {
         'Si_thk': 180,
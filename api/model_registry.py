@@ -0,0 +1,180 @@
+import os
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+
+# 预测目标，每个目标对应模型目录下的一个子目录
+TARGETS = ['Vm', 'Im', 'Voc', 'Jsc', 'FF', 'Eff']
+
+model_base_path = os.getenv("MODEL_DIR", "final_small")
+# 快速推理模式：
+#   off     - 按需从磁盘加载子模型（AutoGluon默认行为）
+#   persist - 加载时将最优模型及其依赖常驻内存，预测结果与off完全一致
+#   refit   - 在persist基础上，若模型目录中已有refit_full生成的 *_FULL 模型，则改用其作为最优模型
+#             （单模型代替bagging集成，延迟更低，但预测值会有微小差异，使用前请运行基准测试核对精度）
+FAST_INFERENCE = os.getenv("FAST_INFERENCE", "off")
+FAST_INFERENCE_MODES = ("off", "persist", "refit")
+# 服务启动后是否在后台预加载模型
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() in ("1", "true", "yes")
+
+
+def optimize_predictor(model, mode: str = FAST_INFERENCE):
+    """
+    按快速推理模式处理已加载的模型，不会修改磁盘上的模型文件
+    """
+    if mode not in FAST_INFERENCE_MODES:
+        raise ValueError(f"未知的快速推理模式: {mode}，可选 {FAST_INFERENCE_MODES}")
+    if mode == "off":
+        return model
+
+    if mode == "refit":
+        best = model.model_best if hasattr(model, "model_best") else model.get_model_best()
+        refit_name = model.model_refit_map().get(best)
+        if refit_name:
+            model.set_model_best(refit_name)
+        else:
+            print(f"模型 {model.path} 没有 {best} 的refit_full版本，仅常驻内存")
+
+    # AutoGluon 1.0 起persist_models更名为persist
+    persist = getattr(model, "persist", None) or model.persist_models
+    persist("best")
+    return model
+
+
+def load_predictors(base_path: str, mode: str = FAST_INFERENCE) -> Dict[str, Any]:
+    """
+    加载所有预测模型
+
+    Args:
+        base_path (str): 模型目录，每个预测目标一个子目录
+        mode (str): 快速推理模式，见FAST_INFERENCE
+
+    Returns:
+        Dict[str, TabularPredictor]: {预测目标: 模型}
+    """
+    # AutoGluon导入较慢，只在真正加载模型时导入
+    from autogluon.tabular import TabularPredictor
+
+    if not os.path.exists(base_path):
+        raise FileNotFoundError(f"模型目录 {base_path} 不存在")
+    predictors = {}
+    for param in TARGETS:
+        model_path = os.path.join(base_path, param)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"模型 {param} 不存在于路径 {model_path}")
+
+        predictors[param] = optimize_predictor(TabularPredictor.load(model_path), mode)
+    return predictors
+
+
+def model_version(base_path: str) -> str:
+    """
+    根据模型目录下所有文件的路径、大小和修改时间计算版本指纹
+    """
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(base_path):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            digest.update(f"{os.path.relpath(path, base_path)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class ModelRegistry:
+    """
+    进程内共享的预测模型注册表：首次使用时才加载（或由后台预热线程提前加载），
+    导入本模块不会触发任何磁盘I/O，服务可以先开放端口再加载模型
+    """
+
+    def __init__(self, base_path: str = model_base_path, mode: str = FAST_INFERENCE):
+        self.base_path = base_path
+        self.mode = mode
+        self._predictors: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self.state = "not_loaded"  # not_loaded / loading / ready / error
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        # 加载时模型目录的版本指纹，在加载线程中计算
+        self.version: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._predictors is not None
+
+    def get(self) -> Dict[str, Any]:
+        """
+        返回已加载的模型，尚未加载时在当前线程加载（并发调用只加载一次）
+
+        Raises:
+            FileNotFoundError: 模型目录或某个模型不存在
+        """
+        predictors = self._predictors
+        if predictors is not None:
+            return predictors
+        with self._lock:
+            if self._predictors is None:
+                self._predictors = self._load()
+            return self._predictors
+
+    def _load(self) -> Dict[str, Any]:
+        self.state = "loading"
+        print(f"正在从 {self.base_path} 加载预测模型（快速推理模式: {self.mode}）...")
+        start = time.time()
+        try:
+            # 先记录版本再读取模型文件，加载期间目录发生的变化会在下次版本检查时发现
+            self.version = model_version(self.base_path)
+            predictors = load_predictors(self.base_path, self.mode)
+        except Exception as e:
+            self.state = "error"
+            self.error = str(e)
+            raise
+        self.load_seconds = time.time() - start
+        self.loaded_at = time.time()
+        self.state = "ready"
+        self.error = None
+        print(f"预测模型加载完成，耗时 {self.load_seconds:.1f} 秒")
+        return predictors
+
+    def reload(self) -> None:
+        """
+        模型目录变化后重新加载；尚未加载过时只需等待下次使用
+        """
+        with self._lock:
+            if self._predictors is not None:
+                self._predictors = self._load()
+
+    def warm_up(self) -> threading.Thread:
+        """
+        在后台线程中预加载模型，不阻塞服务启动；加载失败记录在status()中，首次使用时会重试
+        """
+        def run():
+            try:
+                self.get()
+            except Exception as e:
+                print(f"预加载预测模型失败: {e}")
+
+        thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "model_dir": self.base_path,
+            "fast_inference": self.mode,
+            "load_seconds": self.load_seconds,
+            "version": self.version,
+            "error": self.error,
+        }
+
+
+# 进程内唯一的模型注册表
+registry = ModelRegistry()
@@ -0,0 +1,186 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Any, Tuple
+
+import numpy as np
+
+
+# 默认配置，可通过环境变量调整
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))  # 秒，0表示不过期
+QUERY_CACHE_DIR = os.getenv("QUERY_CACHE_DIR")  # 设置后启用磁盘缓存
+QUERY_CACHE_DISK_SIZE = int(os.getenv("QUERY_CACHE_DISK_SIZE", "100000"))  # 磁盘缓存最多保留的查询数量，0表示不限制
+# 每写入多少次清理一次磁盘缓存（删除过期行、按写入时间淘汰超出上限的行），磁盘缓存最多超出上限这么多行
+QUERY_CACHE_PRUNE_EVERY = 100
+
+
+def normalize_query(query: str) -> str:
+    """
+    规范化查询文本：去掉首尾空白、合并连续空白并转为小写
+
+    BGE英文模型使用不区分大小写的分词器，规范化不会改变编码结果
+    """
+    return re.sub(r"\s+", " ", query.strip()).lower()
+
+
+class QueryEmbeddingCache:
+    """
+    查询向量缓存：内存中的LRU（按数量和TTL淘汰），可选持久化到SQLite的磁盘层，
+    MCP服务器重启后仍可命中
+    """
+
+    def __init__(self, namespace: str = "", maxsize: int = QUERY_CACHE_SIZE,
+                 ttl: Optional[float] = QUERY_CACHE_TTL, cache_dir: Optional[str] = QUERY_CACHE_DIR,
+                 disk_maxsize: Optional[int] = QUERY_CACHE_DISK_SIZE):
+        """
+        Args:
+            namespace: 缓存键的命名空间，通常为模型名称和检索指令，换模型后不会误命中
+            maxsize: 内存中最多缓存的查询数量
+            ttl: 过期时间（秒），None或0表示不过期
+            cache_dir: 磁盘缓存目录，为None时只使用内存缓存
+            disk_maxsize: 磁盘缓存最多保留的查询数量，超出时先删除最早写入的，None或0表示不限制
+        """
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl or None
+        self.disk_maxsize = disk_maxsize or None
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+        self._puts_since_prune = 0
+
+        self._db = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(cache_dir, "query_cache.sqlite3"), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "key TEXT PRIMARY KEY, dtype TEXT, vector BLOB, created_at REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS query_embeddings_created ON query_embeddings (created_at)")
+            self._db.commit()
+            # 启动时清理上次运行遗留的过期行
+            self._prune()
+
+    def _key(self, query: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\n{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        """
+        查找查询向量，未命中或已过期时返回None
+        """
+        key = self._key(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[1]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT dtype, vector, created_at FROM query_embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[2]):
+                    vector = np.frombuffer(row[1], dtype=np.dtype(row[0]))
+                    self._put_memory(key, vector, row[2])
+                    self.disk_hits += 1
+                    return vector
+                if row is not None:
+                    self._db.execute("DELETE FROM query_embeddings WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.misses += 1
+            return None
+
+    def put(self, query: str, vector: np.ndarray) -> None:
+        """
+        写入查询向量
+        """
+        key = self._key(query)
+        vector = np.array(vector)
+        vector.flags.writeable = False
+        created_at = time.time()
+        with self._lock:
+            self._put_memory(key, vector, created_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (key, dtype, vector, created_at) VALUES (?, ?, ?, ?)",
+                    (key, str(vector.dtype), vector.tobytes(), created_at),
+                )
+                self._puts_since_prune += 1
+                if self._puts_since_prune >= QUERY_CACHE_PRUNE_EVERY:
+                    self._prune()
+                self._db.commit()
+
+    def _prune(self) -> None:
+        """
+        删除磁盘缓存中的过期行，并按写入时间淘汰超出disk_maxsize的最早的行；调用方持有锁或在初始化中
+        """
+        self._puts_since_prune = 0
+        removed = 0
+        if self.ttl is not None:
+            removed += self._db.execute("DELETE FROM query_embeddings WHERE created_at < ?",
+                                        (time.time() - self.ttl,)).rowcount
+        if self.disk_maxsize is not None:
+            removed += self._db.execute(
+                "DELETE FROM query_embeddings WHERE key IN ("
+                "SELECT key FROM query_embeddings ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_maxsize,),
+            ).rowcount
+        self._db.commit()
+        self.disk_evictions += removed
+
+    def _put_memory(self, key: str, vector: np.ndarray, created_at: float) -> None:
+        self._entries[key] = (vector, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        清空内存和磁盘缓存，并重置计数
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM query_embeddings")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        返回缓存命中统计
+        """
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            disk_size = None
+            if self._db is not None:
+                disk_size = self._db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "persistent": self._db is not None,
+                "disk_size": disk_size,
+                "disk_maxsize": self.disk_maxsize,
+                "disk_evictions": self.disk_evictions,
+            }
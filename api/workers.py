@@ -0,0 +1,270 @@
+import os
+import time
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+# 预测/渲染工作池配置，可通过环境变量调整
+WORKER_POOL_TYPE = os.getenv("WORKER_POOL_TYPE", "thread")  # thread 或 process
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", str(os.cpu_count() or 4)))
+WORKER_QUEUE_DEPTH = int(os.getenv("WORKER_QUEUE_DEPTH", "32"))  # 所有worker都忙时最多排队的任务数
+# 微批处理：收集窗口内到达的单行请求，合并为一次批量调用
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "5"))
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", "256"))
+
+
+# 进程模式的工作池，模型版本变化时需要替换其中的进程
+_process_pools: "weakref.WeakSet[WorkerPool]" = weakref.WeakSet()
+
+
+class PoolSaturated(RuntimeError):
+    """工作池已满（运行中和排队中的任务达到上限），调用方应返回429或稍后重试"""
+
+
+def _timed_call(fn: Callable, args: tuple, kwargs: dict) -> Tuple[Any, float, float]:
+    """在worker中执行任务并记录开始/结束时间，模块级函数以便进程池序列化"""
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return result, started, time.time()
+
+
+class WorkerPool:
+    """
+    CPU密集任务（AutoGluon预测、matplotlib渲染）的有界工作池
+
+    线程模式下各worker共享进程内的模型和缓存；进程模式下每个进程各自持有一份模型和缓存，
+    可绕过GIL在多核上并行，但内存占用随进程数增加，模型目录变化时由recycle_process_pools替换进程。
+    提交的函数和参数在进程模式下必须可pickle，因此应使用mlutil中的模块级函数。
+    """
+
+    def __init__(self, kind: str = WORKER_POOL_TYPE, max_workers: int = WORKER_POOL_SIZE,
+                 queue_depth: int = WORKER_QUEUE_DEPTH):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"未知的工作池类型: {kind}，可选 thread 或 process")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.queue_depth = queue_depth
+        self.max_pending = max_workers + queue_depth
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._queue_ms_total = 0.0
+        self._run_ms_total = 0.0
+        self.max_queue_ms = 0.0
+        self.recycled = 0
+        if kind == "process":
+            _process_pools.add(self)
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="predict")
+            return self._executor
+
+    def recycle(self) -> None:
+        """
+        进程模式下替换全部worker进程：已提交的任务仍在旧进程中完成，之后提交的任务由新进程执行，
+        新进程首次预测时重新加载模型。线程模式下worker共享进程内的模型，无需替换
+        """
+        if self.kind != "process":
+            return
+        with self._lock:
+            executor, self._executor = self._executor, None
+            if executor is not None:
+                self.recycled += 1
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def saturated(self) -> bool:
+        with self._lock:
+            return self.in_flight >= self.max_pending
+
+    async def run_timed(self, fn: Callable, *args, **kwargs) -> Tuple[Any, Dict[str, float]]:
+        """
+        在工作池中执行fn，返回结果和耗时
+
+        Returns:
+            Tuple[Any, Dict[str, float]]: 函数返回值，以及 {"queue_ms": 排队时间, "run_ms": 执行时间}
+
+        Raises:
+            PoolSaturated: 运行中和排队中的任务已达上限
+        """
+        with self._lock:
+            if self.in_flight >= self.max_pending:
+                self.rejected += 1
+                raise PoolSaturated(f"仿真服务繁忙（{self.in_flight}个任务运行或排队中），请稍后重试")
+            self.in_flight += 1
+
+        submitted = time.time()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), _timed_call, fn, args, kwargs
+            )
+        except BaseException:
+            self._release(failed=True)
+            raise
+        # 任务真正结束时才释放名额：请求被取消（如客户端断开）时任务仍在worker中运行
+        future.add_done_callback(
+            lambda f: self._release(failed=f.cancelled() or f.exception() is not None)
+        )
+
+        result, started, finished = await future
+        timing = {
+            "queue_ms": max(started - submitted, 0.0) * 1000,
+            "run_ms": (finished - started) * 1000,
+        }
+        with self._lock:
+            self._queue_ms_total += timing["queue_ms"]
+            self._run_ms_total += timing["run_ms"]
+            self.max_queue_ms = max(self.max_queue_ms, timing["queue_ms"])
+        return result, timing
+
+    def _release(self, failed: bool) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """同run_timed，只返回结果"""
+        result, _ = await self.run_timed(fn, *args, **kwargs)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "queue_depth": self.queue_depth,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_queue_ms": self._queue_ms_total / self.completed if self.completed else 0.0,
+                "avg_run_ms": self._run_ms_total / self.completed if self.completed else 0.0,
+                "max_queue_ms": self.max_queue_ms,
+                "recycled": self.recycled,
+            }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def recycle_process_pools() -> None:
+    """
+    替换所有进程模式工作池中的worker进程，模型目录变化后调用，避免子进程继续使用旧模型
+    """
+    for pool in list(_process_pools):
+        pool.recycle()
+
+
+def server_timing(timing: Dict[str, float]) -> str:
+    """将耗时格式化为HTTP Server-Timing响应头"""
+    return ", ".join(f"{name.replace('_ms', '')};dur={value:.1f}" for name, value in timing.items())
+
+
+class MicroBatcher:
+    """
+    微批处理器：把短时间窗口内到达的单条请求合并成一批，只调用一次batch_fn，再把结果分发给各调用方
+
+    批次在窗口到期或积累到max_rows条时提交；同一批次中键相同的请求只计算一次。
+    batch_fn接收条目列表并返回等长的结果列表：普通函数在工作池（或默认线程池）中执行，
+    协程函数（如转发到远程服务）直接在事件循环中等待。
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], pool: Optional[WorkerPool] = None,
+                 window_ms: float = BATCH_WINDOW_MS, max_rows: int = BATCH_MAX_ROWS):
+        self.batch_fn = batch_fn
+        self.pool = pool
+        self.window = window_ms / 1000
+        self.max_rows = max_rows
+        self._pending: "Dict[Hashable, Tuple[Any, List[asyncio.Future]]]" = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self.requests = 0
+        self.batches = 0
+        self.rows = 0
+        self.max_batch_rows = 0
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        """
+        提交一条请求并等待所在批次的结果
+
+        Args:
+            key: 去重键，同一批次内键相同的请求共享一次计算
+            item: 传给batch_fn的条目
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.requests += 1
+        if key in self._pending:
+            self._pending[key][1].append(future)
+        else:
+            self._pending[key] = (item, [future])
+
+        if len(self._pending) >= self.max_rows:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        task = asyncio.ensure_future(self._run(batch))
+        # 保存任务引用，避免执行期间被垃圾回收
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: "Dict[Hashable, Tuple[Any, List[asyncio.Future]]]") -> None:
+        entries = list(batch.values())
+        items = [item for item, _ in entries]
+        self.batches += 1
+        self.rows += len(items)
+        self.max_batch_rows = max(self.max_batch_rows, len(items))
+        try:
+            if asyncio.iscoroutinefunction(self.batch_fn):
+                results = await self.batch_fn(items)
+            elif self.pool is not None:
+                results = await self.pool.run(self.batch_fn, items)
+            else:
+                results = await asyncio.to_thread(self.batch_fn, items)
+        except Exception as e:
+            for _, futures in entries:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for (_, futures), result in zip(entries, results):
+            for future in futures:
+                # 调用方可能已取消（如客户端断开）
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch_rows": self.rows / self.batches if self.batches else 0.0,
+            "max_batch_rows": self.max_batch_rows,
+            "window_ms": self.window * 1000,
+            "max_rows": self.max_rows,
+        }
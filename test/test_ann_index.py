@@ -0,0 +1,52 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+from ann_index import IVFFlatIndex, exact_search, load_index, recall_at_k
+
+
+def make_corpus(n=4000, dim=64, n_clusters=40, seed=0):
+    """生成带聚类结构的归一化向量，接近真实文本嵌入的分布"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim))
+    vectors = centers[rng.integers(0, n_clusters, n)] + 0.3 * rng.standard_normal((n, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = centers[rng.integers(0, n_clusters, 50)] + 0.3 * rng.standard_normal((50, dim))
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors.astype(np.float32), queries.astype(np.float32)
+
+
+def test_ivf_recall_vs_brute_force():
+    vectors, queries = make_corpus()
+    index = IVFFlatIndex.build(vectors, nlist=64)
+
+    # 探查全部桶时等价于暴力检索
+    assert recall_at_k(index, vectors, queries, k=10, nprobe=index.nlist) == 1.0
+    # 默认规模的nprobe下召回率应足够高
+    assert recall_at_k(index, vectors, queries, k=10, nprobe=8) >= 0.9
+    # nprobe越大召回率不降低
+    assert recall_at_k(index, vectors, queries, k=10, nprobe=16) >= recall_at_k(index, vectors, queries, k=10, nprobe=2)
+
+
+def test_ivf_scores_match_exact():
+    vectors, queries = make_corpus(n=500)
+    index = IVFFlatIndex.build(vectors, nlist=8)
+    exact_ids, exact_scores = exact_search(vectors, queries[:1], 5)[0]
+    ids, scores = index.search(vectors, queries[:1], 5, nprobe=8)[0]
+    np.testing.assert_array_equal(ids, exact_ids)
+    np.testing.assert_allclose(scores, exact_scores, rtol=1e-5)
+
+
+def test_ivf_save_and_load(tmp_path):
+    vectors, queries = make_corpus(n=500)
+    index = IVFFlatIndex.build(vectors, nlist=8)
+    index.save(str(tmp_path))
+
+    loaded = load_index(str(tmp_path), len(vectors))
+    assert loaded is not None and loaded.nlist == 8
+    assert recall_at_k(loaded, vectors, queries, k=10, nprobe=8) == 1.0
+    # 语料数量变化后索引视为过期
+    assert load_index(str(tmp_path), len(vectors) + 1) is None
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+try:
+    import main
+except Exception as e:  # 缺少依赖或模型目录时跳过
+    pytest.skip(f"无法导入api/main.py: {e}", allow_module_level=True)
+
+
+N_STREAMS = 5
+N_CHUNKS = 5
+CHUNK_DELAY = 0.02  # 模拟上游每个token之间的网络等待
+
+
+class FakeStream:
+    """模拟AsyncOpenAI的流式响应：每个分块之间异步等待"""
+
+    def __init__(self, stream_id):
+        self.stream_id = stream_id
+        self.closed = False
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for i in range(N_CHUNKS):
+            await asyncio.sleep(CHUNK_DELAY)
+            delta = SimpleNamespace(content=f"{self.stream_id}:{i}", tool_calls=None, reasoning_content=None)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeCompletions:
+    async def create(self, model, messages, stream, tools=None):
+        return FakeStream(messages[-1]["content"])
+
+
+async def consume(stream_id, events):
+    chat_request = main.ChatRequest(messages=[main.Message(role="user", content=str(stream_id))])
+    async for line in main.generate_stream_response(chat_request, asyncio.Event()):
+        data = json.loads(line[len("data: "):])
+        if data["type"] == "content":
+            events.append(data["content"])
+
+
+def test_streams_interleave(monkeypatch):
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    monkeypatch.setattr(main, "client", fake_client)
+    monkeypatch.setattr(main.mcp_client, "connections", [])
+
+    events = []
+
+    async def run_all():
+        await asyncio.gather(*(consume(i, events) for i in range(N_STREAMS)))
+
+    start = time.perf_counter()
+    asyncio.run(run_all())
+    elapsed = time.perf_counter() - start
+
+    assert len(events) == N_STREAMS * N_CHUNKS
+    # 每个流的第一个token都应早于任何一个流的最后一个token，即各流交错进行而非依次串行
+    first_positions = [events.index(f"{i}:0") for i in range(N_STREAMS)]
+    last_positions = [events.index(f"{i}:{N_CHUNKS - 1}") for i in range(N_STREAMS)]
+    assert max(first_positions) < min(last_positions)
+    # 总耗时接近单个流的耗时，远小于串行耗时
+    assert elapsed < N_STREAMS * N_CHUNKS * CHUNK_DELAY / 2
+
+
+TOOL_DELAYS = [0.15, 0.05, 0.10]  # 各工具调用的耗时，完成顺序与请求顺序不同
+
+
+class ToolCallCompletions:
+    """第一次请求返回多个工具调用，之后返回普通回答并记录收到的消息"""
+
+    def __init__(self):
+        self.requests = []
+
+    async def create(self, model, messages, stream, tools=None):
+        self.requests.append(messages)
+        if len(self.requests) == 1:
+            tool_calls = [
+                SimpleNamespace(index=i, id=f"call_{i}",
+                                function=SimpleNamespace(name="simulate_solar_cell", arguments=json.dumps({"i": i})))
+                for i in range(len(TOOL_DELAYS))
+            ]
+            chunks = [SimpleNamespace(content=None, tool_calls=tool_calls, reasoning_content=None)]
+        else:
+            chunks = [SimpleNamespace(content="done", tool_calls=None, reasoning_content=None)]
+        return FakeChunks(chunks)
+
+
+class FakeChunks:
+    def __init__(self, deltas):
+        self.deltas = deltas
+
+    async def __aiter__(self):
+        for delta in self.deltas:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+    async def close(self):
+        pass
+
+
+def test_tool_calls_run_concurrently_in_order(monkeypatch):
+    completions = ToolCallCompletions()
+    monkeypatch.setattr(main, "client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+
+    async def call_tool(tool_name, arguments):
+        await asyncio.sleep(TOOL_DELAYS[arguments["i"]])
+        return SimpleNamespace(content=[SimpleNamespace(text=f"result {arguments['i']}")])
+
+    async def get_tools():
+        return []
+
+    monkeypatch.setattr(main, "mcp_client", SimpleNamespace(connected=True, call_tool=call_tool))
+    monkeypatch.setattr(main, "tool_schema_cache", SimpleNamespace(get=get_tools))
+
+    async def run():
+        chat_request = main.ChatRequest(messages=[main.Message(role="user", content="sweep")])
+        return [json.loads(line[len("data: "):])
+                async for line in main.generate_stream_response(chat_request, asyncio.Event())]
+
+    start = time.perf_counter()
+    events = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    # 并发执行：总耗时接近最慢的一个调用
+    assert elapsed < sum(TOOL_DELAYS) * 0.8
+    # 结果按完成顺序推送给前端
+    finished = [e["content"]["index"] for e in events if e["type"] == "tool_result"]
+    assert finished == sorted(range(len(TOOL_DELAYS)), key=lambda i: TOOL_DELAYS[i])
+    # 发送给模型的tool消息保持原始顺序
+    tool_messages = [m for m in completions.requests[1] if m["role"] == "tool"]
+    assert [m["tool_call_id"] for m in tool_messages] == [f"call_{i}" for i in range(len(TOOL_DELAYS))]
+    assert [m["content"] for m in tool_messages] == [f"result {i}" for i in range(len(TOOL_DELAYS))]
@@ -0,0 +1,63 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+from context_window import build_context, compact_tool_result, estimate_tokens, message_tokens
+
+
+def long_conversation(turns=40):
+    messages = [{"role": "system", "content": "欢迎讨论太阳能电池相关的问题"}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"问题{i}：" + "硅片厚度对效率的影响" * 50})
+        messages.append({"role": "assistant", "content": None, "tool_calls": [
+            {"id": f"call_{i}", "type": "function",
+             "function": {"name": "simulate_solar_cell", "arguments": "{}"}}]})
+        messages.append({"role": "tool", "tool_call_id": f"call_{i}", "content": "x" * 2000})
+        messages.append({"role": "assistant", "content": "回答" * 300})
+    return messages
+
+
+def test_short_history_is_sent_unchanged():
+    messages = long_conversation(turns=2)
+    sent, stats = build_context(messages, max_tokens=100000)
+    assert sent is messages
+    assert stats["dropped_messages"] == 0
+    assert stats["prompt_tokens"] == stats["original_tokens"]
+
+
+def test_long_history_fits_budget_and_keeps_tool_pairs():
+    messages = long_conversation()
+    sent, stats = build_context(messages, max_tokens=8000, reserve_tokens=1000)
+
+    assert stats["original_tokens"] > 8000
+    assert stats["prompt_tokens"] <= 7000
+    assert stats["prompt_tokens"] == sum(message_tokens(m) for m in sent)
+    assert stats["dropped_messages"] > 0
+    # 开头的系统消息、省略摘要和最近一轮总是保留
+    assert sent[0] == messages[0]
+    assert sent[1]["role"] == "system" and "问题0" in sent[1]["content"]
+    assert sent[-4:] == messages[-4:]
+    # 每条工具结果前都有对应的工具调用
+    call_ids = set()
+    for message in sent:
+        for tool_call in message.get("tool_calls") or []:
+            call_ids.add(tool_call["id"])
+        if message["role"] == "tool":
+            assert message["tool_call_id"] in call_ids
+
+
+def test_compact_tool_result_shrinks_tables():
+    table = {column: {str(i): i * 0.123 for i in range(500)} for column in ["Vm", "Im", "Voc", "Jsc", "FF", "Eff"]}
+    content = json.dumps({"text": {"param_name": "Si_thk", "results_table": table}})
+    compacted = compact_tool_result(content, max_tokens=2000, max_items=10)
+
+    assert estimate_tokens(compacted) <= 2000
+    parsed = json.loads(compacted)
+    assert parsed["text"]["param_name"] == "Si_thk"
+    assert len(parsed["text"]["results_table"]["Vm"]) == 11  # 10条 + 省略说明
+
+    plain = compact_tool_result("y" * 100000, max_tokens=500)
+    assert estimate_tokens(plain) <= 500
+    assert compact_tool_result("short") == "short"
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+from conversation_store import ConversationBackend, create_conversation_store
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "memory"])
+def test_evicted_conversation_reads_pending_writes(tmp_path, kind):
+    async def run():
+        store = create_conversation_store(kind, str(tmp_path / "conversations.sqlite3"))
+        store.cache_size = 2
+        first = await store.create(messages=[{"role": "system", "content": "welcome"}])
+        for i in range(3):
+            await store.create(title=f"other {i}")
+        assert first["id"] not in store._cache
+
+        # 被淘汰的会话从后端读回，并能看到尚未落盘批次中的写入
+        conversation = await store.append_messages(first["id"], [
+            {"role": "user", "content": "q", "context_info": [{"file": "a.txt"}]},
+            {"role": "assistant", "content": "a", "reasoning_content": None},
+        ])
+        assert [m["role"] for m in conversation["messages"]] == ["system", "user", "assistant"]
+        await store.set_title(first["id"], "q")
+        assert len(store._cache) <= 2
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_sqlite_store_survives_restart(tmp_path):
+    path = str(tmp_path / "conversations.sqlite3")
+
+    async def write():
+        store = create_conversation_store("sqlite", path)
+        conversation = await store.create(messages=[{"role": "system", "content": "welcome"}])
+        await store.append_messages(conversation["id"], [{"role": "user", "content": "hello",
+                                                          "context_info": [{"file": "a.txt"}]}])
+        await store.set_title(conversation["id"], "hello")
+        await store.close()
+        return conversation["id"]
+
+    async def read(conversation_id):
+        store = create_conversation_store("sqlite", path)
+        try:
+            return await store.get(conversation_id), await store.list_conversations()
+        finally:
+            await store.close()
+
+    conversation_id = asyncio.run(write())
+    conversation, listing = asyncio.run(read(conversation_id))
+    assert conversation["title"] == "hello"
+    assert conversation["messages"][1]["content"] == "hello"
+    assert conversation["messages"][1]["context_info"] == [{"file": "a.txt"}]
+    assert [c["id"] for c in listing] == [conversation_id]
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "memory"])
+def test_summary_and_message_pagination(tmp_path, kind):
+    async def run():
+        store = create_conversation_store(kind, str(tmp_path / "conversations.sqlite3"))
+        ids = []
+        for i in range(5):
+            conversation = await store.create(title=f"c{i}", messages=[{"role": "system", "content": "welcome"}])
+            ids.append(conversation["id"])
+        await store.append_messages(ids[0], [{"role": "user", "content": str(i)} for i in range(9)])
+
+        seen, cursor = [], None
+        while True:
+            page = await store.list_summaries(limit=2, cursor=cursor)
+            assert len(page["conversations"]) <= 2
+            seen.extend(page["conversations"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert sorted(c["id"] for c in seen) == sorted(ids)
+        assert [c["created_at"] for c in seen] == sorted((c["created_at"] for c in seen), reverse=True)
+        assert {c["id"]: c["message_count"] for c in seen}[ids[0]] == 10
+        assert "messages" not in seen[0]
+
+        # 缓存命中和从后端读取两条路径返回相同的分页结果
+        pages = []
+        for evict in (False, True):
+            if evict:
+                store._cache.clear()
+            collected, before = [], None
+            while True:
+                page = await store.get_messages(ids[0], before=before, limit=4)
+                collected = page["messages"] + collected
+                before = page["next_before"]
+                if before is None:
+                    break
+            pages.append(collected)
+        assert pages[0] == pages[1]
+        assert [m["seq"] for m in pages[0]] == list(range(10))
+        assert await store.get_messages("missing") is None
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_invalid_cursor_rejected(tmp_path):
+    async def run():
+        store = create_conversation_store("memory")
+        with pytest.raises(ValueError):
+            await store.list_summaries(cursor="not-a-cursor")
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_incomplete_backend_fails_on_creation():
+    class PartialBackend(ConversationBackend):
+        def apply(self, ops):
+            pass
+
+    with pytest.raises(TypeError):
+        PartialBackend()
@@ -0,0 +1,205 @@
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+try:
+    import embed
+    from embed import TextEmbedding, load_manifest, VECTORS_FILE
+except Exception as e:  # 缺少依赖时跳过
+    pytest.skip(f"无法导入api/embed.py: {e}", allow_module_level=True)
+
+TRUNCATE = 12
+
+
+class FakeModel:
+    """按文本内容确定性地生成向量，代替BGE模型"""
+
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.encoded = 0
+
+    def encode(self, texts, batch_size=32):
+        self.encoded += len(texts)
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dim)
+            vectors.append(vector / np.linalg.norm(vector))
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def write_doc(docs, name, content, mtime):
+    path = docs / name
+    path.write_text(content, encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def update(docs, store_dir, load=True):
+    """模拟服务端：从存储目录加载后增量更新"""
+    if load and embed.is_columnar_store(str(store_dir)):
+        store = TextEmbedding.load_with_file_info(str(store_dir))
+    else:
+        store = TextEmbedding()
+    store.model = FakeModel()
+    stats = store.update_directory(str(docs), str(store_dir), truncate_length=TRUNCATE, index_type=None)
+    return store, stats
+
+
+def snapshot(store_dir):
+    store = TextEmbedding.load_with_file_info(str(store_dir), model_name=None)
+    return {text: (store.file_names[i], np.asarray(store.embeddings[i])) for i, text in enumerate(store.texts)}
+
+
+def assert_matches_rebuild(docs, store_dir, tmp_path):
+    rebuild_dir = tmp_path / f"rebuild_{len(os.listdir(tmp_path))}"
+    update(docs, rebuild_dir, load=False)
+    incremental, rebuilt = snapshot(store_dir), snapshot(rebuild_dir)
+
+    assert incremental.keys() == rebuilt.keys()
+    for text, (file_name, vector) in rebuilt.items():
+        assert incremental[text][0] == file_name, text
+        np.testing.assert_allclose(incremental[text][1], vector)
+
+    # 清单中的行号指向该文件的片段
+    store = TextEmbedding.load_with_file_info(str(store_dir), model_name=None)
+    for name, entry in load_manifest(str(store_dir))["files"].items():
+        content = (docs / name).read_text(encoding="utf-8")
+        assert all(store.texts[row] in content for row in entry["chunk_ids"])
+
+
+def test_add_modify_delete_rounds_match_full_rebuild(tmp_path):
+    docs, store_dir = tmp_path / "docs", tmp_path / "store"
+    docs.mkdir()
+    write_doc(docs, "a.txt", "alpha beta gamma delta epsilon", 1000)
+    write_doc(docs, "b.txt", "short b", 1000)
+    write_doc(docs, "c.txt", "charlie delta echo foxtrot golf", 1000)
+
+    _, stats = update(docs, store_dir)
+    assert stats["added"] == 3
+    assert_matches_rebuild(docs, store_dir, tmp_path)
+
+    # 只新增文件：原地追加
+    write_doc(docs, "d.txt", "delta file content here", 1000)
+    store, stats = update(docs, store_dir)
+    assert (stats["added"], stats["unchanged"]) == (1, 3)
+    assert np.load(str(store_dir / VECTORS_FILE), mmap_mode="r").shape[0] == len(store)
+    assert_matches_rebuild(docs, store_dir, tmp_path)
+
+    # 修改文件：只重新编码该文件的片段
+    write_doc(docs, "b.txt", "b has been rewritten to be longer", 2000)
+    store, stats = update(docs, store_dir)
+    assert (stats["updated"], stats["unchanged"]) == (1, 3)
+    assert stats["encoded_chunks"] == len(load_manifest(str(store_dir))["files"]["b.txt"]["chunk_ids"])
+    assert_matches_rebuild(docs, store_dir, tmp_path)
+
+    # 只有修改时间变化：按内容哈希判断为未变化
+    os.utime(docs / "c.txt", (3000, 3000))
+    _, stats = update(docs, store_dir)
+    assert (stats["updated"], stats["encoded_chunks"]) == (0, 0)
+
+    # 删除文件：行号重新映射
+    os.remove(docs / "a.txt")
+    _, stats = update(docs, store_dir)
+    assert (stats["removed"], stats["encoded_chunks"]) == (1, 0)
+    assert_matches_rebuild(docs, store_dir, tmp_path)
+
+
+def test_shared_chunk_file_name_follows_remaining_file(tmp_path):
+    docs, store_dir = tmp_path / "docs", tmp_path / "store"
+    docs.mkdir()
+    shared = "same content"
+    write_doc(docs, "a.txt", shared, 1000)
+    write_doc(docs, "b.txt", shared, 1000)
+    write_doc(docs, "c.txt", "x" * TRUNCATE + shared, 1000)  # 第二个片段与a/b相同
+
+    update(docs, store_dir)
+    assert snapshot(store_dir)[shared][0] == "c.txt#chunk2"
+    assert_matches_rebuild(docs, store_dir, tmp_path)
+
+    # 删除当前标注的文件：共享片段保留，文件名改为仍包含它的文件
+    os.remove(docs / "c.txt")
+    update(docs, store_dir)
+    assert snapshot(store_dir)[shared][0] == "b.txt"
+    assert_matches_rebuild(docs, store_dir, tmp_path)
+
+    # 修改后不再包含该片段
+    write_doc(docs, "b.txt", "b changed", 2000)
+    update(docs, store_dir)
+    assert snapshot(store_dir)[shared][0] == "a.txt"
+    assert_matches_rebuild(docs, store_dir, tmp_path)
+
+
+def write_npy_with_header(path, array, header_len):
+    """按指定头部长度写.npy（模拟其他工具写出的、填充方式不同的文件）"""
+    header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (
+        np.lib.format.dtype_to_descr(array.dtype), array.shape)
+    padding = header_len - len(np.lib.format.MAGIC_PREFIX) - 2 - 2 - len(header) - 1
+    with open(path, "wb") as f:
+        f.write(np.lib.format.magic(1, 0))
+        f.write(np.array(header_len - 10, dtype='<u2').tobytes())
+        f.write((header + " " * padding + "\n").encode("latin1"))
+        f.write(array.tobytes())
+
+
+@pytest.mark.parametrize("rows", [9, 99, 999])
+def test_append_npy_across_digit_boundary(tmp_path, rows):
+    path = str(tmp_path / "vectors.npy")
+    original = np.arange(rows * 4, dtype=np.float32).reshape(rows, 4)
+    np.save(path, original)
+    extra = np.ones((1, 4), dtype=np.float32)
+
+    # 行数位数增加（9 -> 10）时头部长度不变，原地追加
+    assert embed._append_npy(path, extra)
+    np.testing.assert_array_equal(np.load(path), np.concatenate([original, extra]))
+
+
+def test_append_npy_refuses_when_header_length_changes(tmp_path):
+    path = str(tmp_path / "vectors.npy")
+    original = np.arange(36, dtype=np.float32).reshape(9, 4)
+    write_npy_with_header(path, original, header_len=192)
+    np.testing.assert_array_equal(np.load(path), original)
+    before = open(path, "rb").read()
+
+    assert not embed._append_npy(path, np.ones((1, 4), dtype=np.float32))
+    assert open(path, "rb").read() == before
+
+    # dtype或列数不一致同样拒绝
+    assert not embed._append_npy(path, np.ones((1, 4), dtype=np.float64))
+    assert not embed._append_npy(path, np.ones((1, 3), dtype=np.float32))
+    assert open(path, "rb").read() == before
+
+
+def test_append_npy_drops_leftover_tail_from_failed_append(tmp_path):
+    path = str(tmp_path / "vectors.npy")
+    original = np.arange(8, dtype=np.float32).reshape(2, 4)
+    np.save(path, original)
+    with open(path, "ab") as f:
+        f.write(b"\xff" * 7)  # 上次追加写了数据但没来得及更新头部
+
+    extra = np.full((1, 4), 5, dtype=np.float32)
+    assert embed._append_npy(path, extra)
+    np.testing.assert_array_equal(np.load(path), np.concatenate([original, extra]))
+
+
+def test_share_model_uses_one_lazily_loaded_model(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    write_doc(docs, "a.txt", "alpha beta gamma delta", 1000)
+
+    serving = TextEmbedding()
+    ingest = TextEmbedding()
+    assert ingest.share_model(serving)
+    assert not serving.model_loaded
+
+    # 任一存储加载（或设置）模型后，另一个直接使用同一个模型
+    ingest.model = FakeModel()
+    ingest.update_directory(str(docs), str(tmp_path / "store"), truncate_length=TRUNCATE, index_type=None)
+    assert serving.model is ingest.model and serving.model.encoded > 0
+
+    assert not TextEmbedding(model_name="other-model").share_model(serving)
+    assert not TextEmbedding(model_name=None).share_model(serving)
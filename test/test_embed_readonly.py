@@ -0,0 +1,97 @@
+import os
+import pickle
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+try:
+    from embed import TextEmbedding, StringColumn, write_columnar_store, migrate_pickle_store, is_columnar_store
+except Exception as e:  # 缺少依赖时跳过
+    pytest.skip(f"无法导入api/embed.py: {e}", allow_module_level=True)
+
+
+def make_store(store_dir, n=200, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    texts = [f"text {i}" for i in range(n)]
+    file_names = [f"file_{i % 7}.txt" for i in range(n)]
+    write_columnar_store(str(store_dir), texts, file_names, vectors)
+    return vectors
+
+
+def test_readonly_search_without_model(tmp_path):
+    vectors = make_store(tmp_path)
+    store = TextEmbedding.load_with_file_info(str(tmp_path), model_name=None)
+
+    # 未缩放的查询向量也应找到对应文本本身
+    results = store.search_by_vector(vectors[42] * 3.0, top_n=3, min_similarity=0.0, exact=True)
+    assert results[0][0] == "text 42"
+    assert results[0][1] == pytest.approx(1.0, abs=1e-5)
+
+    batched = store.search_by_vectors(vectors[[1, 2]], top_n=1, min_similarity=0.0, exact=True)
+    assert [hits[0][0] for hits in batched] == ["text 1", "text 2"]
+
+    stats = store.stats()
+    assert stats["count"] == 200 and stats["dim"] == 16 and stats["files"] == 7
+    assert not store.model_loaded
+    with pytest.raises(RuntimeError):
+        store.search_similar_texts("query")
+
+
+def test_search_by_vector_rejects_wrong_dim(tmp_path):
+    make_store(tmp_path)
+    store = TextEmbedding.load_with_file_info(str(tmp_path), model_name=None)
+    with pytest.raises(ValueError):
+        store.search_by_vector(np.ones(8, dtype=np.float32))
+
+
+def test_string_column_round_trip(tmp_path):
+    texts = ["plain", "", "中文文本", "emoji ☀️ text", "last"]
+    vectors = np.eye(len(texts), dtype=np.float32)
+    write_columnar_store(str(tmp_path), texts, ["a.txt", None, "b.txt", "", "c.txt"], vectors)
+    store = TextEmbedding.load_with_file_info(str(tmp_path), model_name=None)
+
+    assert isinstance(store.texts, StringColumn)
+    assert list(store.texts) == texts
+    assert store.texts[-1] == "last" and store.texts[1:3] == ["", "中文文本"]
+    assert list(store.file_names) == ["a.txt", None, "b.txt", None, "c.txt"]
+    with pytest.raises(IndexError):
+        store.texts[len(texts)]
+
+
+def test_migrate_pickle_store_matches_legacy_load(tmp_path):
+    rng = np.random.default_rng(1)
+    texts = [f"片段 {i}" for i in range(50)]
+    vectors = rng.standard_normal((50, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    legacy_dir, migrated_dir = tmp_path / "legacy", tmp_path / "migrated"
+    legacy_dir.mkdir()
+    with open(legacy_dir / "embeddings.pkl", "wb") as f:
+        pickle.dump(dict(zip(texts, vectors)), f)
+    with open(legacy_dir / "file_info.pkl", "wb") as f:
+        pickle.dump({text: f"doc_{i % 3}.txt" for i, text in enumerate(texts) if i % 5}, f)
+
+    legacy = TextEmbedding.load_with_file_info(str(legacy_dir), model_name=None)
+    assert migrate_pickle_store(str(legacy_dir), str(migrated_dir)) == 50
+    assert is_columnar_store(str(migrated_dir))
+    migrated = TextEmbedding.load_with_file_info(str(migrated_dir), model_name=None)
+
+    assert list(migrated.texts) == list(legacy.texts) == texts
+    assert list(migrated.file_names) == list(legacy.file_names)
+    np.testing.assert_array_equal(np.asarray(migrated.embeddings), legacy.embeddings)
+    assert migrated.get_file_info(texts[1]) == "doc_1.txt" and migrated.get_file_info(texts[0]) is None
+
+    queries = rng.standard_normal((5, 16)).astype(np.float32)
+    assert (migrated.search_by_vectors(queries, top_n=5, min_similarity=-1.0, exact=True)
+            == legacy.search_by_vectors(queries, top_n=5, min_similarity=-1.0, exact=True))
+
+
+def test_migrate_empty_pickle_store(tmp_path):
+    with open(tmp_path / "embeddings.pkl", "wb") as f:
+        pickle.dump({}, f)
+    assert migrate_pickle_store(str(tmp_path)) == 0
+    assert len(TextEmbedding.load_with_file_info(str(tmp_path), model_name=None)) == 0
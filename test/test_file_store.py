@@ -0,0 +1,155 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+import file_store
+from file_store import (
+    store_content, content_url, resolve_file, file_etag, cache_control, etag_matches, parse_range, read_range,
+)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_store_content_is_content_addressed(workdir):
+    first = store_content(b"png-bytes")
+    second = store_content(b"png-bytes")
+    other = store_content(b"other-bytes")
+
+    assert first == second != other
+    assert first.startswith(file_store.CONTENT_DIR)
+    assert content_url(first) == "/api/files/" + first
+    assert sorted(os.listdir(file_store.CONTENT_DIR)) == sorted(os.path.basename(p) for p in (first, other))
+
+    stat = os.stat(first)
+    etag = file_etag(first, stat)
+    assert etag.strip('"') in first
+    assert cache_control(first) == file_store.IMMUTABLE_CACHE_CONTROL
+    assert etag_matches(f'W/{etag}, "other"', etag)
+
+    # 再次保存相同内容时记录访问，清理按访问时间判断
+    os.utime(first, ns=(1000 * 10**9, stat.st_mtime_ns))
+    store_content(b"png-bytes")
+    assert os.stat(first).st_atime > 1000
+    assert os.stat(first).st_mtime_ns == stat.st_mtime_ns
+    assert not etag_matches('"other"', etag)
+
+
+def test_timestamped_files_are_revalidated(workdir):
+    os.makedirs("simulation_results")
+    path = "simulation_results/jv_curve_20250101.png"
+    with open(path, "wb") as f:
+        f.write(b"x")
+    assert cache_control(path) == "no-cache"
+    assert file_etag(path, os.stat(path)).startswith('"')
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("simulation_results/a.png", "simulation_results/a.png"),
+    ("plot_results/./b.png", "plot_results/b.png"),
+    ("simulation_results/../main.py", None),
+    ("simulation_results/../../etc/passwd", None),
+    ("/etc/passwd", None),
+    ("other/a.png", None),
+])
+def test_resolve_file_rejects_paths_outside_output_dirs(path, expected):
+    assert resolve_file(path) == expected
+
+
+def test_parse_range(workdir):
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=990-2000", 1000) == (990, 999)
+    assert parse_range("bytes=0-1,5-9", 1000) is None  # 多段范围按完整文件响应
+    with pytest.raises(ValueError):
+        parse_range("bytes=1000-", 1000)
+    # 空文件：任何范围都无法满足
+    for header in ("bytes=-100", "bytes=0-", "bytes=0-0"):
+        with pytest.raises(ValueError):
+            parse_range(header, 0)
+
+    path = store_content(bytes(range(256)))
+    assert read_range(path, 10, 13) == bytes([10, 11, 12, 13])
+
+
+def test_input_key_is_stable_and_order_independent():
+    first = file_store.input_key("curve", {"x": [1, 2], "title": "a"})
+    assert first == file_store.input_key("curve", {"title": "a", "x": [1, 2]})
+    assert first != file_store.input_key("table", {"x": [1, 2], "title": "a"})
+    assert first != file_store.input_key("curve", {"x": [1, 3], "title": "a"})
+
+
+def test_output_cache_serves_repeats_from_disk(workdir):
+    cache = file_store.OutputCache(directories=("plot_results",), max_bytes=None, max_age=None)
+    path = cache.path("plot_results", "curve", file_store.input_key("curve", {"x": [1]}))
+
+    assert cache.get(path) is None
+    cache.put(path, b"png")
+    assert cache.get(path) == b"png"
+    assert cache.get_many([path, path + ".missing"]) is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["writes"]) == (1, 2, 1)
+    assert stats["files"] == 1 and stats["bytes"] == 3
+
+
+def test_touch_keeps_mtime_and_etag(workdir):
+    path = store_content(b"png-bytes")
+    os.utime(path, (1000, 2000))
+    before = os.stat(path)
+    file_store.touch(path)
+    after = os.stat(path)
+
+    assert after.st_mtime_ns == before.st_mtime_ns
+    assert after.st_atime > 2000
+    assert file_etag(path, after) == file_etag(path, before)
+
+
+def test_sweep_evicts_expired_then_least_recently_used(workdir):
+    cache = file_store.OutputCache(directories=("simulation_results", "plot_results"), max_bytes=25, max_age=100)
+    files = {
+        "simulation_results/old.png": 0,       # 超过保留时长
+        "simulation_results/a.png": 900,
+        "plot_results/b.png": 950,
+        "simulation_results/content/c.png": 990,
+    }
+    for path, accessed in files.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x" * 10)
+        os.utime(path, (accessed, accessed))
+    with open("plot_results/d.png.1.tmp", "wb") as f:
+        f.write(b"x" * 10)
+
+    result = cache.sweep(now=1000)
+
+    # old.png 过期；剩余30字节超过25字节上限，再删除最久未访问的 a.png
+    assert result == {"removed": 2, "removed_bytes": 20}
+    assert not os.path.exists("simulation_results/old.png")
+    assert not os.path.exists("simulation_results/a.png")
+    assert os.path.exists("plot_results/b.png") and os.path.exists("simulation_results/content/c.png")
+    assert os.path.exists("plot_results/d.png.1.tmp")
+    stats = cache.stats()
+    assert (stats["files"], stats["bytes"], stats["evictions"], stats["evicted_bytes"]) == (2, 20, 2, 20)
+    assert stats["last_sweep"] == 1000
+
+
+def test_sweeper_thread_runs_and_stops(workdir):
+    cache = file_store.OutputCache(directories=("plot_results",), max_bytes=1, max_age=None)
+    os.makedirs("plot_results")
+    with open("plot_results/a.png", "wb") as f:
+        f.write(b"xx")
+
+    thread = cache.start_sweeper(interval=60)
+    cache.stop()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert not os.path.exists("plot_results/a.png")
@@ -0,0 +1,193 @@
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+import mcp_pool
+from mcp_pool import MCPSessionPool, MCPUnavailable, ToolSchemaCache
+
+CALL_DELAY = 0.05
+
+
+class FakeServer:
+    """模拟MCP服务器：重启后旧会话上的调用都会失败"""
+
+    def __init__(self):
+        self.up = True
+        self.epoch = 0
+        self.connects = 0
+        self.list_calls = 0
+        self.hang = False  # 模拟半开连接：调用永远不返回
+
+    def restart(self):
+        self.epoch += 1
+
+    @property
+    def tools(self):
+        return [f"tool_{self.epoch}"]
+
+    @asynccontextmanager
+    async def connect(self, server_url, on_tools_changed=None):
+        if not self.up:
+            raise ConnectionError("connection refused")
+        self.connects += 1
+        yield FakeSession(self)
+
+
+class FakeSession:
+    def __init__(self, server):
+        self.server = server
+        self.epoch = server.epoch
+
+    def _check(self):
+        if self.epoch != self.server.epoch or not self.server.up:
+            raise ConnectionError("session closed")
+
+    async def call_tool(self, name, arguments):
+        self._check()
+        if self.server.hang:
+            await asyncio.Event().wait()
+        await asyncio.sleep(CALL_DELAY)
+        return {"tool": name, "arguments": arguments}
+
+    async def send_ping(self):
+        self._check()
+
+    async def list_tools(self):
+        self._check()
+        self.server.list_calls += 1
+        return SimpleNamespace(tools=self.server.tools)
+
+
+@pytest.fixture(autouse=True)
+def fast_reconnect(monkeypatch):
+    monkeypatch.setattr(mcp_pool, "MCP_RECONNECT_MIN_BACKOFF", 0.01)
+    monkeypatch.setattr(mcp_pool, "MCP_RECONNECT_MAX_BACKOFF", 0.05)
+
+
+def test_concurrent_calls_use_separate_sessions():
+    async def run():
+        server = FakeServer()
+        pool = MCPSessionPool("fake", size=4, connect=server.connect)
+        assert await pool.start()
+        start = time.perf_counter()
+        results = await asyncio.gather(*(pool.call_tool("simulate", {"i": i}) for i in range(4)))
+        elapsed = time.perf_counter() - start
+        await pool.close()
+        return results, elapsed
+
+    results, elapsed = asyncio.run(run())
+    assert [r["arguments"]["i"] for r in results] == [0, 1, 2, 3]
+    # 4个调用并行执行，总耗时接近单次调用
+    assert elapsed < CALL_DELAY * 3
+
+
+def test_call_survives_server_restart():
+    async def run():
+        server = FakeServer()
+        pool = MCPSessionPool("fake", size=2, connect=server.connect)
+        assert await pool.start()
+        generation = pool.generation
+        server.restart()
+        result = await pool.call_tool("simulate", {})
+        stats = pool.stats()
+        await pool.close()
+        return result, stats, generation
+
+    result, stats, generation = asyncio.run(run())
+    assert result["tool"] == "simulate"
+    assert stats["retries"] >= 1
+    assert stats["generation"] > generation
+
+
+def test_checkout_times_out_when_server_down():
+    async def run():
+        server = FakeServer()
+        server.up = False
+        pool = MCPSessionPool("fake", size=2, connect=server.connect, checkout_timeout=0.1)
+        assert not await pool.start(wait=1)
+        with pytest.raises(MCPUnavailable):
+            await pool.call_tool("simulate", {})
+        # 服务器恢复后后台重连，调用恢复正常
+        server.up = True
+        result = await pool.call_tool("simulate", {"ok": True})
+        await pool.close()
+        return result
+
+    assert asyncio.run(run())["arguments"] == {"ok": True}
+
+
+def test_hung_call_times_out_and_recycles_session():
+    async def run():
+        server = FakeServer()
+        pool = MCPSessionPool("fake", size=1, connect=server.connect, checkout_timeout=1, call_timeout=0.1)
+        assert await pool.start()
+        server.hang = True
+        with pytest.raises(MCPUnavailable, match="simulate"):
+            await pool.call_tool("simulate", {})
+        # 唯一的会话没有被一直占用：重建后可以继续调用
+        server.hang = False
+        result = await pool.call_tool("simulate", {"ok": True})
+        stats = pool.stats()
+        await pool.close()
+        return result, stats, server.connects
+
+    result, stats, connects = asyncio.run(run())
+    assert result["arguments"] == {"ok": True}
+    assert (stats["call_timeouts"], stats["retries"]) == (1, 0)
+    assert connects == 2
+
+
+def test_tool_schema_cache_refreshes_on_reconnect_and_ttl():
+    async def run():
+        server = FakeServer()
+        pool = MCPSessionPool("fake", size=1, connect=server.connect)
+        assert await pool.start()
+        cache = ToolSchemaCache(pool, ttl=60, convert=str.upper)
+
+        first = await asyncio.gather(*(cache.get() for _ in range(5)))
+        assert all(tools == ["TOOL_0"] for tools in first)
+        assert server.list_calls == 1
+
+        # 服务器重启：调用失败触发重连，generation变化使缓存失效
+        server.restart()
+        await pool.call_tool("simulate", {})
+        assert await cache.get() == ["TOOL_1"]
+        assert server.list_calls == 2
+
+        # 工具列表变化通知
+        pool.invalidate()
+        await cache.get()
+        assert server.list_calls == 3
+
+        cache.ttl = 0
+        await cache.get()
+        assert server.list_calls == 4
+        await pool.close()
+
+    asyncio.run(run())
+
+
+def test_tool_schema_cache_hides_internal_tools():
+    async def run():
+        server = FakeServer()
+        pool = MCPSessionPool("fake", size=1, connect=server.connect)
+        assert await pool.start()
+        tools = [SimpleNamespace(name=name) for name in ("simulate_solar_cell", "predict_rows", "get_prediction_cache_stats")]
+
+        async def list_tools():
+            return tools
+
+        pool.list_tools = list_tools
+        cache = ToolSchemaCache(pool, ttl=60, convert=lambda tool: tool.name)
+        names = await cache.get()
+        await pool.close()
+        return names
+
+    assert asyncio.run(run()) == ["simulate_solar_cell"]
@@ -0,0 +1,138 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+import model_registry
+from model_registry import ModelRegistry, TARGETS
+
+
+class StubLoader:
+    """代替load_predictors，记录加载次数，可选阻塞或失败"""
+
+    def __init__(self):
+        self.calls = 0
+        self.gate = None
+        self.fail = None
+
+    def __call__(self, base_path, mode):
+        self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.fail is not None:
+            raise self.fail
+        return {target: (target, self.calls) for target in TARGETS}
+
+
+@pytest.fixture
+def loader(monkeypatch):
+    stub = StubLoader()
+    monkeypatch.setattr(model_registry, "load_predictors", stub)
+    return stub
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    (tmp_path / "Eff").mkdir()
+    (tmp_path / "Eff" / "model.pkl").write_bytes(b"v1")
+    return tmp_path
+
+
+def test_get_loads_lazily_and_only_once(loader, model_dir):
+    registry = ModelRegistry(str(model_dir), mode="persist")
+    assert (registry.state, registry.ready, loader.calls) == ("not_loaded", False, 0)
+
+    predictors = registry.get()
+    assert registry.get() is predictors
+    assert loader.calls == 1
+    status = registry.status()
+    assert (status["state"], status["ready"], status["fast_inference"]) == ("ready", True, "persist")
+    assert status["version"] == model_registry.model_version(str(model_dir))
+    assert status["load_seconds"] is not None and status["error"] is None
+
+
+def test_concurrent_get_shares_a_single_load(loader, model_dir):
+    registry = ModelRegistry(str(model_dir))
+    loader.gate = threading.Event()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    deadline = time.time() + 5
+    while loader.calls == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert registry.state == "loading"
+
+    loader.gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert loader.calls == 1
+    assert len(results) == 8 and all(result is results[0] for result in results)
+
+
+def test_failed_load_is_reported_and_retried(loader, model_dir):
+    registry = ModelRegistry(str(model_dir))
+    loader.fail = FileNotFoundError("模型 Eff 不存在")
+
+    with pytest.raises(FileNotFoundError):
+        registry.get()
+    status = registry.status()
+    assert (status["state"], status["ready"], status["error"]) == ("error", False, "模型 Eff 不存在")
+
+    loader.fail = None
+    registry.get()
+    assert (registry.state, registry.error, loader.calls) == ("ready", None, 2)
+
+
+def test_reload_only_after_first_load(loader, model_dir):
+    registry = ModelRegistry(str(model_dir))
+    registry.reload()  # 尚未加载过：等待下次使用
+    assert (registry.ready, loader.calls) == (False, 0)
+
+    first = registry.get()
+    old_version = registry.version
+    (model_dir / "Eff" / "model.pkl").write_bytes(b"version 2")
+    registry.reload()
+
+    assert loader.calls == 2
+    assert registry.get() is not first and registry.get()["Eff"] == ("Eff", 2)
+    assert registry.version != old_version
+
+
+def test_failed_reload_keeps_previous_models(loader, model_dir):
+    registry = ModelRegistry(str(model_dir))
+    first = registry.get()
+    loader.fail = RuntimeError("损坏的模型文件")
+
+    with pytest.raises(RuntimeError):
+        registry.reload()
+    assert registry.state == "error"
+    assert registry.get() is first
+
+
+def test_warm_up_loads_in_background(loader, model_dir):
+    registry = ModelRegistry(str(model_dir))
+    loader.gate = threading.Event()
+
+    thread = registry.warm_up()
+    assert thread.daemon and thread.is_alive()  # 不阻塞调用方
+    loader.gate.set()
+    thread.join(5)
+    assert (registry.state, loader.calls) == ("ready", 1)
+
+
+def test_warm_up_failure_is_recorded(loader, tmp_path):
+    registry = ModelRegistry(str(tmp_path / "missing"))
+    loader.fail = FileNotFoundError("模型目录不存在")
+
+    registry.warm_up().join(5)
+    assert (registry.state, registry.ready, registry.error) == ("error", False, "模型目录不存在")
+
+
+def test_optimize_predictor_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        model_registry.optimize_predictor(object(), mode="fast")
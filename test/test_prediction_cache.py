@@ -0,0 +1,146 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+pytest.importorskip("pandas")
+pytest.importorskip("dotenv")
+
+import mlutil
+from mlutil import PredictionCache, DEFAULT_PARAMS, FEATURES
+
+
+def params(**overrides):
+    values = dict(DEFAULT_PARAMS)
+    values.update(overrides)
+    return values
+
+
+def test_key_rounds_to_significant_digits():
+    cache = PredictionCache(digits=6)
+
+    assert cache.key(params(Nd_top=1e20)) == cache.key(params(Nd_top=1.0000000001e20))
+    assert cache.key(params(Nd_top=1e20)) != cache.key(params(Nd_top=1.00001e20))
+    assert len(cache.key(params())) == len(FEATURES)
+
+
+def test_lru_eviction_keeps_recently_used_entries():
+    cache = PredictionCache(maxsize=2)
+    first, second, third = (cache.key(params(Si_thk=value)) for value in (100, 150, 200))
+    cache.put(first, {"Eff": 1.0})
+    cache.put(second, {"Eff": 2.0})
+    assert cache.get(first) == {"Eff": 1.0}  # first变为最近使用
+
+    cache.put(third, {"Eff": 3.0})
+
+    assert cache.get(second) is None
+    assert cache.get(first) == {"Eff": 1.0}
+    assert cache.get(third) == {"Eff": 3.0}
+    stats = cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"]) == (2, 3, 1)
+
+
+def test_get_returns_a_copy():
+    cache = PredictionCache()
+    key = cache.key(params())
+    cache.put(key, {"Eff": 1.0})
+    cache.get(key)["Eff"] = 99.0
+
+    assert cache.get(key) == {"Eff": 1.0}
+
+
+def test_invalidate_clears_entries_and_counts_version_changes():
+    cache = PredictionCache()
+    key = cache.key(params())
+    cache.invalidate("v1")
+    cache.put(key, {"Eff": 1.0})
+
+    cache.invalidate("v2")
+
+    assert cache.get(key) is None
+    stats = cache.stats()
+    assert stats["model_version"] == "v2"
+    assert stats["invalidations"] == 1  # 首次设置版本不计入
+
+
+def test_put_drops_results_computed_before_a_version_change():
+    cache = PredictionCache()
+    cache.invalidate("v1")
+    key = cache.key(params())
+    version = cache.version  # 开始预测前读取
+
+    cache.invalidate("v2")  # 预测期间模型更新
+    cache.put(key, {"Eff": 1.0}, version)
+    assert cache.get(key) is None
+
+    cache.put(key, {"Eff": 2.0}, cache.version)
+    assert cache.get(key) == {"Eff": 2.0}
+
+
+def test_version_check_request_runs_in_background_once(monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_check():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+
+    monkeypatch.setattr(mlutil, "check_model_version", slow_check)
+    monkeypatch.setattr(mlutil, "_last_version_check", 0.0)
+
+    begin = time.perf_counter()
+    mlutil.request_model_version_check()
+    assert started.wait(5)
+    mlutil.request_model_version_check()  # 检查仍在进行，不会再启动线程
+    assert time.perf_counter() - begin < 1
+
+    release.set()
+    deadline = time.time() + 5
+    while mlutil._version_check_running and time.time() < deadline:
+        time.sleep(0.01)
+    assert calls == [1]
+    assert not mlutil._version_check_running
+
+
+_child_model = {}
+
+
+def child_model_version(base_path):
+    """在worker进程中模拟已加载的模型：首次调用时读取版本，之后一直使用该版本"""
+    if base_path not in _child_model:
+        _child_model[base_path] = mlutil.model_version(base_path)
+    return _child_model[base_path]
+
+
+def test_model_change_replaces_process_pool_workers(tmp_path, monkeypatch):
+    (tmp_path / "Eff").mkdir()
+    model_file = tmp_path / "Eff" / "model.pkl"
+    model_file.write_bytes(b"v1")
+    monkeypatch.setattr(mlutil, "model_base_path", str(tmp_path))
+    monkeypatch.setattr(mlutil, "prediction_cache", PredictionCache())
+    monkeypatch.setattr(mlutil, "_last_version_check", 0.0)
+    monkeypatch.setattr(mlutil, "MODEL_VERSION_CHECK_INTERVAL", 0)
+    pool = mlutil.WorkerPool(kind="process", max_workers=1, queue_depth=4)
+
+    try:
+        mlutil.check_model_version()
+        first = asyncio.run(pool.run(child_model_version, str(tmp_path)))
+        assert first == mlutil.prediction_cache.version
+
+        model_file.write_bytes(b"version 2")
+        mlutil.check_model_version()
+        second = asyncio.run(pool.run(child_model_version, str(tmp_path)))
+
+        # 子进程已替换，使用新模型预测，结果与缓存中的版本一致
+        assert second != first
+        assert second == mlutil.prediction_cache.version
+        assert pool.stats()["recycled"] == 1
+    finally:
+        pool.shutdown()
@@ -0,0 +1,116 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+import query_cache
+from query_cache import QueryEmbeddingCache, normalize_query
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = Clock()
+    monkeypatch.setattr(query_cache.time, "time", fake.time)
+    return fake
+
+
+def vec(value):
+    return np.full(4, value, dtype=np.float32)
+
+
+def test_normalized_queries_share_an_entry():
+    cache = QueryEmbeddingCache(cache_dir=None)
+    cache.put("  Solar   Cell ", vec(1))
+
+    assert normalize_query("  Solar   Cell ") == "solar cell"
+    np.testing.assert_array_equal(cache.get("solar cell"), vec(1))
+    assert not cache.get("solar cell").flags.writeable
+    assert QueryEmbeddingCache(namespace="other", cache_dir=None).get("solar cell") is None
+
+
+def test_memory_lru_evicts_least_recently_used():
+    cache = QueryEmbeddingCache(maxsize=2, cache_dir=None)
+    cache.put("a", vec(1))
+    cache.put("b", vec(2))
+    cache.get("a")
+    cache.put("c", vec(3))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    stats = cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"]) == (2, 3, 1)
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = QueryEmbeddingCache(ttl=10, cache_dir=None)
+    cache.put("a", vec(1))
+
+    clock.now += 9
+    assert cache.get("a") is not None
+    clock.now += 2
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_disk_tier_survives_restart(tmp_path, clock):
+    first = QueryEmbeddingCache(namespace="bge", ttl=100, cache_dir=str(tmp_path))
+    first.put("query", vec(7))
+
+    second = QueryEmbeddingCache(namespace="bge", ttl=100, cache_dir=str(tmp_path))
+    np.testing.assert_array_equal(second.get("query"), vec(7))
+    assert second.get("query") is not None  # 第二次从内存命中
+    stats = second.stats()
+    assert (stats["disk_hits"], stats["hits"], stats["disk_size"]) == (1, 1, 1)
+
+    # 磁盘上过期的行读取时删除
+    clock.now += 101
+    third = QueryEmbeddingCache(namespace="bge", ttl=None, cache_dir=str(tmp_path))
+    assert third.get("query") is not None  # 不设TTL时仍可读取
+    expired = QueryEmbeddingCache(namespace="bge", ttl=100, cache_dir=str(tmp_path))
+    assert expired.stats()["disk_size"] == 0  # 启动时清理了过期行
+    assert expired.get("query") is None
+
+
+def test_disk_tier_is_bounded_oldest_first(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(query_cache, "QUERY_CACHE_PRUNE_EVERY", 1)
+    cache = QueryEmbeddingCache(maxsize=1, ttl=None, cache_dir=str(tmp_path), disk_maxsize=3)
+    for i in range(5):
+        clock.now += 1
+        cache.put(f"q{i}", vec(i))
+
+    stats = cache.stats()
+    assert (stats["disk_size"], stats["disk_evictions"]) == (3, 2)
+    reopened = QueryEmbeddingCache(maxsize=10, ttl=None, cache_dir=str(tmp_path), disk_maxsize=3)
+    assert reopened.get("q0") is None and reopened.get("q1") is None
+    assert all(reopened.get(f"q{i}") is not None for i in range(2, 5))
+
+
+def test_startup_trims_disk_tier_to_new_limit(tmp_path, clock):
+    cache = QueryEmbeddingCache(ttl=None, cache_dir=str(tmp_path), disk_maxsize=None)
+    for i in range(5):
+        clock.now += 1
+        cache.put(f"q{i}", vec(i))
+
+    smaller = QueryEmbeddingCache(ttl=None, cache_dir=str(tmp_path), disk_maxsize=2)
+    assert smaller.stats()["disk_size"] == 2
+    assert smaller.get("q4") is not None and smaller.get("q0") is None
+
+
+def test_clear_removes_memory_and_disk(tmp_path):
+    cache = QueryEmbeddingCache(cache_dir=str(tmp_path))
+    cache.put("a", vec(1))
+    cache.clear()
+
+    assert cache.get("a") is None
+    assert cache.stats()["disk_size"] == 0
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+pytest.importorskip("pandas")
+pytest.importorskip("dotenv")
+
+import mlutil
+
+PREDICTIONS = {"Vm": 0.6, "Im": 38.0, "Voc": 0.7, "Jsc": 40.0, "FF": 82.0, "Eff": 23.0}
+
+
+@pytest.mark.parametrize("render", [
+    lambda: mlutil.predict_solar_params(dict(mlutil.DEFAULT_PARAMS)),
+    lambda: mlutil.render_jv_png(PREDICTIONS),
+])
+def test_jv_plotting_holds_the_pyplot_lock(monkeypatch, render):
+    held = []
+
+    def fake_plot(predictions, annotate=False):
+        held.append(mlutil._pyplot_lock.locked())
+        return None
+
+    monkeypatch.setattr(mlutil, "predict_cached", lambda params: dict(PREDICTIONS))
+    monkeypatch.setattr(mlutil, "plot_jv_curve", fake_plot)
+    monkeypatch.setattr(mlutil, "fig_to_png", lambda fig, **kwargs: b"png")
+
+    render()
+    assert held == [True]
+    assert not mlutil._pyplot_lock.locked()
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api")
+
+# 启动时不应导入的重量级依赖：只在加载模型、编码查询或绘图时导入
+HEAVY_MODULES = ["autogluon", "torch", "FlagEmbedding", "transformers", "matplotlib.pyplot"]
+# 导入服务模块的耗时上限（毫秒），可通过环境变量按机器调整
+IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "3000"))
+
+
+def import_profile(module, cwd):
+    """
+    用 python -X importtime 导入模块，返回 {模块名: 累计耗时(微秒)}
+    """
+    env = dict(os.environ, PYTHONPATH=API_DIR, MODEL_WARMUP="false")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        if "ModuleNotFoundError" in proc.stderr:
+            pytest.skip(f"缺少依赖，无法导入 {module}: {proc.stderr.strip().splitlines()[-1]}")
+        raise AssertionError(proc.stderr)
+
+    timings = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            timings[name.strip()] = int(cumulative)
+    return timings
+
+
+@pytest.mark.parametrize("module", ["mlutil", "embed", "mcpserver", "main"])
+def test_startup_imports_stay_light(module, tmp_path):
+    timings = import_profile(module, tmp_path)
+
+    loaded_heavy = [name for name in HEAVY_MODULES if name in timings]
+    assert not loaded_heavy, f"导入 {module} 时加载了重量级依赖: {loaded_heavy}"
+
+    elapsed_ms = timings[module] / 1000
+    assert elapsed_ms <= IMPORT_BUDGET_MS, f"导入 {module} 耗时 {elapsed_ms:.0f} ms，超出预算 {IMPORT_BUDGET_MS:.0f} ms"
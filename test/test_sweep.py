@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+pytest.importorskip("pandas")
+pytest.importorskip("dotenv")
+
+import mlutil
+
+
+def test_grid_points_checks_size_before_allocating():
+    points = mlutil.grid_points({"Si_thk": [100, 50, 200], "t_SiO2": [1.0, 0.5, 2.0]})
+    assert len(points["Si_thk"]) == len(points["t_SiO2"]) == 9
+
+    # 10^12 个点，必须在分配数组之前拒绝
+    with pytest.raises(ValueError, match="more than the limit"):
+        mlutil.grid_points({"Si_thk": [0, 1e-12, 1], "t_SiO2": [1.0, 0.5, 2.0]})
+    with pytest.raises(ValueError):
+        mlutil.grid_points({"Si_thk": [0, float("nan"), 1], "t_SiO2": [1.0, 0.5, 2.0]})
+
+
+def test_check_sweep_params_limits_dimensions():
+    mlutil.check_sweep_params(["Si_thk", "Dit_Si_SiOx"])
+    with pytest.raises(ValueError, match="2 to"):
+        mlutil.check_sweep_params(["Si_thk"])
+    with pytest.raises(ValueError, match="2 to"):
+        mlutil.check_sweep_params(["Si_thk", "t_SiO2", "front_junc", "rear_junc", "Nd_top"])
+
+
+def test_grid_points_single_parameter_range():
+    # 批量仿真扫描单个参数时同样使用grid_points检查范围
+    points = mlutil.grid_points({"Dit Si-SiOx": [1e9, 1e9, 5e9]})
+    assert list(points) == ["Dit Si-SiOx"] and len(points["Dit Si-SiOx"]) == 5
+
+    for bad_range in ([1, 0, 2], [1, -1, 0], [1, float("inf"), 2], [0, 1e-9, 1]):
+        with pytest.raises(ValueError):
+            mlutil.grid_points({"Si_thk": bad_range})
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+
+from workers import MicroBatcher, WorkerPool, PoolSaturated, server_timing
+
+
+def test_pool_rejects_when_saturated():
+    pool = WorkerPool(kind="thread", max_workers=1, queue_depth=1)
+    release = threading.Event()
+
+    async def run():
+        # 一个运行中、一个排队中，第三个应被拒绝
+        running = [asyncio.ensure_future(pool.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert pool.saturated()
+        with pytest.raises(PoolSaturated):
+            await pool.run(release.wait)
+        release.set()
+        await asyncio.gather(*running)
+
+    asyncio.run(run())
+    stats = pool.stats()
+    assert stats["completed"] == 2
+    assert stats["rejected"] == 1
+    assert stats["in_flight"] == 0
+    pool.shutdown()
+
+
+def test_run_timed_reports_queue_and_run_time():
+    pool = WorkerPool(kind="thread", max_workers=1, queue_depth=4)
+
+    async def run():
+        return await asyncio.gather(*(pool.run_timed(sum, [i, 1]) for i in range(3)))
+
+    results = asyncio.run(run())
+    assert [result for result, _ in results] == [1, 2, 3]
+    for _, timing in results:
+        assert set(timing) == {"queue_ms", "run_ms"}
+        assert timing["queue_ms"] >= 0 and timing["run_ms"] >= 0
+    assert server_timing({"queue_ms": 1.5, "run_ms": 3.0}) == "queue;dur=1.5, run;dur=3.0"
+    pool.shutdown()
+
+
+def slow_batch(items):
+    """模拟每次predict调用的固定开销（特征处理、模型调度），与行数基本无关"""
+    time.sleep(0.005)
+    return [item * 2 for item in items]
+
+
+def test_micro_batcher_coalesces_and_dedupes():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(batch_fn, window_ms=5, max_rows=64)
+
+    async def run():
+        # 100个并发请求，其中键相同的请求只计算一次
+        return await asyncio.gather(*(batcher.submit(i % 50, i % 50) for i in range(100)))
+
+    results = asyncio.run(run())
+    assert results == [(i % 50) * 2 for i in range(100)]
+    assert sum(len(items) for items in calls) == 50
+    assert len(calls) == 1
+    assert batcher.stats()["requests"] == 100
+
+
+def test_micro_batcher_flushes_at_max_rows_and_propagates_errors():
+    def failing(items):
+        raise ValueError("boom")
+
+    batcher = MicroBatcher(failing, window_ms=1000, max_rows=4)
+
+    async def run():
+        # 达到max_rows时立即提交，不等待窗口到期
+        return await asyncio.wait_for(
+            asyncio.gather(*(batcher.submit(i, i) for i in range(4)), return_exceptions=True), timeout=0.5
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_micro_batcher_throughput():
+    n_requests = 200
+    pool = WorkerPool(kind="thread", max_workers=1, queue_depth=n_requests)
+    calls = []
+
+    def recording_batch(items):
+        calls.append(len(items))
+        return slow_batch(items)
+
+    async def batched():
+        batcher = MicroBatcher(recording_batch, pool=pool, window_ms=5, max_rows=256)
+        return await asyncio.gather(*(batcher.submit(i, i) for i in range(n_requests)))
+
+    results = asyncio.run(batched())
+    pool.shutdown()
+
+    assert results == [i * 2 for i in range(n_requests)]
+    # 每次调用开销固定时吞吐量取决于调用次数：所有行都被处理且只处理一次，调用次数减少一个数量级
+    assert sum(calls) == n_requests
+    assert len(calls) <= n_requests // 10
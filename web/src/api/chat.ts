@@ -1,4 +1,4 @@
-import { Message, ChatResponse, Conversation, Model, StreamChunk, ImageContent } from '../types/chat';
+import { Message, ChatResponse, Conversation, ConversationPage, MessagePage, Model, StreamChunk, ImageContent } from '../types/chat';
 import logger from '../utils/logger';
 
 // 动态获取API基础URL，解决跨域问题
@@ -31,7 +31,7 @@ export async function sendMessage(
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ messages, conversation_id: conversationId, model }),
+      body: JSON.stringify({ messages, conversation_id: conversationId, model, image_mode: 'url' }),
       signal
     });
 
@@ -98,7 +98,8 @@ export async function sendMessage(
                   tool_name: imageContent.tool_name,
                   image_index: imageContent.image_index,
                   format: imageContent.format,
-                  size: imageContent.image_data.length
+                  url: imageContent.image_url,
+                  size: imageContent.image_data?.length
                 });
               }
               
@@ -155,27 +156,65 @@ export async function createConversation(): Promise<Conversation> {
 }
 
 /**
- * 获取历史对话
+ * 分页获取会话摘要（按创建时间倒序），用返回的next_cursor获取下一页
  */
-export async function getHistory(): Promise<Conversation[]> {
-  logger.info('获取历史对话');
+export async function getConversations(cursor?: string | null, limit: number = 50): Promise<ConversationPage> {
+  logger.info('获取会话列表', { cursor, limit });
   
   try {
-    const response = await fetch(`${API_BASE_URL}/api/chat/history`);
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (cursor) {
+      params.set('cursor', cursor);
+    }
+    const response = await fetch(`${API_BASE_URL}/api/chat/conversations?${params}`);
+
+    if (!response.ok) {
+      logger.error('获取会话列表失败', { 
+        status: response.status, 
+        statusText: response.statusText 
+      });
+      throw new Error('获取会话列表失败');
+    }
+
+    const data = await response.json();
+    logger.info('会话列表获取成功', { conversationCount: data.conversations.length, hasMore: !!data.next_cursor });
+    return data;
+  } catch (error) {
+    logger.error('获取会话列表时发生错误', { error, stack: error.stack });
+    throw error;
+  }
+}
+
+/**
+ * 分页获取会话消息：序号小于before的最后limit条，用返回的next_before获取更早的一页
+ */
+export async function getMessages(
+  conversationId: string,
+  before?: number | null,
+  limit: number = 100
+): Promise<MessagePage> {
+  logger.info('获取会话消息', { conversationId, before, limit });
+  
+  try {
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (before !== undefined && before !== null) {
+      params.set('before', String(before));
+    }
+    const response = await fetch(`${API_BASE_URL}/api/chat/${encodeURIComponent(conversationId)}/messages?${params}`);
 
     if (!response.ok) {
-      logger.error('获取历史记录失败', { 
+      logger.error('获取会话消息失败', { 
         status: response.status, 
         statusText: response.statusText 
       });
-      throw new Error('获取历史记录失败');
+      throw new Error('获取会话消息失败');
     }
 
     const data = await response.json();
-    logger.info('历史对话获取成功', { conversationCount: data.length });
+    logger.info('会话消息获取成功', { conversationId, messageCount: data.messages.length });
     return data;
   } catch (error) {
-    logger.error('获取历史对话时发生错误', { error, stack: error.stack });
+    logger.error('获取会话消息时发生错误', { error, stack: error.stack });
     throw error;
   }
 }
@@ -4,7 +4,7 @@ import { SendOutlined, PlusOutlined, BulbOutlined, BulbFilled, MenuFoldOutlined,
 import { useTabContext } from '../contexts/TabContext';
 import styled from '@emotion/styled';
 import { Message, Conversation, Model, StreamChunk, ContextInfo, ImageContent } from '../types/chat';
-import { sendMessage, createConversation, getHistory, getModels } from '../api/chat';
+import { sendMessage, createConversation, getConversations, getMessages, getModels } from '../api/chat';
 import InfoCards from './Chat/InfoCards';
 import Glossary from './Chat/Glossary';
 import Resources from './Chat/Resources';
@@ -256,6 +256,8 @@ const Chat: React.FC<ChatProps> = ({ isDarkMode, toggleTheme }) => {
   const { switchToTab } = useTabContext();
   const [inputMessage, setInputMessage] = useState('');
   const [conversations, setConversations] = useState<Conversation[]>([]);
+  // 会话列表下一页的游标，为null时已加载全部会话
+  const [conversationCursor, setConversationCursor] = useState<string | null>(null);
   const [currentConversation, setCurrentConversation] = useState<Conversation | null>(null);
   const [isLoading, setIsLoading] = useState(false);
   const [models, setModels] = useState<Model[]>([]);
@@ -289,18 +291,60 @@ const Chat: React.FC<ChatProps> = ({ isDarkMode, toggleTheme }) => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   };
 
-  const loadHistory = async () => {
+  // 侧边栏分页获取会话摘要，消息在选中会话时才获取
+  const loadHistory = async (cursor?: string | null) => {
     try {
-      const history = await getHistory();
-      setConversations(history);
-      if (history.length > 0 && !currentConversation) {
-        setCurrentConversation(history[0]);
+      const page = await getConversations(cursor);
+      const items: Conversation[] = page.conversations.map(summary => ({ ...summary, messages: [] }));
+      setConversations(prev => cursor ? [...prev, ...items] : items);
+      setConversationCursor(page.next_cursor);
+      if (!cursor && items.length > 0 && !currentConversation) {
+        await selectConversation(items[0]);
       }
     } catch (error) {
       message.error('加载历史记录失败');
     }
   };
 
+  const updateConversation = (conversation: Conversation) => {
+    setCurrentConversation(conversation);
+    setConversations(prev => prev.map(conv => conv.id === conversation.id ? conversation : conv));
+  };
+
+  // 选中会话：首次选中时获取最近一页消息，更早的消息按需向前翻页
+  const selectConversation = async (conversation: Conversation) => {
+    if (conversation.messagesLoaded) {
+      setCurrentConversation(conversation);
+      return;
+    }
+    setCurrentConversation(conversation);
+    try {
+      const page = await getMessages(conversation.id);
+      updateConversation({
+        ...conversation,
+        messages: page.messages,
+        messagesLoaded: true,
+        nextBefore: page.next_before
+      });
+    } catch (error) {
+      message.error('加载会话消息失败');
+    }
+  };
+
+  const loadEarlierMessages = async () => {
+    if (!currentConversation || currentConversation.nextBefore == null) return;
+    try {
+      const page = await getMessages(currentConversation.id, currentConversation.nextBefore);
+      updateConversation({
+        ...currentConversation,
+        messages: [...page.messages, ...currentConversation.messages],
+        nextBefore: page.next_before
+      });
+    } catch (error) {
+      message.error('加载更早的消息失败');
+    }
+  };
+
   const loadModels = async () => {
     try {
       const modelList = await getModels();
@@ -313,7 +357,7 @@ const Chat: React.FC<ChatProps> = ({ isDarkMode, toggleTheme }) => {
   const handleNewConversation = async () => {
     try {
       setIsLoading(true);
-      const newConversation = await createConversation();
+      const newConversation: Conversation = { ...await createConversation(), messagesLoaded: true, nextBefore: null };
       setConversations(prev => [newConversation, ...prev]);
       setCurrentConversation(newConversation);
       
@@ -518,7 +562,10 @@ const Chat: React.FC<ChatProps> = ({ isDarkMode, toggleTheme }) => {
             }
           } else if (chunk.type === 'image') {
             const imageContent = chunk.content as ImageContent;
-            const imgData = imageContent.image_data;
+            // url模式下浏览器单独获取并缓存图像，不占用消息流
+            const imgData = imageContent.image_url
+              ? `${API_BASE_URL}${imageContent.image_url}`
+              : imageContent.image_data || '';
             
             setImages(prev => {
               const messageImages = [...(prev[tempMsgId] || [])];
@@ -669,6 +716,11 @@ const Chat: React.FC<ChatProps> = ({ isDarkMode, toggleTheme }) => {
 
     return (
       <>
+        {currentConversation.nextBefore != null && (
+          <div style={{ textAlign: 'center', marginBottom: 16 }}>
+            <Button type="link" onClick={loadEarlierMessages}>加载更早的消息</Button>
+          </div>
+        )}
         {currentConversation.messages.map((msg, index) => {
           const messageId = `${currentConversation.id}-${index}`;
           // 优先使用消息中存储的图片，否则使用状态中的图片
@@ -772,7 +824,7 @@ const Chat: React.FC<ChatProps> = ({ isDarkMode, toggleTheme }) => {
             <div
               key={item.id}
               className="conversation-item"
-              onClick={() => setCurrentConversation(item)}
+              onClick={() => selectConversation(item)}
               style={{
                 padding: collapsed ? '12px 8px' : '12px 16px',
                 background: currentConversation?.id === item.id 
@@ -793,6 +845,11 @@ const Chat: React.FC<ChatProps> = ({ isDarkMode, toggleTheme }) => {
               </Text>
             </div>
           ))}
+          {conversationCursor && !collapsed && (
+            <Button type="link" block onClick={() => loadHistory(conversationCursor)}>
+              加载更多
+            </Button>
+          )}
         </ConversationList>
       </StyledSider>
       
@@ -4,6 +4,7 @@ export interface Message {
   reasoning_content?: string;
   context_info?: ContextInfo[];
   images?: string[];  // 用于存储图片的URL或base64数据
+  seq?: number;       // 消息在会话中的序号（分页获取时由服务端返回）
 }
 
 export interface ContextInfo {
@@ -23,6 +24,27 @@ export interface Conversation {
   title: string;
   created_at: string;
   messages: Message[];
+  message_count?: number;
+  messagesLoaded?: boolean;     // 是否已获取最近一页消息（侧边栏列表只含摘要）
+  nextBefore?: number | null;   // 更早一页消息的before参数，为null时已到开头
+}
+
+export interface ConversationSummary {
+  id: string;
+  title: string;
+  created_at: string;
+  message_count: number;
+}
+
+export interface ConversationPage {
+  conversations: ConversationSummary[];
+  next_cursor: string | null;
+}
+
+export interface MessagePage {
+  conversation_id: string;
+  messages: Message[];
+  next_before: number | null;
 }
 
 export interface Model {
@@ -38,7 +60,8 @@ export interface StreamChunk {
 
 export interface ImageContent {
   tool_name: string;
-  image_data: string;  // base64编码的图像数据
+  image_data?: string;  // base64编码的图像数据（inline模式）
+  image_url?: string;   // 内容寻址的图像URL（url模式），如 /api/files/simulation_results/content/<hash>.png
   image_index: number;
   format: string;
 } 
\ No newline at end of file